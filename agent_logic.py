@@ -1,26 +1,52 @@
 # agent_logic.py
+import contextvars
 import json
-import requests
+import os
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Type, Dict, Any, List
-from langchain_community.llms import Ollama
+from typing import Type, Dict, Any, Iterator, List, Optional
 from langchain.agents import AgentExecutor, create_openai_tools_agent 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain.tools import BaseTool, tool
 from langchain_core.pydantic_v1 import BaseModel, Field 
-from langchain.memory import ConversationBufferWindowMemory
-from langchain_community.chat_message_histories import ZepChatMessageHistory 
 import milvus_utils 
-from langchain_openai import AzureChatOpenAI
+import memory_writer
+import embeddings
+import tool_transport
+import startup
+import fast_path
+import response_cache
+import tracing
+from availability_watch import AvailabilityWatch
+from agent_sessions import AgentSession, SessionRegistry, DEFAULT_SESSION_ID
 
 
 # --- Configuration ---
 LLM_MODEL = "llama3.2" # Ensure this model is pulled in Ollama
 FASTAPI_BASE_URL = "http://localhost:8000"
-USER_ID_FOR_MEMORY = "test_user_123"
-from langchain_community.chat_models import ChatOllama
-# --- Initialize LLM ---
-llm = ChatOllama(model=LLM_MODEL, temperature=0.1)
+# "http" (pooled keep-alive session) or "inprocess" (call the API handlers directly, same process only)
+TOOL_TRANSPORT = os.getenv("PARKING_TOOL_TRANSPORT", "http")
+USER_ID_FOR_MEMORY = "test_user_123" # Default user when the caller doesn't pass one
+# The search tool puts only the cheapest N spots (plus a count and price range) into the prompt
+SEARCH_TOOL_TOP_N = int(os.getenv("SEARCH_TOOL_TOP_N", "5"))
+# Follow the API's availability events to drop stale cached results and warn about taken spots
+LIVE_AVAILABILITY = os.getenv("LIVE_AVAILABILITY", "true").lower() == "true"
+# --- LLM (created on first use) ---
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                with startup.startup_profile.timed("create LLM client"):
+                    from langchain_community.chat_models import ChatOllama
+                    _llm = ChatOllama(model=LLM_MODEL, temperature=0.1)
+    return _llm
 
 
 # --- Define Pydantic Schemas for Tool Inputs ---
@@ -28,8 +54,23 @@ class ParkingSearchInput(BaseModel):
     vehicle_type: str = Field(description="Type of vehicle, e.g., 'car', 'two-wheeler', 'suv'.")
     location: str = Field(description="Desired parking location, e.g., 'downtown', 'airport', 'mall'.")
     slot_type: str = Field(description="Preferred type of parking slot, e.g., 'covered', 'open', 'compact'. Optional.", default=None)
-    # date: str = Field(description="Date for parking, e.g., 'today', 'tomorrow', '2024-07-28'. Optional.", default=None)
-    # duration: str = Field(description="Parking duration, e.g., '2 hours', 'full day'. Optional.", default=None)
+    start_datetime_str: str = Field(description="Start of the parking window in 'YYYY-MM-DD HH:MM' format. Optional, but required if end is given.", default=None)
+    end_datetime_str: str = Field(description="End of the parking window in 'YYYY-MM-DD HH:MM' format. Optional, but required if start is given.", default=None)
+
+class ParkingNearbyInput(BaseModel):
+    vehicle_type: str = Field(description="Type of vehicle, e.g., 'car', 'two-wheeler', 'suv'.")
+    near_location: str = Field(description="Place to search around, e.g., 'stadium', 'downtown'. Optional if latitude and longitude are given.", default=None)
+    latitude: float = Field(description="Latitude of the place to search around, if the user gave coordinates. Optional.", default=None)
+    longitude: float = Field(description="Longitude of the place to search around, if the user gave coordinates. Optional.", default=None)
+    radius_m: float = Field(description="Maximum distance in meters, e.g. 500 for 'within 500 m'. Optional.", default=None)
+    slot_type: str = Field(description="Preferred type of parking slot, e.g., 'covered', 'open', 'compact'. Optional.", default=None)
+    start_datetime_str: str = Field(description="Start of the parking window in 'YYYY-MM-DD HH:MM' format. Optional, but required if end is given.", default=None)
+    end_datetime_str: str = Field(description="End of the parking window in 'YYYY-MM-DD HH:MM' format. Optional, but required if start is given.", default=None)
+
+class ParkingQuoteInput(BaseModel):
+    spot_ids: List[int] = Field(description="IDs of the parking spots to price, obtained from search results.")
+    start_datetime_str: str = Field(description="Start of the parking window in 'YYYY-MM-DD HH:MM' format.")
+    end_datetime_str: str = Field(description="End of the parking window in 'YYYY-MM-DD HH:MM' format.")
 
 class ParkingBookingInput(BaseModel):
     spot_id: int = Field(description="The ID of the parking spot to book, obtained from search results.")
@@ -41,28 +82,163 @@ class ParkingBookingInput(BaseModel):
 
 
 # --- Define Tools for the Agent ---
+def get_transport():
+    transport = tool_transport.get_transport(TOOL_TRANSPORT, FASTAPI_BASE_URL)
+    if LIVE_AVAILABILITY and transport is not _watched_transport:
+        _watch_availability(transport)
+    return transport
+
+# --- Live availability ---
+availability_watch = AvailabilityWatch()
+_watched_transport = None
+_watch_lock = threading.Lock()
+
+def _watch_availability(transport) -> None:
+    global _watched_transport
+    with _watch_lock:
+        if transport is not _watched_transport:
+            transport.subscribe_availability(availability_watch.handle)
+            _watched_transport = transport
+
+def _on_availability_event(event: dict) -> None:
+    # Bookings by other users and sessions make cached results that listed the spot stale
+    if event["type"] == "booked":
+        response_cache.invalidate_spot(event["spot_id"])
+    else:
+        response_cache.clear()
+
+availability_watch.on_event(_on_availability_event)
+
+# The fast path's vocabulary comes from the API, like every other tool call
+fast_path.set_vocabulary_loader(lambda: get_transport().get("/vocabulary"))
+
 @tool("search_parking_spots", args_schema=ParkingSearchInput, return_direct=False)
-def search_parking_spots_tool(vehicle_type: str, location: str, slot_type: str = None) -> str:
+def search_parking_spots_tool(vehicle_type: str, location: str, slot_type: str = None,
+                              start_datetime_str: str = None, end_datetime_str: str = None) -> str:
     """
     Searches for available parking spots based on vehicle type, location, and optionally slot type.
-    Returns a list of available spots or a message if none are found.
+    If a start and end time are given, only spots free for that whole window are returned, with the
+    `total_price` for that window. Returns the cheapest available spots (with how many match in total) or a message if none are found.
     """
     payload = {
         "vehicle_type": vehicle_type,
         "location": location,
         "slot_type": slot_type,
+        "sort_by": "price",
+        "limit": SEARCH_TOOL_TOP_N,
+        "include_total": True,
+    }
+    if start_datetime_str and end_datetime_str:
+        try:
+            payload["start_time"] = datetime.strptime(start_datetime_str, '%Y-%m-%d %H:%M').isoformat()
+            payload["end_time"] = datetime.strptime(end_datetime_str, '%Y-%m-%d %H:%M').isoformat()
+        except ValueError:
+            return "Invalid datetime format. Please use 'YYYY-MM-DD HH:MM'. For example, '2024-07-28 14:00'."
+        payload["sort_by"] = "total_price"  # rates can vary by time of day, so rank by what the stay costs
+    # Repeated searches within TOOL_CACHE_TTL are answered from the tool-result cache
+    cache_key = response_cache.ToolResultCache.key(vehicle_type, location, slot_type,
+                                                   payload.get("start_time"), payload.get("end_time"))
+    started = time.perf_counter()
+    page = response_cache.tool_result_cache.get(cache_key)
+    if page is not None:
+        response_cache.tool_result_cache.record(True, time.perf_counter() - started)
+    else:
+        try:
+            page = get_transport().post("/get-parking-spots/page", payload)
+        except tool_transport.ResponseParseError:
+            return "API Error: Could not parse response from parking service."
+        except tool_transport.TransportError as e:
+            return f"API Error during search: {str(e)}. The parking service might be down."
+        response_cache.tool_result_cache.put(cache_key, page, response_cache.spot_ids_in(page["spots"]))
+        response_cache.tool_result_cache.record(False, time.perf_counter() - started)
+    return format_search_page(page)
+
+def format_search_page(page: dict) -> str:
+    """Tool output for a page of search results; a note follows the JSON when more spots match."""
+    spots = page["spots"]
+    if not spots:
+        return "No parking spots found matching your criteria. Try different options?"
+    text = f"Found parking spots: {json.dumps(spots)}"
+    total = page.get("total") or len(spots)
+    if total > len(spots):
+        text += (f"\n(These are the {len(spots)} cheapest of {total} matching spots, "
+                 f"{page['min_price_per_hour']}-{page['max_price_per_hour']} per hour. "
+                 f"The user can narrow the search by slot type or time to see others.)")
+    return text
+
+@tool("find_nearby_parking", args_schema=ParkingNearbyInput, return_direct=False)
+def find_nearby_parking_tool(vehicle_type: str, near_location: str = None, latitude: float = None,
+                             longitude: float = None, radius_m: float = None, slot_type: str = None,
+                             start_datetime_str: str = None, end_datetime_str: str = None) -> str:
+    """
+    Finds the available parking spots closest to a place (a named location or coordinates),
+    optionally within a radius in meters. Results are ordered by distance and price and include `distance_m`.
+    """
+    payload = {
+        "vehicle_type": vehicle_type,
+        "near_location": near_location,
+        "latitude": latitude,
+        "longitude": longitude,
+        "radius_m": radius_m,
+        "slot_type": slot_type,
+    }
+    if start_datetime_str and end_datetime_str:
+        try:
+            payload["start_time"] = datetime.strptime(start_datetime_str, '%Y-%m-%d %H:%M').isoformat()
+            payload["end_time"] = datetime.strptime(end_datetime_str, '%Y-%m-%d %H:%M').isoformat()
+        except ValueError:
+            return "Invalid datetime format. Please use 'YYYY-MM-DD HH:MM'. For example, '2024-07-28 14:00'."
+    # Shares the tool-result cache (and its invalidation on booking) with search_parking_spots
+    cache_key = ("nearby", response_cache.ToolResultCache.key(vehicle_type, near_location, slot_type,
+                                                              payload.get("start_time"), payload.get("end_time")),
+                 latitude, longitude, radius_m)
+    started = time.perf_counter()
+    spots = response_cache.tool_result_cache.get(cache_key)
+    if spots is not None:
+        response_cache.tool_result_cache.record(True, time.perf_counter() - started)
+    else:
+        try:
+            spots = get_transport().post("/get-parking-spots/nearby", payload)
+        except tool_transport.ResponseParseError:
+            return "API Error: Could not parse response from parking service."
+        except tool_transport.TransportError as e:
+            if e.status_code in (400, 404):
+                return f"Search Error: {e.detail}"
+            return f"API Error during search: {str(e)}. The parking service might be down."
+        response_cache.tool_result_cache.put(cache_key, spots)
+        response_cache.tool_result_cache.record(False, time.perf_counter() - started)
+    if not spots:
+        return "No parking spots found matching your criteria. Try a larger radius or different options?"
+    return f"Found parking spots: {json.dumps(spots)}"
+
+@tool("get_price_quotes", args_schema=ParkingQuoteInput, return_direct=False)
+def get_price_quotes_tool(spot_ids: List[int], start_datetime_str: str, end_datetime_str: str) -> str:
+    """
+    Gets the total price of parking at each of the given spot IDs from start to end time, cheapest first.
+    Use it to compare or confirm costs before booking. Spots that are taken for that time are left out.
+    """
+    try:
+        start_time = datetime.strptime(start_datetime_str, '%Y-%m-%d %H:%M')
+        end_time = datetime.strptime(end_datetime_str, '%Y-%m-%d %H:%M')
+    except ValueError:
+        return "Invalid datetime format. Please use 'YYYY-MM-DD HH:MM'. For example, '2024-07-28 14:00'."
+    payload = {
+        "spot_ids": spot_ids,
+        "windows": [{"start_time": start_time.isoformat(), "end_time": end_time.isoformat()}],
     }
     try:
-        response = requests.post(f"{FASTAPI_BASE_URL}/get-parking-spots", json=payload)
-        response.raise_for_status() # Raise an exception for HTTP errors
-        spots = response.json()
-        if not spots:
-            return "No parking spots found matching your criteria. Try different options?"
-        return f"Found parking spots: {json.dumps(spots)}"
-    except requests.exceptions.RequestException as e:
-        return f"API Error during search: {str(e)}. The parking service might be down."
-    except json.JSONDecodeError:
+        quotes = get_transport().post("/quote", payload)["quotes"]
+    except tool_transport.ResponseParseError:
         return "API Error: Could not parse response from parking service."
+    except tool_transport.TransportError as e:
+        if e.status_code in (400, 422):
+            return f"Quote Error: {e.detail}"
+        return f"API Error during quote: {str(e)}. The parking service might be down."
+    if not quotes:
+        return "None of these spots are free for that time. Try a new search?"
+    return "Price quotes: " + json.dumps([
+        {"spot_id": q["spot_id"], "location": q["location"], "spot_type": q["spot_type"],
+         "price_per_hour": q["price_per_hour"], "total_price": q["lowest_total"]} for q in quotes])
 
 @tool("book_parking_spot", args_schema=ParkingBookingInput, return_direct=False)
 def book_parking_spot_tool(spot_id: int, vehicle_type: str, start_datetime_str: str, end_datetime_str: str) -> str:
@@ -78,11 +254,7 @@ def book_parking_spot_tool(spot_id: int, vehicle_type: str, start_datetime_str:
     except ValueError:
         return "Invalid datetime format. Please use 'YYYY-MM-DD HH:MM'. For example, '2024-07-28 14:00'."
 
-    # The API schema expects `slot_type` and `location` which we don't explicitly ask the user for booking
-    # as they are inherent to the `spot_id`.
-    # We will need to fetch spot details first or modify the tool/API.
-    # For now, we'll assume the API can derive location/slot_type from spot_id or it's passed implicitly.
-    # A better approach: The booking request in FastAPI should fetch spot details using spot_id. (DONE in FastAPI part)
+    # `location` and `slot_type` are inherent to the `spot_id`; the API derives them from the spot.
 
     payload = {
         "spot_id": spot_id,
@@ -92,36 +264,53 @@ def book_parking_spot_tool(spot_id: int, vehicle_type: str, start_datetime_str:
     }
     try:
         print(f"Booking payload: {payload}") # For debugging    
-        response = requests.post(f"{FASTAPI_BASE_URL}/book-parking", json=payload)
-        print(f"Booking response: {response.text}") # For debugging 
-        response.raise_for_status()
-        booking_details = response.json()
+        booking_details = get_transport().post("/book-parking", payload)
+        print(f"Booking response: {booking_details}") # For debugging 
+        response_cache.invalidate_spot(spot_id)
         return f"Booking successful! Details: {json.dumps(booking_details)}"
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
+    except tool_transport.ResponseParseError:
+        return "API Error: Could not parse response from parking service."
+    except tool_transport.TransportError as e:
+        if e.status_code is None:
+            return f"API Error during booking: {str(e)}. The parking service might be down."
+        if e.status_code == 404:
             return "Booking Error: Parking spot not found."
-        elif e.response.status_code == 400:
-            error_detail = e.response.json().get("detail", "Spot not available or invalid request.")
-            return f"Booking Error: {error_detail}"
+        elif e.status_code == 400:
+            response_cache.invalidate_spot(spot_id)  # cached results may have offered a taken spot
+            return f"Booking Error: {e.detail or 'Spot not available or invalid request.'}"
         return f"API Error during booking: {str(e)}"
-    except requests.exceptions.RequestException as e:
-        return f"API Error during booking: {str(e)}. The parking service might be down."
-    except json.JSONDecodeError:
-        return "API Error: Could not parse response from parking service."
 
-tools = [search_parking_spots_tool, book_parking_spot_tool]
+tools = [search_parking_spots_tool, find_nearby_parking_tool, get_price_quotes_tool, book_parking_spot_tool]
 
-def get_agent_prompt_template(retrieved_memory_str: str = ""):
-    memory_guidance = ""
-    if retrieved_memory_str:
-        memory_guidance = (
-            f"Here's some relevant information from past conversations with this user:\n"
-            f"{retrieved_memory_str}\n"
-            f"Use this to pre-fill information or confirm preferences if appropriate. "
-            f"Don't assume, always confirm if you are using past info.\n"
-        )
+def format_memory_lines(history: List[dict], user_query: str = "") -> str:
+    """One line per distinct retrieved turn, most relevant first; compaction summaries become preference lines."""
+    seen = {embeddings.normalize_text(user_query)}  # the current query is found in memory as well
+    lines = []
+    for item in history:
+        key = embeddings.normalize_text(item["text"])
+        if key in seen:
+            continue
+        seen.add(key)
+        if item["metadata"].get("role") == "summary":
+            lines.append(f"- Preferences: {item['text']}")
+        else:
+            lines.append(f"- {item['text']} (from a past conversation)")
+    return "\n".join(lines)
 
-    system_prompt = f"""
+def format_memory_guidance(retrieved_memory_str: str = "") -> str:
+    if not retrieved_memory_str:
+        return "No relevant information from past conversations."
+    return (
+        f"Here's some relevant information from past conversations with this user:\n"
+        f"{retrieved_memory_str}\n"
+        f"Use this to pre-fill information or confirm preferences if appropriate. "
+        f"Don't assume, always confirm if you are using past info.\n"
+    )
+
+def get_agent_prompt_template():
+    # The instructions are static so the prompt prefix is identical on every turn;
+    # per-turn values (`memory_guidance`, `current_time`) are prompt variables at the end.
+    system_prompt = """
     You are a helpful AI parking assistant. Your goal is to help users find and book parking spots.
     Be friendly and conversational.
 
@@ -132,33 +321,44 @@ def get_agent_prompt_template(retrieved_memory_str: str = ""):
        - You NEED `vehicle_type`, `location`. `slot_type` is optional.
        - If any of these are missing from the user's query, ask for them one by one.
        - Example: "Sure, I can help you find a parking spot. What type of vehicle do you have?" or "And where are you looking to park?"
+       - If the user already mentioned when they want to park, pass `start_datetime_str` and `end_datetime_str` so only spots free for that time are returned.
        - Once you have `vehicle_type` and `location`, use the `search_parking_spots_tool`.
+       - If the user asks for parking *near* a place or *within* a distance (e.g. "within 500 m of the stadium"), use `find_nearby_parking_tool` with `near_location` (or `latitude`/`longitude`) and `radius_m` instead. Mention each spot's distance.
     4. **For BOOKING:**
        - The user usually wants to book after a search. They will mention a `spot_id` from the search results.
        - You NEED `spot_id`, `vehicle_type` (confirm from user or search context), `start_datetime_str`, and `end_datetime_str`.
        - Ask for the date and time for parking. "When would you like to park? Please provide the start and end date and time (e.g., 'Today from 2 PM to 4 PM' or '2024-07-28 14:00 to 2024-07-28 16:00')."
        - Convert natural language times (like "today at 2 PM") to 'YYYY-MM-DD HH:MM' format before calling the tool. Assume 'today' if only time is given.
+       - Prices can vary by time of day. If the user asks what a stay will cost, or to compare spots, use `get_price_quotes_tool` with the spot IDs and times.
        - Once you have all booking details, use the `book_parking_spot_tool`.
     5. **Input Validation:**
        - Before calling any tool, double-check if you have ALL required parameters for that tool.
        - The LLM (you) must be responsible for extracting and validating the *presence* of information. The tools will validate the *values*.
        - If information is insufficient, ask the user for what's missing.
     6. **Memory Usage:**
-       {memory_guidance}
+       - Use the notes from past conversations at the end of these instructions, if any.
     7. **Tool Usage:**
        - Only use tools when you have confirmed all necessary information for the action.
        - Provide the tool's output back to the user clearly.
     8. **Clarification:** If the user's request is ambiguous, ask for clarification.
 
-    Current date and time is: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-
     Remember your available tools:
     - `search_parking_spots_tool`: for finding spots.
+    - `find_nearby_parking_tool`: for finding the closest spots to a place.
+    - `get_price_quotes_tool`: for the total price of spots for a time window.
     - `book_parking_spot_tool`: for making a booking.
 
     Always respond in a friendly, conversational manner.
     If a search returns no spots, inform the user and maybe suggest trying different criteria.
     If a booking fails, explain why based on the tool's message.
+
+    Notes from past conversations:
+    {memory_guidance}
+
+    Availability changes since spots were listed in this conversation:
+    {availability_updates}
+
+    Current date and time is: {current_time}
     """
     return ChatPromptTemplate.from_messages([
         ("system", system_prompt),
@@ -167,57 +367,308 @@ def get_agent_prompt_template(retrieved_memory_str: str = ""):
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
-# --- Agent and Memory ---
-# `ConversationBufferWindowMemory` is for the agent's short-term context.
-chat_history_for_agent = []
+_system_prompt = None
+
+def _system_prompt_text() -> str:
+    global _system_prompt
+    if _system_prompt is None:
+        _system_prompt = get_agent_prompt_template().messages[0].prompt.template
+    return _system_prompt
+
+# --- Agent and Sessions ---
+# The executor is built once per process and shared by all sessions;
+# per-session state lives in `session_registry`.
+_agent_executor = None
+_agent_executor_lock = threading.Lock()
+session_registry = SessionRegistry()
+
+def get_agent_executor() -> AgentExecutor:
+    global _agent_executor
+    if _agent_executor is None:
+        with _agent_executor_lock:
+            if _agent_executor is None:
+                prompt = get_agent_prompt_template()
+                agent = create_openai_tools_agent(get_llm(), tools, prompt)
+                _agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True,
+                                                return_intermediate_steps=True)
+    return _agent_executor
 
 # Main function to process user input
-def process_user_query(user_query: str, current_chat_history: List[Dict[str,str]]) -> str:
+def process_user_query(user_query: str, current_chat_history: List[Dict[str,str]],
+                       session_id: str = DEFAULT_SESSION_ID, user_id: str = USER_ID_FOR_MEMORY,
+                       trace_id: Optional[str] = None) -> str:
     """
     Processes a user query using the agent.
     `current_chat_history` is for the UI, format: [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
+    `session_id` selects the per-conversation state in `session_registry`.
+    `user_id` scopes long-term memory: turns are stored and searched only within that user's data.
+    `trace_id` labels this turn's spans (see `tracing`); a new one is generated if None.
     """
-    global chat_history_for_agent
+    session = session_registry.get_or_create(session_id, user_id)
+    with session.lock, tracing.trace(trace_id), tracing.span("turn"):
+        match = fast_path.match(user_query, current_chat_history)
+        if match is not None:
+            return _run_fast_path(session, user_query, match)
+        slots = _search_slots(user_query, session.user_id)
+        cached = _cached_answer(session, user_query, slots)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        agent_input = _prepare_turn(session, user_query, current_chat_history)
+        response = get_agent_executor().invoke(agent_input, config={"callbacks": [_LLMTimingCallbackHandler()]})
+        fast_path.fast_path_stats.record_agent_turn(time.perf_counter() - started)
+        _cache_answer(user_query, slots, response)
+        return _finish_turn(session, response)
+
+def stream_user_query(user_query: str, current_chat_history: List[Dict[str,str]],
+                      session_id: str = DEFAULT_SESSION_ID, user_id: str = USER_ID_FOR_MEMORY,
+                      trace_id: Optional[str] = None) -> Iterator[dict]:
+    """
+    Streaming variant of `process_user_query`. Yields events as the agent runs:
+      {"type": "token", "text": ...}                      LLM output, as it is generated
+      {"type": "tool_start", "tool": ..., "input": ...}   a tool call begins
+      {"type": "tool_end", "tool": ..., "output": ...}    a tool call returned
+      {"type": "final", "text": ...}                      the complete answer (always last)
+    Tokens from an LLM pass that ends in a tool call are preliminary; the "final" text is authoritative.
+    """
+    session = session_registry.get_or_create(session_id, user_id)
+    with session.lock, tracing.trace(trace_id), tracing.span("turn"):
+        match = fast_path.match(user_query, current_chat_history)
+        if match is not None:
+            tool_name = FAST_PATH_TOOLS[match.intent].name
+            yield {"type": "tool_start", "tool": tool_name, "input": match.args}
+            text = _run_fast_path(session, user_query, match)
+            yield {"type": "tool_end", "tool": tool_name, "output": text}
+            yield {"type": "final", "text": text}
+            return
+        slots = _search_slots(user_query, session.user_id)
+        cached = _cached_answer(session, user_query, slots)
+        if cached is not None:
+            yield {"type": "final", "text": cached}
+            return
+        started = time.perf_counter()
+        agent_input = _prepare_turn(session, user_query, current_chat_history)
+        events: "queue.Queue" = queue.Queue()
+        result = {}
+
+        def run_agent():
+            try:
+                result["response"] = get_agent_executor().invoke(agent_input, config={
+                    "callbacks": [_StreamingCallbackHandler(events.put), _LLMTimingCallbackHandler()]
+                })
+            except Exception as e:
+                result["error"] = e
+            finally:
+                events.put(None)
+
+        # The worker runs in a copy of this context so its spans stay in this turn's trace
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(run_agent,),
+                                  name=f"agent-stream-{session.session_id}", daemon=True)
+        worker.start()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield event
+        worker.join()
+        if "error" in result:
+            raise result["error"]
+        fast_path.fast_path_stats.record_agent_turn(time.perf_counter() - started)
+        _cache_answer(user_query, slots, result["response"])
+        yield {"type": "final", "text": _finish_turn(session, result["response"])}
+
+class _StreamingCallbackHandler(BaseCallbackHandler):
+    """Forwards LLM tokens and tool calls from the agent's thread to `emit`."""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self._tools = {}  # run_id -> tool name
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            self.emit({"type": "token", "text": token})
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, run_id=None, inputs=None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name", "tool")
+        self._tools[run_id] = name
+        self.emit({"type": "tool_start", "tool": name, "input": inputs if inputs is not None else input_str})
+
+    def on_tool_end(self, output: Any, run_id=None, **kwargs: Any) -> None:
+        self.emit({"type": "tool_end", "tool": self._tools.pop(run_id, "tool"), "output": str(output)})
+
+class _LLMTimingCallbackHandler(BaseCallbackHandler):
+    """Records each LLM call of the agent as an `llm_call` span."""
+
+    def __init__(self):
+        self._started = {}  # run_id -> perf_counter at start
+
+    def on_chat_model_start(self, serialized, messages, run_id=None, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
 
-    # 1. Store user query to Milvus
-    milvus_utils.store_conversation_turn(
+    def on_llm_start(self, serialized, prompts, run_id=None, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, run_id=None, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            tracing.record("llm_call", time.perf_counter() - started)
+
+    on_llm_error = on_llm_end
+
+# Fully specified requests recognized by `fast_path` call these tools directly, without the LLM
+FAST_PATH_TOOLS = {"search": search_parking_spots_tool, "book": book_parking_spot_tool}
+
+def _run_fast_path(session: AgentSession, user_query: str, match: "fast_path.FastPathMatch") -> str:
+    started = time.perf_counter()
+    _remember_user_turn(session, user_query)
+    output = FAST_PATH_TOOLS[match.intent].invoke(match.args)
+    text = _finish_turn(session, {"output": output})
+    fast_path.fast_path_stats.record_hit(match.intent, time.perf_counter() - started)
+    return text
+
+def _search_slots(user_query: str, user_id: str) -> Optional[dict]:
+    """
+    Answer-cache key of a self-contained search question: vehicle, location and slot type, the
+    time window and the user (answers depend on the user's memory). None if it cannot be cached.
+    """
+    if not response_cache.SEMANTIC_CACHE_ENABLED:
+        return None
+    gazetteer = fast_path.get_gazetteer()
+    if gazetteer is None:
+        return None
+    normalized = embeddings.normalize_text(user_query)
+    found = gazetteer.find(normalized)
+    if any(len(found.get(slot, ())) != 1 for slot in ("vehicle_type", "location")) or len(found.get("slot_type", ())) > 1:
+        return None
+    # Questions differing only in their window embed almost identically, so the window is part of the key
+    window, time_confidence = fast_path.parse_time_window(normalized, datetime.now())
+    if time_confidence == 0:
+        return None
+    slots = {slot: next(iter(values)) for slot, values in found.items()}
+    slots["window"] = tuple(dt.isoformat() for dt in window) if window else None
+    slots["user_id"] = user_id
+    return slots
+
+def _cached_answer(session: AgentSession, user_query: str, slots: Optional[dict]) -> Optional[str]:
+    if slots is None:
+        return None
+    text = response_cache.semantic_cache.lookup(embeddings.embed_text(user_query), slots)
+    if text is None:
+        return None
+    _remember_user_turn(session, user_query)
+    return _finish_turn(session, {"output": text})
+
+def _cache_answer(user_query: str, slots: Optional[dict], response: dict) -> None:
+    """Caches answers of turns whose only tool calls were searches."""
+    steps = response.get("intermediate_steps") or []
+    if slots is None or not steps or "output" not in response:
+        return
+    spot_ids = set()
+    for action, observation in steps:
+        ids = response_cache.spot_ids_from_search_output(str(observation))
+        if getattr(action, "tool", None) != search_parking_spots_tool.name or ids is None:
+            return
+        spot_ids |= ids
+    response_cache.semantic_cache.store(embeddings.embed_text(user_query), slots, response["output"], frozenset(spot_ids))
+
+def _remember_user_turn(session: AgentSession, user_query: str) -> List[float]:
+    # Every turn path starts here; spots listed during this turn count as listed from this point
+    session.turn_mark = availability_watch.received
+    # The query is encoded once (and cached) and reused for both the store and the search
+    query_embedding = embeddings.embed_text(user_query)
+
+    # 1. Store user query to Milvus (queued for the background writer)
+    memory_writer.store_turn(
         user_query,
-        {"user_id": USER_ID_FOR_MEMORY, "role": "user", "timestamp": datetime.utcnow().isoformat()}
+        {"user_id": session.user_id, "role": "user", "timestamp": datetime.utcnow().isoformat()},
+        embedding=query_embedding,
     )
+    return query_embedding
 
-    # 2. Retrieve relevant history from Milvus
-    relevant_milvus_history = milvus_utils.retrieve_relevant_history(user_query, USER_ID_FOR_MEMORY, top_k=3)
-    retrieved_memory_str = "\n".join([f"- {item['text']} (from a past conversation)" for item in relevant_milvus_history])
+def _prepare_turn(session: AgentSession, user_query: str, current_chat_history: List[Dict[str,str]]) -> dict:
+    """Memory store/retrieval and history conversion; returns the agent's input for this turn."""
+    query_embedding = _remember_user_turn(session, user_query)
+
+    # 2. Retrieve relevant history from Milvus, including turns still in the write queue
+    with tracing.span("memory.retrieve"):
+        relevant_milvus_history = memory_writer.retrieve_relevant_history(
+            user_query, session.user_id, top_k=3, query_embedding=query_embedding
+        )
+    with tracing.span("prompt_build"):
+        return _build_agent_input(session, user_query, current_chat_history,
+                                  format_memory_lines(relevant_milvus_history, user_query))
 
+def _build_agent_input(session: AgentSession, user_query: str, current_chat_history: List[Dict[str,str]],
+                       retrieved_memory_str: str) -> dict:
+    # 3. Bring the session's history up to date: only new UI messages are converted, and
+    #    older ones are summarized once the window exceeds the token budget
+    history = current_chat_history
+    if history and history[-1].get("role") == "user" and history[-1].get("content") == user_query:
+        history = history[:-1]  # the current query is sent as `input`, not as history
+    session.history.sync(history)
+    session.chat_history = session.history.messages()
 
-    # 3. Create/Update Agent
-    prompt = get_agent_prompt_template(retrieved_memory_str)
-    agent = create_openai_tools_agent(llm, tools, prompt) 
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    # 4. This turn's variables for the shared agent
+    agent_input = {
+        "input": user_query,
+        "chat_history": session.chat_history,
+        "memory_guidance": format_memory_guidance(retrieved_memory_str),
+        "availability_updates": format_availability_updates(session),
+        "current_time": datetime.now().strftime('%Y-%m-%d %H:%M'),
+    }
+    report = session.history.report(system=_system_prompt_text(), memory=agent_input["memory_guidance"],
+                                    availability=agent_input["availability_updates"], input=user_query)
+    print(f"[trace {tracing.current_trace_id()}] Prompt tokens (est.) for session {session.session_id}: {report['prompt_tokens']} "
+          f"({report['messages_in_window']} recent messages, {report['messages_summarized']} summarized)")
+    return agent_input
 
-    from langchain_core.messages import HumanMessage, AIMessage
-    langchain_formatted_history = []
-    for msg in current_chat_history: 
-        if msg["role"] == "user":
-            langchain_formatted_history.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            langchain_formatted_history.append(AIMessage(content=msg["content"]))
+def format_availability_updates(session: AgentSession) -> str:
+    """Spots the agent listed in this session that other users booked since; each is reported once."""
+    taken = availability_watch.booked_since(session.listed_spots, session.own_bookings)
+    if not taken:
+        return "None."
+    for event in taken:
+        session.listed_spots.pop(event["spot_id"], None)
+    lines = [f"- Spot {e['spot_id']} ({e['location']}, {e['spot_type']}) was booked by another user "
+             f"from {e['start_time']} to {e['end_time']}." for e in taken]
+    return ("Tell the user about these before they try to book one of them for an overlapping time:\n"
+            + "\n".join(lines))
 
+def _track_listed_spots(session: AgentSession, response: dict) -> None:
+    """Records the spots this turn's tool results listed and the bookings it made."""
+    texts = [str(observation) for _, observation in response.get("intermediate_steps") or []]
+    texts.append(str(response.get("output", "")))
+    for text in texts:
+        for spot_id in response_cache.spot_ids_from_search_output(text) or ():
+            session.listed_spots[spot_id] = session.turn_mark
+        if text.startswith("Booking successful! Details:"):
+            try:
+                session.own_bookings.add(json.loads(text.split(":", 1)[1])["booking_id"])
+            except (ValueError, KeyError, TypeError):
+                pass
 
-    # 4. Invoke Agent
-    response = agent_executor.invoke({
-        "input": user_query,
-        "chat_history": langchain_formatted_history
-    })
+def _finish_turn(session: AgentSession, response: dict) -> str:
     assistant_response = response.get("output", "Sorry, I encountered an issue.")
+    session.turns += 1
+    _track_listed_spots(session, response)
 
-    # 5. Store assistant response to Milvus
-    milvus_utils.store_conversation_turn(
+    # 5. Store assistant response to Milvus (queued for the background writer)
+    memory_writer.store_turn(
         assistant_response,
-        {"user_id": USER_ID_FOR_MEMORY, "role": "assistant", "timestamp": datetime.utcnow().isoformat()}
+        {"user_id": session.user_id, "role": "assistant", "timestamp": datetime.utcnow().isoformat()}
     )
 
     return assistant_response
 
-# Initialize Milvus collection on startup
-milvus_utils.create_milvus_collection_if_not_exists()
\ No newline at end of file
+# --- Warm-up ---
+# Nothing heavy happens at import: the embedding model, LLM client and memory backend are
+# created on first use. warm_up() does that ahead of the first query (see startup.WARMUP_MODE).
+WARMUP_STEPS = {
+    "embedding model": lambda: embeddings.embed_text("warm up"),  # loads the model and runs one encode
+    "memory backend": lambda: milvus_utils.get_memory_backend().open(),
+    "agent executor": get_agent_executor,
+    "tool transport": get_transport,  # also starts following availability events
+}
+
+def warm_up(mode: str = startup.WARMUP_MODE):
+    return startup.warm_up(WARMUP_STEPS, mode)
\ No newline at end of file
@@ -0,0 +1,76 @@
+# agent_sessions.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from chat_history import ChatHistoryManager
+
+DEFAULT_SESSION_ID = "default"
+
+
+class AgentSession:
+    """Per-conversation state kept between turns; the agent executor itself is shared."""
+
+    def __init__(self, session_id: str, user_id: str):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.chat_history: List = []  # LangChain messages sent to the agent as `chat_history`
+        self.history = ChatHistoryManager()  # builds `chat_history` incrementally within a token budget
+        self.turns = 0
+        # For availability warnings: spot id -> availability_watch.received when the agent last listed it
+        self.listed_spots: Dict[int, int] = {}
+        self.own_bookings: Set[int] = set()  # booking IDs made in this session, not worth a warning
+        self.turn_mark = 0  # availability_watch.received at the start of the current turn
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        # Turns of one session run one at a time; different sessions run in parallel
+        self.lock = threading.Lock()
+
+
+class SessionRegistry:
+    """
+    Sessions keyed by session ID, evicted least-recently-used beyond `max_sessions`
+    or after `idle_ttl_seconds` without a turn.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl_seconds: float = 3600):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sessions: "OrderedDict[str, AgentSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id: str, user_id: str) -> AgentSession:
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = AgentSession(session_id, user_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+                session.user_id = user_id
+            session.last_active = now
+            return session
+
+    def get(self, session_id: str) -> Optional[AgentSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict_idle(self, now: float) -> None:
+        # Oldest sessions are at the front, so stop at the first one still active
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_active <= self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sessions)
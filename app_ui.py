@@ -1,21 +1,43 @@
 # app_ui.py
 
+import time
+_import_started = time.perf_counter()
 import agent_logic 
 import json
 import milvus_utils 
 import os
+import sys
+import uuid
+from startup import startup_profile
 os.environ["STREAMLIT_SERVER_ENABLE_FILE_WATCHER"] = "false"
-import torch
-torch.classes.__path__ = [] 
 
 import streamlit as st
 
+# torch is only imported once the embedding model loads (lazily, or by the warm-up thread);
+# keep Streamlit's module watcher away from torch.classes from then on
+if "torch" in sys.modules:
+    sys.modules["torch"].classes.__path__ = []
+
+
+@st.cache_resource(show_spinner=False)
+def _start_warmup():
+    # Runs once per server process, not on every script rerun
+    startup_profile.record("import app modules", time.perf_counter() - _import_started)
+    return agent_logic.warm_up()
+
 
 st.set_page_config(page_title="Parking Assistant", layout="wide")
+_start_warmup()
 
 st.title("🚗 Smart Parking Assistant")
 st.caption("Your AI-powered helper for finding and booking parking slots.")
 
+# One agent session per browser session
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+if "user_id" not in st.session_state:
+    st.session_state.user_id = agent_logic.USER_ID_FOR_MEMORY
+
 # Initialize chat history in session state
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you with your parking needs today?"}]
@@ -32,9 +54,11 @@ for message in st.session_state.messages:
                 # Extract the JSON part
                 try:
                     json_str = content.split(":", 1)[1].strip()
-                    data = json.loads(json_str)
+                    data, end = json.JSONDecoder().raw_decode(json_str)
                     st.markdown(content.split(":", 1)[0] + ":") # Print the prefix
                     st.json(data)
+                    if json_str[end:].strip():
+                        st.caption(json_str[end:].strip()) # e.g. "These are the 5 cheapest of 240 matching spots..."
                 except (IndexError, json.JSONDecodeError):
                     st.markdown(content)
             else:
@@ -51,10 +75,32 @@ if prompt := st.chat_input("What can I do for you? (e.g., 'Find parking for my c
 
     # Get assistant response
     with st.chat_message("assistant"):
+        status_placeholder = st.empty()
         message_placeholder = st.empty()
         message_placeholder.markdown("Thinking...")
         try:
-            assistant_response = agent_logic.process_user_query(prompt, st.session_state.messages)
+            # Render tokens and tool calls as the agent produces them
+            streamed = ""
+            assistant_response = None
+            # One trace ID per turn; it is sent to the API with every tool call (X-Trace-Id)
+            st.session_state.last_trace_id = agent_logic.tracing.new_trace_id()
+            for event in agent_logic.stream_user_query(
+                prompt, st.session_state.messages, st.session_state.session_id, st.session_state.user_id,
+                trace_id=st.session_state.last_trace_id,
+            ):
+                if event["type"] == "token":
+                    streamed += event["text"]
+                    message_placeholder.markdown(streamed + "▌")
+                elif event["type"] == "tool_start":
+                    # Text streamed before a tool call is the model thinking out loud; start over
+                    streamed = ""
+                    status_placeholder.caption(f"Running `{event['tool']}`...")
+                    message_placeholder.markdown("Thinking...")
+                elif event["type"] == "tool_end":
+                    status_placeholder.caption(f"`{event['tool']}` done.")
+                elif event["type"] == "final":
+                    assistant_response = event["text"]
+            status_placeholder.empty()
             message_placeholder.markdown(assistant_response)
         except Exception as e:
             st.error(f"An error occurred: {e}")
@@ -67,19 +113,38 @@ if prompt := st.chat_input("What can I do for you? (e.g., 'Find parking for my c
 
 # Sidebar for admin actions
 with st.sidebar:
+    st.text_input("User ID (memory is kept per user)", key="user_id")
+
     st.header("Admin Panel")
     if st.button("Reset Parking Availability (Debug)"):
         try:
-            import requests
-            response = requests.post(f"{agent_logic.FASTAPI_BASE_URL}/admin/reset-availability")
-            if response.status_code == 200:
-                st.success("Parking availability reset successfully!")
+            agent_logic.get_transport().post("/admin/reset-availability")
+            agent_logic.response_cache.clear()
+            st.success("Parking availability reset successfully!")
+        except agent_logic.tool_transport.TransportError as e:
+            if e.status_code is None:
+                st.error(f"Error connecting to API: {e}")
             else:
-                st.error(f"Failed to reset: {response.text}")
+                st.error(f"Failed to reset: {e.detail or e}")
         except Exception as e:
             st.error(f"Error connecting to API: {e}")
 
     st.markdown("---")
     st.markdown("Debug Info:")
     st.write(f"Using LLM: {agent_logic.LLM_MODEL}")
-    st.write(f"Milvus Collection: {milvus_utils.COLLECTION_NAME}")
\ No newline at end of file
+    st.write(f"Milvus Collection: {milvus_utils.COLLECTION_NAME}")
+    with st.expander("Fast path (requests answered without the LLM)"):
+        st.json(agent_logic.fast_path.fast_path_stats.stats())
+    with st.expander("Response caches"):
+        st.json(agent_logic.response_cache.stats())
+    session = agent_logic.session_registry.get(st.session_state.session_id)
+    if session is not None and session.history.last_report:
+        with st.expander("Prompt size (last turn)"):
+            st.json(session.history.last_report)
+    if st.session_state.get("last_trace_id"):
+        with st.expander(f"Last turn trace ({st.session_state.last_trace_id})"):
+            st.table(agent_logic.tracing.trace_log.get(st.session_state.last_trace_id))
+    with st.expander("Stage latency (this process)"):
+        st.json(agent_logic.tracing.stage_seconds.summary())
+    with st.expander("Startup profile"):
+        st.code(startup_profile.report())
\ No newline at end of file
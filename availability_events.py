@@ -0,0 +1,182 @@
+# availability_events.py
+"""
+In-process availability event bus. The API publishes a "booked" event for every booking and a
+"reset" event when availability is reset; subscribers get the events matching their filters
+instead of polling the search endpoints.
+
+Event types:
+    booked  {"seq", "type", "at", "spot_id", "booking_id", "location", "spot_type",
+             "vehicle_type_allowed", "start_time", "end_time"}  - the window is no longer free
+    reset   {"seq", "type", "at"}  - every spot is available again and all bookings are gone
+    resync  {"seq", "type", "at"}  - events were missed (slow subscriber or expired history);
+                                     re-run the search instead of applying deltas
+
+The last EVENT_HISTORY_SIZE events are kept, so a subscriber that reconnects with the last
+sequence number it saw (SSE Last-Event-ID) gets what it missed.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from availability_index import normalize_key
+
+EVENT_HISTORY_SIZE = int(os.getenv("EVENT_HISTORY_SIZE", "1000"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))  # per subscriber, before it is told to resync
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+
+class EventFilter:
+    """Same matching as the search filters: each given term must be contained in the spot's value."""
+
+    def __init__(self, location: Optional[str] = None, vehicle_type: Optional[str] = None,
+                 slot_type: Optional[str] = None):
+        self.terms = [(field, normalize_key(term)) for field, term in
+                      (("location", location), ("vehicle_type_allowed", vehicle_type), ("spot_type", slot_type)) if term]
+
+    def matches(self, event: dict) -> bool:
+        if event["type"] != "booked":
+            return True  # reset and resync concern every spot
+        return all(term in normalize_key(event[field]) for field, term in self.terms)
+
+
+class Subscription:
+    """Events for one async consumer (an SSE or WebSocket connection), queued on its event loop."""
+
+    def __init__(self, bus: "AvailabilityEventBus", event_filter: EventFilter, loop: asyncio.AbstractEventLoop):
+        self.bus = bus
+        self.filter = event_filter
+        self.closed = False
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+
+    def deliver(self, event: dict) -> None:
+        """Thread-safe; called by `publish` from whichever thread handled the booking."""
+        if self.filter.matches(event):
+            try:
+                self._loop.call_soon_threadsafe(self._put, event)
+            except RuntimeError:  # the connection's loop is gone
+                self.close()
+
+    def _put(self, event: dict) -> None:
+        if self._queue.full():
+            # Too far behind to catch up with deltas: drop them and tell the client to re-query
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            event = self.bus.resync_event()
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout: float = EVENT_HEARTBEAT_SECONDS) -> Optional[dict]:
+        """The next event, or None after `timeout` seconds without one (or once closed)."""
+        if self.closed:
+            return None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.bus.unsubscribe(self)
+            try:
+                self._loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                pass
+
+    def _wake(self) -> None:
+        if not self._queue.full():
+            self._queue.put_nowait(None)  # ends a pending get()
+
+
+class AvailabilityEventBus:
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: deque = deque(maxlen=history_size)
+        self._subscriptions: List[Subscription] = []
+        self._listeners: List[Callable[[dict], None]] = []
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, event_type: str, **fields) -> dict:
+        with self._lock:
+            self._seq += 1
+            event = {"seq": self._seq, "type": event_type, "at": datetime.now().isoformat(), **fields}
+            self._history.append(event)
+            subscriptions, listeners = list(self._subscriptions), list(self._listeners)
+        for subscription in subscriptions:
+            subscription.deliver(event)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:  # a failing listener must not fail the booking that published
+                print(f"Availability listener failed: {e}")
+        return event
+
+    def publish_booked(self, booking_id: int, spot, start_time: datetime, end_time: datetime) -> dict:
+        return self.publish(
+            "booked", spot_id=spot.id, booking_id=booking_id, location=spot.location, spot_type=spot.spot_type,
+            vehicle_type_allowed=spot.vehicle_type_allowed,
+            start_time=start_time.isoformat(), end_time=end_time.isoformat(),
+        )
+
+    def publish_reset(self) -> dict:
+        return self.publish("reset")
+
+    def resync_event(self) -> dict:
+        return {"seq": self._seq, "type": "resync", "at": datetime.now().isoformat()}
+
+    def subscribe(self, event_filter: EventFilter, since: Optional[int] = None) -> Subscription:
+        """
+        Must be called on the consumer's event loop. With `since`, events after that sequence
+        number are queued first (or a resync event, if they are no longer in the history).
+        """
+        subscription = Subscription(self, event_filter, asyncio.get_running_loop())
+        with self._lock:
+            if since is not None and since != self._seq:
+                missed, complete = self._events_since(since)
+                for event in missed if complete else [self.resync_event()]:
+                    if event_filter.matches(event):
+                        subscription._put(event)
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _events_since(self, since: int) -> Tuple[List[dict], bool]:
+        if since > self._seq:  # from before a restart
+            return [], False
+        oldest = self._history[0]["seq"] if self._history else self._seq + 1
+        return [e for e in self._history if e["seq"] > since], since >= oldest - 1
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def add_listener(self, listener: Callable[[dict], None]) -> None:
+        """Calls `listener(event)` synchronously on every publish (in-process consumers such as the agent)."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[dict], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscriptions) + len(self._listeners)
+
+
+def format_sse(event: dict) -> str:
+    """One Server-Sent Events message; the sequence number is the event ID clients resume from."""
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+# Shared by all API workers in this process
+availability_events = AvailabilityEventBus()
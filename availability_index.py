@@ -0,0 +1,219 @@
+# availability_index.py
+import threading
+import time
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import database
+
+
+def normalize_key(value: Optional[str]) -> str:
+    return (value or "").strip().lower()
+
+
+# Orderings for paginated listings; the spot ID breaks ties so every key is unique
+SORT_KEYS = {
+    "id": lambda spot: (spot["id"],),
+    "price": lambda spot: (spot["price_per_hour"], spot["id"]),
+}
+
+
+class AvailabilityIndex:
+    """
+    In-process index of parking spots keyed by normalized vehicle type, location and slot type.
+    Each key maps to the set of spot IDs carrying that value, so a search is a set intersection
+    instead of a table scan with leading-wildcard ILIKE filters.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.spots: Dict[int, dict] = {}
+        self.available: Set[int] = set()
+        self.by_vehicle: Dict[str, Set[int]] = {}
+        self.by_location: Dict[str, Set[int]] = {}
+        self.by_slot_type: Dict[str, Set[int]] = {}
+        # sort name -> (keys, spot ids) in ascending key order, rebuilt (not mutated) on load
+        self.orderings: Dict[str, Tuple[List[tuple], List[int]]] = {}
+        self._version = None  # parking_spots table version the index reflects, see _table_version
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def fresh(self) -> bool:
+        """Loaded, and the table version was checked within INDEX_REFRESH_SECONDS."""
+        return self._loaded and time.monotonic() - self._checked_at < database.INDEX_REFRESH_SECONDS
+
+    @staticmethod
+    def _table_version(db) -> tuple:
+        # The available count also catches a reset made by another worker
+        available = database.func.sum(database.case((database.ParkingSpot.is_available, 1), else_=0))
+        return database.table_version(db, database.ParkingSpot, available)
+
+    def load(self, db) -> None:
+        """(Re)builds the index from the parking_spots table."""
+        version = self._table_version(db)
+        rows = db.query(
+            database.ParkingSpot.id,
+            database.ParkingSpot.location,
+            database.ParkingSpot.spot_type,
+            database.ParkingSpot.vehicle_type_allowed,
+            database.ParkingSpot.is_available,
+            database.ParkingSpot.price_per_hour,
+        ).all()
+        with self._lock:
+            self.spots.clear()
+            self.available.clear()
+            self.by_vehicle.clear()
+            self.by_location.clear()
+            self.by_slot_type.clear()
+            for row in rows:
+                self._add(row._asdict())
+            self._build_orderings()
+            self._version, self._checked_at = version, time.monotonic()
+            self._loaded = True
+        print(f"Availability index built with {len(self.spots)} spots.")
+
+    def ensure_loaded(self, db) -> None:
+        """Builds the index, or rebuilds it when the parking_spots table changed since (e.g. in another worker)."""
+        if self.fresh:
+            return
+        with self._lock:
+            if not self._loaded:
+                self.load(db)
+            elif not self.fresh:
+                self._checked_at = time.monotonic()
+                if self._table_version(db) != self._version:
+                    self.load(db)
+
+    def _add(self, spot: dict) -> None:
+        spot_id = spot["id"]
+        self.spots[spot_id] = spot
+        self.by_vehicle.setdefault(normalize_key(spot["vehicle_type_allowed"]), set()).add(spot_id)
+        self.by_location.setdefault(normalize_key(spot["location"]), set()).add(spot_id)
+        self.by_slot_type.setdefault(normalize_key(spot["spot_type"]), set()).add(spot_id)
+        if spot["is_available"]:
+            self.available.add(spot_id)
+
+    def _build_orderings(self) -> None:
+        orderings = {}
+        for name, sort_key in SORT_KEYS.items():
+            keyed = sorted((sort_key(spot), spot_id) for spot_id, spot in self.spots.items())
+            orderings[name] = ([key for key, _ in keyed], [spot_id for _, spot_id in keyed])
+        self.orderings = orderings
+
+    @staticmethod
+    def _match(postings: Dict[str, Set[int]], term: str) -> Set[int]:
+        # Same semantics as ILIKE '%term%': union of every key containing the term.
+        # The number of distinct keys is tiny compared to the number of spots.
+        term = normalize_key(term)
+        matches = [ids for key, ids in postings.items() if term in key]
+        if len(matches) == 1:
+            return matches[0]
+        return set().union(*matches)
+
+    def search(
+        self,
+        vehicle_type: Optional[str] = None,
+        location: Optional[str] = None,
+        slot_type: Optional[str] = None,
+        candidates: Optional[Iterable[int]] = None,
+    ) -> List[dict]:
+        """
+        Returns available spots matching all given filters, ordered by ID.
+        `candidates` overrides the default "currently available" base set.
+        """
+        with self._lock:
+            result = self.matching_ids(vehicle_type, location, slot_type, candidates)
+            return [dict(self.spots[spot_id], is_available=spot_id in self.available) for spot_id in sorted(result)]
+
+    def matching_ids(
+        self,
+        vehicle_type: Optional[str] = None,
+        location: Optional[str] = None,
+        slot_type: Optional[str] = None,
+        candidates: Optional[Iterable[int]] = None,
+    ) -> Set[int]:
+        """IDs of the spots `search` would return, without copying the spots."""
+        with self._lock:
+            sets = [self.available if candidates is None else set(candidates)]
+            if vehicle_type:
+                sets.append(self._match(self.by_vehicle, vehicle_type))
+            if location:
+                sets.append(self._match(self.by_location, location))
+            if slot_type:
+                sets.append(self._match(self.by_slot_type, slot_type))
+            sets.sort(key=len)
+            return sets[0].intersection(*sets[1:]) if len(sets) > 1 else set(sets[0])
+
+    def iter_sorted(self, ids: Set[int], sort_by: str = "id", after: Optional[tuple] = None) -> Iterator[int]:
+        """
+        Yields `ids` in `sort_by` order, starting after the key `after` (keyset pagination).
+        A small `ids` is sorted directly; otherwise the presorted ordering is walked from `after`.
+        """
+        keys, order = self.orderings.get(sort_by, ([], []))
+        if len(ids) * 16 < len(order):
+            sort_key = SORT_KEYS[sort_by]
+            keyed = sorted((sort_key(self.spots[spot_id]), spot_id) for spot_id in ids if spot_id in self.spots)
+            yield from (spot_id for key, spot_id in keyed if after is None or key > after)
+            return
+        start = 0 if after is None else bisect_right(keys, after)
+        for position in range(start, len(order)):
+            if order[position] in ids:
+                yield order[position]
+
+    def accepts(self, vehicle_type: Optional[str] = None, slot_type: Optional[str] = None) -> Callable[[int], bool]:
+        """Per-spot form of `search`: a predicate that is true for available spots matching the filters."""
+        with self._lock:
+            sets = [self.available]
+            if vehicle_type:
+                sets.append(self._match(self.by_vehicle, vehicle_type))
+            if slot_type:
+                sets.append(self._match(self.by_slot_type, slot_type))
+        return lambda spot_id: all(spot_id in ids for ids in sets)
+
+    def location_ids(self, location: str) -> Set[int]:
+        """IDs of all spots (available or not) whose location contains `location`. Do not mutate."""
+        with self._lock:
+            return self._match(self.by_location, location)
+
+    def vocabulary(self) -> Dict[str, List[str]]:
+        """Distinct (normalized) filter values of all spots, per search slot."""
+        with self._lock:
+            return {
+                "location": sorted(self.by_location),
+                "slot_type": sorted(self.by_slot_type),
+                "vehicle_type": sorted(self.by_vehicle),
+            }
+
+    def get(self, spot_id: int) -> Optional[dict]:
+        with self._lock:
+            spot = self.spots.get(spot_id)
+            return dict(spot, is_available=spot_id in self.available) if spot else None
+
+    def mark_unavailable(self, spot_id: int) -> None:
+        with self._lock:
+            self.available.discard(spot_id)
+            if spot_id in self.spots:
+                self.spots[spot_id]["is_available"] = False
+
+    def mark_available(self, spot_id: int) -> None:
+        with self._lock:
+            if spot_id in self.spots:
+                self.available.add(spot_id)
+                self.spots[spot_id]["is_available"] = True
+
+    def mark_all_available(self) -> None:
+        with self._lock:
+            self.available = set(self.spots)
+            for spot in self.spots.values():
+                spot["is_available"] = True
+            if self._version is not None:  # the reset this process made is not a reason to rebuild
+                self._version = self._version[:2] + (len(self.spots),)
+
+
+# Shared by all API workers in this process
+availability_index = AvailabilityIndex()
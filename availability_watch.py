@@ -0,0 +1,48 @@
+# availability_watch.py
+"""
+Agent-side view of the API's availability events (see availability_events). The tool transport
+feeds events in, from the in-process bus or the API's SSE stream; the agent uses the recent
+bookings to drop cached results and to warn the user about listed spots that were just taken.
+Whether a booking succeeds is always decided by the API.
+"""
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List
+
+WATCH_HISTORY_SIZE = int(os.getenv("WATCH_HISTORY_SIZE", "1000"))
+
+
+class AvailabilityWatch:
+    """
+    Recent "booked" events, numbered in the order this process received them. A caller notes
+    `received` when it shows spots and later asks which of them were booked after that point.
+    """
+
+    def __init__(self, history_size: int = WATCH_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self.received = 0
+        self._booked: deque = deque(maxlen=history_size)  # (received number, event)
+        self._callbacks: List[Callable[[dict], None]] = []
+
+    def on_event(self, callback: Callable[[dict], None]) -> None:
+        self._callbacks.append(callback)
+
+    def handle(self, event: dict) -> None:
+        with self._lock:
+            self.received += 1
+            if event["type"] == "booked":
+                self._booked.append((self.received, event))
+            else:
+                # reset: nothing is booked any more; resync: we cannot tell what was missed
+                self._booked.clear()
+        for callback in self._callbacks:
+            callback(event)
+
+    def booked_since(self, listed: Dict[int, int], exclude_bookings: Iterable[int] = ()) -> List[dict]:
+        """Bookings of spots in `listed` (spot id -> `received` when shown) made after they were shown."""
+        exclude = set(exclude_bookings)
+        with self._lock:
+            return [event for number, event in self._booked
+                    if event["spot_id"] in listed and number > listed[event["spot_id"]]
+                    and event["booking_id"] not in exclude]
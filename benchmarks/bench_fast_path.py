@@ -0,0 +1,79 @@
+# benchmarks/bench_fast_path.py
+"""
+Hit rate and extraction latency of the fast-path extractor over sample user messages,
+using the seed vocabulary (no database or LLM needed). Live hit rate and latency saved are
+reported by `fast_path.fast_path_stats.stats()` (shown in the Streamlit sidebar).
+
+    python -m benchmarks.bench_fast_path --agent-turn-ms 4000
+"""
+import argparse
+import statistics
+import time
+from collections import Counter
+from datetime import datetime
+
+import fast_path
+
+SEED_VOCABULARY = {
+    "location": {"downtown", "airport", "mall"},
+    "slot_type": {"covered", "open", "long-term", "compact"},
+    "vehicle_type": {"car", "two-wheeler", "suv"},
+}
+
+PRIOR = [{"role": "user", "content": "find parking for my car downtown"}]
+
+SAMPLES = [
+    # Fully specified: expected to be answered without the LLM
+    ("find covered parking for my car at the airport", None),
+    ("I need parking for my suv at the airport", None),
+    ("any open spots for two wheelers downtown?", None),
+    ("show me compact parking for a car at the mall", None),
+    ("find parking for my bike at the mall tomorrow 9am for 3 hours", None),
+    ("looking for covered parking downtown for my car tomorrow from 10am to 1pm", None),
+    ("book spot 3 tomorrow 2pm to 4pm", PRIOR),
+    ("book spot #1 tomorrow 10:00 - 12:30 for my car", None),
+    ("reserve spot 4 on saturday 6pm to 9pm for my car", None),
+    ("i want long term parking for my suv at the airport", None),
+    # Needs the agent
+    ("hello", None),
+    ("find parking downtown", None),
+    ("book spot 2", None),
+    ("what's the cheapest covered spot downtown?", None),
+    ("book spot 3 at 2pm", PRIOR),
+    ("car or suv parking at the mall", None),
+    ("cancel my booking", None),
+    ("thanks!", None),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="Timing iterations per message")
+    parser.add_argument("--agent-turn-ms", type=float, default=None,
+                        help="Measured agent turn latency, to estimate the time saved per hit")
+    args = parser.parse_args()
+
+    gazetteer = fast_path.Gazetteer(SEED_VOCABULARY)
+    now = datetime.now().replace(hour=8, minute=0)
+    reasons = Counter()
+    samples_us = []
+    for text, history in SAMPLES:
+        match, reason = fast_path.extract(text, gazetteer, history, now)
+        hit = match is not None and match.confidence >= fast_path.FAST_PATH_MIN_CONFIDENCE
+        reasons["hit" if hit else reason] += 1
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            fast_path.extract(text, gazetteer, history, now)
+        samples_us.append((time.perf_counter() - started) / args.repeat * 1e6)
+        print(f"{'HIT ' if hit else 'miss'}  {text!r:80} {match.args if hit else reason}")
+
+    hits = reasons.pop("hit", 0)
+    print(f"\nhit rate: {hits}/{len(SAMPLES)} ({hits / len(SAMPLES):.0%}); misses: {dict(reasons)}")
+    print(f"extraction: mean {statistics.fmean(samples_us):.1f} us, max {max(samples_us):.1f} us per message")
+    if args.agent_turn_ms is not None:
+        print(f"estimated agent time avoided: {hits * args.agent_turn_ms / 1000:.1f} s "
+              f"over {len(SAMPLES)} messages ({args.agent_turn_ms:.0f} ms per agent turn)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_memory_partitioning.py
+"""
+Conversation-memory retrieval latency as the number of users grows.
+
+Backends:
+  standin  In-memory Milvus stand-in. Compares the old JSON-metadata filter over the whole
+           collection with the user_id partition-key filter, and reports rows visited per
+           search (the stand-in models partition pruning; absolute times are not Milvus times).
+  local    The embedded LocalVectorStore (real files under a temp directory).
+
+    python -m benchmarks.bench_memory_partitioning --backend local --users 10,100,1000,10000,100000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import standins
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return statistics.fmean(samples), samples[len(samples) // 2], samples[max(int(len(samples) * 0.95) - 1, 0)]
+
+
+def _random_vectors(rng, n):
+    vectors = rng.standard_normal((n, standins.EMBEDDING_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["standin", "local"], default="local")
+    parser.add_argument("--users", default="10,100,1000,10000,100000")
+    parser.add_argument("--turns-per-user", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.users.split(",")]
+    if args.backend == "local":
+        os.environ["MEMORY_BACKEND"] = "local"
+        os.environ["LOCAL_MEMORY_DIR"] = tempfile.mkdtemp(prefix="parking_memory_bench_")
+    server = standins.install_pymilvus_standin()
+    standins.install_sentence_transformers_standin()
+    import milvus_utils
+
+    backend = milvus_utils.get_memory_backend()
+    legacy = None
+    if args.backend == "standin":
+        pm = __import__("pymilvus")
+        legacy = pm.Collection(milvus_utils.LEGACY_COLLECTION_NAME, schema=pm.CollectionSchema([
+            pm.FieldSchema("id", pm.DataType.INT64, is_primary=True, auto_id=True),
+            pm.FieldSchema("text", pm.DataType.VARCHAR),
+            pm.FieldSchema("metadata", pm.DataType.JSON),
+            pm.FieldSchema("embedding", pm.DataType.FLOAT_VECTOR),
+        ]))
+
+    rng = np.random.default_rng(args.seed)
+    picker = random.Random(args.seed)
+    users_loaded = 0
+    print(f"backend={args.backend} turns/user={args.turns_per_user} queries/level={args.queries}")
+    header = f"{'users':>8} {'rows':>9} {'case':18} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}"
+    print(header + (f" {'rows visited':>13}" if legacy is not None else ""))
+    for level in levels:
+        # Grow the store to `level` users
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch_users = range(users_loaded, level)
+            texts, metadatas = [], []
+            for u in batch_users:
+                for t in range(args.turns_per_user):
+                    texts.append(f"user {u} turn {t}")
+                    metadatas.append({"user_id": f"user_{u}", "role": "user", "timestamp": f"{t:06d}"})
+            for start in range(0, len(texts), 5000):
+                chunk = slice(start, start + 5000)
+                vectors = _random_vectors(rng, len(texts[chunk]))
+                backend.add_turns(texts[chunk], metadatas[chunk], vectors.tolist())
+                if legacy is not None:
+                    legacy.insert([texts[chunk], metadatas[chunk], vectors.tolist()])
+            users_loaded = level
+
+        cases = [("partitioned", lambda uid, q: backend.search_turns(uid, q, 3))]
+        if legacy is not None:
+            cases.insert(0, ("json filter", lambda uid, q: legacy.search(
+                data=[q], anns_field="embedding", param={}, limit=3,
+                expr=f"metadata['user_id'] == '{uid}'", output_fields=["text", "metadata"])))
+        queries = [(f"user_{picker.randrange(level)}", _random_vectors(rng, 1)[0].tolist()) for _ in range(args.queries)]
+        for name, search in cases:
+            server.rows_scanned = 0
+            samples = []
+            for uid, q in queries:
+                began = time.perf_counter()
+                search(uid, q)
+                samples.append((time.perf_counter() - began) * 1000)
+            mean, p50, p95 = _percentiles(samples)
+            line = f"{level:8d} {level * args.turns_per_user:9d} {name:18} {mean:9.3f} {p50:9.3f} {p95:9.3f}"
+            if legacy is not None:
+                line += f" {server.rows_scanned / len(queries):13.0f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_milvus_client.py
+"""
+Per-call latency of conversation-memory inserts and searches, comparing the old
+connect + has_collection + load on every call with the cached MilvusMemoryStore handle.
+Runs against the in-memory Milvus stand-in with a simulated per-RPC latency.
+
+    python -m benchmarks.bench_milvus_client --calls 200 --rpc-ms 1.0
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from benchmarks import standins
+
+
+def _time_calls(fn, calls):
+    samples = []
+    for i in range(calls):
+        began = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - began) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--rpc-ms", type=float, default=1.0, help="Simulated latency of each Milvus RPC")
+    args = parser.parse_args()
+
+    server = standins.install_pymilvus_standin(args.rpc_ms)
+    standins.install_sentence_transformers_standin()
+    import milvus_utils
+
+    vector = standins.HashingSentenceTransformer().encode("find parking downtown").tolist()
+    metadata = {"user_id": "bench_user", "role": "user", "timestamp": "2030-01-01T00:00:00"}
+    milvus_utils.create_milvus_collection_if_not_exists()
+
+    def old_insert(i):
+        collection = milvus_utils.create_milvus_collection_if_not_exists()
+        collection.insert([["bench_user"], ["find parking downtown"], [metadata], [vector]])
+
+    def old_search(i):
+        collection = milvus_utils.create_milvus_collection_if_not_exists()
+        collection.search(data=[vector], anns_field=milvus_utils.INDEX_FIELD_NAME, param={}, limit=3,
+                          expr="metadata['user_id'] == 'bench_user'", output_fields=["text", "metadata"])
+
+    def new_insert(i):
+        milvus_utils.store_conversation_turn("find parking downtown", metadata, embedding=vector)
+
+    def new_search(i):
+        milvus_utils.retrieve_relevant_history("find parking downtown", "bench_user", top_k=3, query_embedding=vector)
+
+    results = {}
+    for name, fn in [("insert (reconnect per call)", old_insert), ("search (reconnect per call)", old_search),
+                     ("insert (cached handle)", new_insert), ("search (cached handle)", new_search)]:
+        server.rpcs.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = _time_calls(fn, args.calls)
+        results[name]["rpcs_per_call"] = sum(server.rpcs.values()) / args.calls
+
+    print(f"{args.calls} calls per case, {args.rpc_ms} ms simulated per RPC")
+    print(f"{'case':32} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'RPCs/call':>10}")
+    for name, r in results.items():
+        print(f"{name:32} {r['mean_ms']:9.3f} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} {r['rpcs_per_call']:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
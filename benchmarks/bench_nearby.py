@@ -0,0 +1,74 @@
+# benchmarks/bench_nearby.py
+"""
+Latency of `spatial_index.SpatialIndex.nearest` at city scale, checked against a brute-force
+scan of the same spots (no database needed). Half the spots are "booked" (rejected by the
+filter), and queries mix k-nearest, radius, and distance-plus-price ranking.
+
+    python -m benchmarks.bench_nearby --spots 100000 --queries 1000
+"""
+import argparse
+import math
+import random
+import statistics
+import time
+
+from spatial_index import SpatialIndex
+
+CITY_CENTER = (12.9716, 77.5946)
+CITY_SPAN_DEGREES = 0.3  # roughly 30 km across
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spots", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--cell-meters", type=float, default=None, help="Grid cell size (default SPATIAL_CELL_METERS)")
+    parser.add_argument("--verify", type=int, default=100, help="Queries checked against brute force")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    def random_point():
+        return (CITY_CENTER[0] + rng.uniform(-0.5, 0.5) * CITY_SPAN_DEGREES,
+                CITY_CENTER[1] + rng.uniform(-0.5, 0.5) * CITY_SPAN_DEGREES)
+
+    coordinates = {spot_id: random_point() for spot_id in range(1, args.spots + 1)}
+    prices = {spot_id: rng.uniform(2, 20) for spot_id in coordinates}
+    free = set(rng.sample(sorted(coordinates), args.spots // 2))
+
+    index = SpatialIndex() if args.cell_meters is None else SpatialIndex(args.cell_meters)
+    started = time.perf_counter()
+    index.build(coordinates)
+    print(f"build: {(time.perf_counter() - started) * 1000:.0f} ms for {args.spots} spots")
+
+    samples_ms = []
+    mismatches = 0
+    for i in range(args.queries):
+        lat, lon = random_point()
+        radius_m = rng.choice([None, 500, 2000])
+        price_weight = rng.choice([0, 50])
+        cost = (lambda spot_id, distance: distance + price_weight * prices[spot_id]) if price_weight else None
+        started = time.perf_counter()
+        result = index.nearest(lat, lon, k=args.k, radius_m=radius_m, accept=free.__contains__, cost=cost)
+        samples_ms.append((time.perf_counter() - started) * 1000)
+        if i < args.verify:
+            qx, qy = index._project(lat, lon)
+            expected = []
+            for spot_id in free:
+                px, py = index._project(*coordinates[spot_id])
+                distance = math.hypot(px - qx, py - qy)
+                if radius_m is None or distance <= radius_m:
+                    expected.append((distance + price_weight * prices[spot_id], spot_id))
+            expected = [spot_id for _, spot_id in sorted(expected)[:args.k]]
+            mismatches += [spot_id for spot_id, _ in result] != expected
+
+    samples_ms.sort()
+    print(f"nearest: mean {statistics.fmean(samples_ms):.3f} ms, p50 {samples_ms[len(samples_ms) // 2]:.3f} ms, "
+          f"p99 {samples_ms[int(len(samples_ms) * 0.99) - 1]:.3f} ms over {args.queries} queries")
+    print(f"brute-force check: {min(args.verify, args.queries) - mismatches}/{min(args.verify, args.queries)} identical")
+
+
+if __name__ == "__main__":
+    main()
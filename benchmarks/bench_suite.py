@@ -0,0 +1,392 @@
+# benchmarks/bench_suite.py
+"""
+Load and latency benchmark for the parking API and the agent pipeline, fully in-process:
+no Ollama, no Milvus, no network.
+
+API       `main.app` through FastAPI's TestClient: search (with and without a time window),
+          paginated search, nearby search, booking and reset, from --concurrency threads.
+          Nearby search mixes k-nearest queries at random points with radius queries around
+          the seeded location clusters.
+Pipeline  `agent_logic.process_user_query` end to end with a stub LLM (one search tool call,
+          then an answer), the in-memory Milvus stand-in and hashing embeddings. Each stage
+          (embedding, memory store, retrieval, LLM calls, tool calls) is timed separately.
+
+The database is a fresh SQLite file seeded with --spots spots and --bookings bookings.
+Results are written as JSON; --compare prints the change against an earlier results file.
+
+    python -m benchmarks.bench_suite --spots 5000 --bookings 20000 --requests 2000 --turns 200
+    python -m benchmarks.bench_suite --compare benchmarks/results/bench-20260101T000000Z.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks import standins
+
+LOCATIONS = ["downtown", "airport", "mall", "stadium", "station", "harbor", "university", "hospital"]
+SPOT_TYPES = ["covered", "open", "compact", "long-term"]
+VEHICLE_TYPES = ["car", "two-wheeler", "suv"]
+CITY_CENTER = (12.9716, 77.5946)
+CITY_SPAN_DEGREES = 0.3  # roughly 30 km across
+
+
+# --- Timing ---
+class StageTimer:
+    """Thread-safe latency samples per stage."""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[stage].append(seconds * 1000)
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return timed
+
+    def summary(self, wall_seconds: dict) -> dict:
+        with self._lock:
+            return {stage: summarize(samples, wall_seconds.get(stage)) for stage, samples in self._samples.items()}
+
+
+def percentile(sorted_samples, pct: float) -> float:
+    # Nearest-rank percentile
+    index = max(int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1, 0)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+def summarize(samples, wall_seconds=None) -> dict:
+    samples = sorted(samples)
+    result = {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+    if wall_seconds:
+        result["throughput_per_s"] = round(len(samples) / wall_seconds, 1)
+    return result
+
+
+# --- Seeding ---
+def seed_database(spots: int, bookings: int, rng: random.Random) -> None:
+    """Creates the schema and bulk-inserts spots and non-overlapping bookings (before `main` is imported)."""
+    import database
+    # Each location is a cluster about 2 km wide somewhere in the city
+    centers = {name: (CITY_CENTER[0] + rng.uniform(-0.5, 0.5) * CITY_SPAN_DEGREES,
+                      CITY_CENTER[1] + rng.uniform(-0.5, 0.5) * CITY_SPAN_DEGREES) for name in LOCATIONS}
+    rows = [{
+        "location": LOCATIONS[i % len(LOCATIONS)],
+        "spot_type": SPOT_TYPES[rng.randrange(len(SPOT_TYPES))],
+        "vehicle_type_allowed": VEHICLE_TYPES[rng.randrange(len(VEHICLE_TYPES))],
+        "is_available": True,
+        "price_per_hour": round(rng.uniform(2, 20), 2),
+        "latitude": centers[LOCATIONS[i % len(LOCATIONS)]][0] + rng.gauss(0, 0.005),
+        "longitude": centers[LOCATIONS[i % len(LOCATIONS)]][1] + rng.gauss(0, 0.005),
+    } for i in range(spots)]
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    # Bookings are laid out back to back per spot so they never overlap
+    next_free = {}
+    booking_rows = []
+    for _ in range(bookings):
+        spot_id = rng.randrange(1, spots + 1)
+        start = next_free.get(spot_id, now - timedelta(hours=rng.randrange(0, 48)))
+        end = start + timedelta(hours=rng.randrange(1, 5))
+        next_free[spot_id] = end + timedelta(hours=rng.randrange(0, 6))
+        spot = rows[spot_id - 1]
+        booking_rows.append({
+            "spot_id": spot_id, "user_id": "bench", "vehicle_type": spot["vehicle_type_allowed"],
+            "location": spot["location"], "slot_type": spot["spot_type"], "start_time": start, "end_time": end,
+            "total_price": (end - start).total_seconds() / 3600 * spot["price_per_hour"],
+        })
+    with database.engine.begin() as conn:
+        conn.execute(database.ParkingSpot.__table__.insert(), rows)
+        if booking_rows:
+            conn.execute(database.Booking.__table__.insert(), booking_rows)
+
+
+# --- API scenarios ---
+def _run_concurrently(timer, stage, make_call, requests, concurrency):
+    clients = threading.local()
+
+    def one(i):
+        if not hasattr(clients, "client"):
+            from fastapi.testclient import TestClient
+            import main
+            clients.client = TestClient(main.app)
+        started = time.perf_counter()
+        status = make_call(clients.client, i)
+        timer.add(stage, time.perf_counter() - started)
+        return status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(one, range(requests)))
+    return time.perf_counter() - started, statuses
+
+
+def run_api(timer, args, rng) -> dict:
+    wall, outcomes = {}, {}
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    search_filters = [{"vehicle_type": rng.choice(VEHICLE_TYPES), "location": rng.choice(LOCATIONS),
+                       "slot_type": rng.choice(SPOT_TYPES + [None])} for _ in range(args.requests)]
+
+    def search(client, i):
+        return client.post("/get-parking-spots", json=search_filters[i]).status_code
+
+    def search_window(client, i):
+        start = now + timedelta(hours=i % 72)
+        payload = dict(search_filters[i], start_time=start.isoformat(), end_time=(start + timedelta(hours=2)).isoformat())
+        return client.post("/get-parking-spots", json=payload).status_code
+
+    def search_page(client, i):
+        payload = dict(search_filters[i], sort_by="price", limit=20, include_total=True)
+        return client.post("/get-parking-spots/page", json=payload).status_code
+
+    def nearby(client, i):
+        payload = {"vehicle_type": search_filters[i]["vehicle_type"], "k": 5}
+        if i % 2:
+            payload.update(near_location=search_filters[i]["location"], radius_m=1000)
+        else:
+            payload.update(latitude=CITY_CENTER[0] + rng.uniform(-0.5, 0.5) * CITY_SPAN_DEGREES,
+                           longitude=CITY_CENTER[1] + rng.uniform(-0.5, 0.5) * CITY_SPAN_DEGREES)
+        return client.post("/get-parking-spots/nearby", json=payload).status_code
+
+    def quote(client, i):
+        windows = [{"start_time": (now + timedelta(hours=h)).isoformat(),
+                    "end_time": (now + timedelta(hours=h + 2 + i % 6)).isoformat()} for h in range(0, 72, 12)]
+        return client.post("/quote", json=dict(search_filters[i], windows=windows, limit=20)).status_code
+
+    def book(client, i):
+        start = now + timedelta(days=3, hours=rng.randrange(0, 24 * 14))
+        return client.post("/book-parking", json={
+            "spot_id": rng.randrange(1, args.spots + 1), "vehicle_type": "car",
+            "start_time": start.isoformat(), "end_time": (start + timedelta(hours=2)).isoformat(),
+        }).status_code
+
+    def reset(client, i):
+        return client.post("/admin/reset-availability").status_code
+
+    scenarios = [("api.search", search, args.requests), ("api.search_window", search_window, args.requests),
+                 ("api.search_page", search_page, args.requests), ("api.nearby", nearby, args.requests),
+                 ("api.quote", quote, args.requests), ("api.book", book, args.requests), ("api.reset", reset, args.resets)]
+    for stage, call, count in scenarios:
+        concurrency = 1 if stage == "api.reset" else args.concurrency
+        wall[stage], statuses = _run_concurrently(timer, stage, call, count, concurrency)
+        outcomes[stage] = {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    return {"wall_seconds": wall, "status_codes": outcomes}
+
+
+# --- Agent pipeline ---
+def make_stub_llm(timer, llm_ms: float):
+    """Chat model that searches once with slots read from the question, then answers."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessageChunk, ToolMessage
+    from langchain_core.outputs import ChatGenerationChunk, ChatResult, ChatGeneration
+    from langchain_core.messages import AIMessage
+    import fast_path
+
+    gazetteer = fast_path.Gazetteer({"location": set(LOCATIONS), "slot_type": set(SPOT_TYPES),
+                                     "vehicle_type": set(VEHICLE_TYPES)})
+
+    class StubChatModel(BaseChatModel):
+        @property
+        def _llm_type(self):
+            return "bench-stub"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def bind(self, **kwargs):
+            return self
+
+        def _reply(self, messages):
+            started = time.perf_counter()
+            if llm_ms:
+                time.sleep(llm_ms / 1000)
+            if isinstance(messages[-1], ToolMessage):
+                message = AIMessageChunk(content="Here are the spots I found. Which one would you like to book?")
+            else:
+                found = gazetteer.find(str(messages[-1].content).lower())
+                tool_args = {"vehicle_type": next(iter(found.get("vehicle_type", {"car"}))),
+                             "location": next(iter(found.get("location", {"downtown"})))}
+                message = AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": "search_parking_spots", "args": json.dumps(tool_args), "id": "call-1", "index": 0}])
+            timer.add("pipeline.llm_call", time.perf_counter() - started)
+            return message
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            message = self._reply(messages)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(
+                content=message.content, tool_calls=message.tool_calls))])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            yield ChatGenerationChunk(message=self._reply(messages))
+
+    return StubChatModel()
+
+
+def run_pipeline(timer, args, rng) -> dict:
+    import agent_logic, embeddings, memory_writer, response_cache
+    agent_logic._llm = make_stub_llm(timer, args.llm_ms)
+    embeddings.embed_text = timer.wrap("pipeline.embed_query", embeddings.embed_text)
+    memory_writer.store_turn = timer.wrap("pipeline.memory_store", memory_writer.store_turn)
+    memory_writer.retrieve_relevant_history = timer.wrap("pipeline.memory_retrieve",
+                                                          memory_writer.retrieve_relevant_history)
+    transport = agent_logic.get_transport()
+    transport.post = timer.wrap("pipeline.tool_api_call", transport.post)
+    agent_logic.get_agent_executor().verbose = False
+
+    templates = ["is there {slot} parking for my {vehicle} at the {location}?",
+                 "what would you suggest for a {vehicle} near the {location}, {slot} preferred",
+                 "compare {slot} options at the {location} for my {vehicle}"]
+    histories = defaultdict(list)
+
+    def turn(i):
+        session_id = f"bench-session-{i % args.sessions}"
+        query = rng.choice(templates).format(slot=rng.choice(SPOT_TYPES), vehicle=rng.choice(VEHICLE_TYPES),
+                                             location=rng.choice(LOCATIONS))
+        history = histories[session_id]
+        history.append({"role": "user", "content": query})
+        started = time.perf_counter()
+        answer = agent_logic.process_user_query(query, history, session_id, f"bench-user-{i % args.sessions}")
+        timer.add("pipeline.turn", time.perf_counter() - started)
+        history.append({"role": "assistant", "content": answer})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(args.sessions, args.concurrency)) as pool:
+        # Turns of one session run in order; sessions run in parallel
+        by_session = defaultdict(list)
+        for i in range(args.turns):
+            by_session[i % args.sessions].append(i)
+        list(pool.map(lambda turns: [turn(i) for i in turns], by_session.values()))
+    wall = time.perf_counter() - started
+    memory_writer.memory_writer.flush(10)
+    return {"wall_seconds": {"pipeline.turn": wall}, "memory_writer": memory_writer.memory_writer.stats(),
+            "caches": response_cache.stats()}
+
+
+# --- Results ---
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(current: dict, baseline: dict, threshold_pct: float) -> int:
+    regressions = 0
+    print(f"\n{'stage':28} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    for stage, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before is None:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            flag = "!" if change > threshold_pct else " "
+            regressions += change > threshold_pct
+            cells.append(f"{before[key]:7.2f}->{now[key]:7.2f}{flag}")
+        print(f"{stage:28} {cells[0]:>18} {cells[1]:>18} {cells[2]:>18}")
+    print(f"{regressions} percentile(s) slower than baseline by more than {threshold_pct}% (marked !)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spots", type=int, default=2000, help="Parking spots to seed")
+    parser.add_argument("--bookings", type=int, default=10000, help="Existing bookings to seed")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per API scenario")
+    parser.add_argument("--resets", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=200, help="Agent pipeline turns")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent chat sessions in the pipeline")
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="Simulated latency per stub LLM call")
+    parser.add_argument("--skip", choices=["api", "pipeline"], action="append", default=[])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Results file (default benchmarks/results/bench-<UTC time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=10.0, help="Percent slowdown flagged")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="parking_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'parking_data.db')}"
+    os.environ["PARKING_TOOL_TRANSPORT"] = "inprocess"
+    os.environ["MEMORY_BACKEND"] = "milvus"  # the in-memory stand-in below
+    # The pipeline measures the agent path, so the shortcuts that bypass it are off
+    os.environ["FAST_PATH_ENABLED"] = "false"
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+    os.environ["WARMUP_MODE"] = "off"
+    standins.install_pymilvus_standin()
+    standins.install_sentence_transformers_standin()
+
+    rng = random.Random(args.seed)
+    timer = StageTimer()
+    results = {"meta": {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "args": vars(args),
+    }}
+    began = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed_database(args.spots, args.bookings, rng)
+    timer.add("setup.seed_database", time.perf_counter() - began)
+
+    wall = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if "api" not in args.skip:
+            api = run_api(timer, args, rng)
+            wall.update(api["wall_seconds"])
+            results["api_status_codes"] = api["status_codes"]
+        if "pipeline" not in args.skip:
+            pipeline = run_pipeline(timer, args, rng)
+            wall.update(pipeline["wall_seconds"])
+            results["memory_writer"] = pipeline["memory_writer"]
+            results["caches"] = pipeline["caches"]
+    results["stages"] = timer.summary(wall)
+
+    print(f"{'stage':28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    for stage, r in results["stages"].items():
+        throughput = r.get("throughput_per_s", "")
+        print(f"{stage:28} {r['count']:7} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} {r['p99_ms']:9.3f} {throughput:>9}")
+    if "api_status_codes" in results:
+        print(f"status codes: {results['api_status_codes']}")
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results",
+                                         f"bench-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f), args.regression_threshold)
+
+
+if __name__ == "__main__":
+    main()
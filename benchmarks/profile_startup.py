@@ -0,0 +1,109 @@
+# benchmarks/profile_startup.py
+"""
+Import-time and startup profile of the app modules.
+
+1. Imports each module in a fresh interpreter under `python -X importtime` and reports the
+   module's total import time plus its slowest dependencies.
+2. Imports agent_logic in this process, runs the warm-up steps (embedding model, memory
+   backend, agent executor) and prints the startup profile they recorded.
+
+    python -m benchmarks.profile_startup
+    python -m benchmarks.profile_startup --standins --json startup_profile.json
+
+--standins swaps in the in-memory Milvus and hashing-embedding stand-ins, for machines
+without pymilvus/sentence-transformers (their load times are then not representative).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODULES = ["embeddings", "milvus_utils", "agent_logic", "main"]
+STANDIN_PRELUDE = ("from benchmarks import standins; standins.install_pymilvus_standin(); "
+                   "standins.install_sentence_transformers_standin(); ")
+
+
+def parse_importtime(stderr: str):
+    """Rows of (self_us, cumulative_us, depth, module) from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def profile_import(module: str, standins: bool, top: int) -> dict:
+    prelude = STANDIN_PRELUDE if standins else ""
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"{prelude}import {module}"],
+                          capture_output=True, text=True, env=env)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+    rows = parse_importtime(proc.stderr)
+    target = next((r for r in reversed(rows) if r[3] == module and r[2] <= 1), None)
+    # Direct dependencies of the target are the most useful unit to act on
+    deps = sorted((r for r in rows if r[2] <= 2 and r[3] != module), key=lambda r: r[1], reverse=True)
+    return {
+        "module": module,
+        "import_ms": round(target[1] / 1000, 1) if target else None,
+        "process_wall_ms": round(wall_ms, 1),
+        "slowest_imports": [{"module": r[3], "cumulative_ms": round(r[1] / 1000, 1)} for r in deps[:top]],
+    }
+
+
+def profile_warmup(standins: bool) -> dict:
+    if standins:
+        from benchmarks import standins as stand_ins
+        stand_ins.install_pymilvus_standin()
+        stand_ins.install_sentence_transformers_standin()
+    from startup import startup_profile
+    started = time.perf_counter()
+    import agent_logic
+    startup_profile.record("import agent_logic", time.perf_counter() - started)
+    agent_logic.warm_up(mode="blocking")
+    started = time.perf_counter()
+    agent_logic.embeddings.embed_text("find parking downtown after warm-up")
+    startup_profile.record("first embed after warm-up", time.perf_counter() - started)
+    return {"steps": startup_profile.steps(), "report": startup_profile.report()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(MODULES))
+    parser.add_argument("--top", type=int, default=8, help="Slowest dependencies to list per module")
+    parser.add_argument("--standins", action="store_true")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    imports = [profile_import(m, args.standins, args.top) for m in args.modules.split(",")]
+    for result in imports:
+        if "error" in result:
+            print(f"\nimport {result['module']}: failed ({result['error']})")
+            continue
+        print(f"\nimport {result['module']}: {result['import_ms']} ms "
+              f"(fresh interpreter: {result['process_wall_ms']} ms wall)")
+        for dep in result["slowest_imports"]:
+            print(f"  {dep['cumulative_ms']:9.1f} ms  {dep['module']}")
+
+    os.environ.setdefault("MEMORY_BACKEND", "local")  # no Milvus server needed for the warm-up profile
+    if os.environ["MEMORY_BACKEND"] == "local":
+        import tempfile
+        os.environ.setdefault("LOCAL_MEMORY_DIR", tempfile.mkdtemp(prefix="parking_startup_profile_"))
+    warmup = profile_warmup(args.standins)
+    print("\nStartup profile (lazy initialization, warm-up in blocking mode):")
+    print(warmup["report"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"imports": imports, "warmup": warmup["steps"]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# benchmarks/standins.py
+"""
+Local stand-ins so the benchmarks run without a Milvus server or model downloads.
+They are installed into `sys.modules` by the benchmark scripts before the app modules
+are imported; nothing in the application imports this file.
+"""
+import re
+import sys
+import time
+import types
+import zlib
+from collections import Counter
+
+import numpy as np
+
+EMBEDDING_DIM = 384
+
+
+class StandinServer:
+    """In-memory "Milvus server": named collections plus a per-RPC latency and call counter."""
+
+    def __init__(self, rpc_latency_ms: float = 0.0):
+        self.rpc_latency = rpc_latency_ms / 1000
+        self.collections = {}
+        self.rpcs = Counter()
+        self.rows_scanned = 0
+
+    def rpc(self, name: str):
+        self.rpcs[name] += 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+
+_EXPR_TERM = re.compile(r"""(?:metadata\[['"](\w+)['"]\]|(\w+))\s*==\s*['"]([^'"]*)['"]""")
+_EXPR_ID_FLOOR = re.compile(r"\bid\s*(>=?)\s*(-?\d+)")
+
+
+def _matches(terms, row):
+    for json_key, field, value in terms:
+        actual = row["metadata"].get(json_key) if json_key else row.get(field)
+        if str(actual) != value:
+            return False
+    return True
+
+
+class _Entity(dict):
+    pass
+
+
+class _Hit:
+    def __init__(self, row, distance, output_fields):
+        self.id = row["id"]
+        self.distance = distance
+        self.entity = _Entity({f: row.get(f) for f in output_fields or []})
+
+
+def install_pymilvus_standin(rpc_latency_ms: float = 0.0) -> StandinServer:
+    server = StandinServer(rpc_latency_ms)
+
+    class MilvusException(Exception):
+        pass
+
+    class DataType:
+        INT64, VARCHAR, JSON, FLOAT_VECTOR = "INT64", "VARCHAR", "JSON", "FLOAT_VECTOR"
+
+    class FieldSchema:
+        def __init__(self, name, dtype, **kwargs):
+            self.name, self.dtype, self.params = name, dtype, kwargs
+
+    class CollectionSchema:
+        def __init__(self, fields, description="", **kwargs):
+            self.fields, self.description, self.params = fields, description, kwargs
+
+    class _InsertResult:
+        def __init__(self, keys):
+            self.primary_keys = keys
+            self.insert_count = len(keys)
+
+    class Collection:
+        def __init__(self, name, schema=None, **kwargs):
+            server.rpc("describe_collection" if schema is None else "create_collection")
+            if name not in server.collections:
+                if schema is None:
+                    raise MilvusException(f"collection {name} not found")
+                field_names = [f.name for f in schema.fields]
+                partition_key = next((f.name for f in schema.fields if f.params.get("is_partition_key")), None)
+                server.collections[name] = {
+                    "fields": field_names, "rows": [], "next_id": 1,
+                    # Partition-key collections hash rows into buckets like Milvus does
+                    "partition_key": partition_key,
+                    "num_partitions": kwargs.get("num_partitions", 16) if partition_key else 1,
+                    "partitions": {},
+                }
+            self.name = name
+            self._state = server.collections[name]
+
+        def create_index(self, field_name, index_params=None, **kwargs):
+            server.rpc("create_index")
+
+        def load(self, **kwargs):
+            server.rpc("load")
+
+        def flush(self, **kwargs):
+            server.rpc("flush")
+
+        @property
+        def num_entities(self):
+            server.rpc("num_entities")
+            return len(self._state["rows"])
+
+        def _data_fields(self):
+            return [f for f in self._state["fields"] if f != "id"]
+
+        def insert(self, data, **kwargs):
+            server.rpc("insert")
+            if data and isinstance(data[0], dict):
+                rows = [dict(r) for r in data]
+            else:
+                rows = [dict(zip(self._data_fields(), values)) for values in zip(*data)]
+            keys = []
+            for row in rows:
+                row["id"] = self._state["next_id"]
+                self._state["next_id"] += 1
+                row["embedding"] = np.asarray(row["embedding"], dtype=np.float32)
+                self._state["rows"].append(row)
+                self._state["partitions"].setdefault(self._bucket(row), []).append(row)
+                keys.append(row["id"])
+            return _InsertResult(keys)
+
+        def _bucket(self, row):
+            key = self._state["partition_key"]
+            if key is None:
+                return 0
+            return zlib.crc32(str(row.get(key)).encode("utf-8")) % self._state["num_partitions"]
+
+        def _candidates(self, terms):
+            # A filter on the partition key only visits that key's bucket
+            key = self._state["partition_key"]
+            for json_key, field, value in terms:
+                if key is not None and field == key:
+                    return self._state["partitions"].get(self._bucket({key: value}), [])
+            return self._state["rows"]
+
+        def search(self, data, anns_field, param, limit, expr=None, output_fields=None, **kwargs):
+            server.rpc("search")
+            terms = _EXPR_TERM.findall(expr or "")
+            candidates = self._candidates(terms)
+            server.rows_scanned += len(candidates)
+            rows = [r for r in candidates if _matches(terms, r)]
+            results = []
+            for query in data:
+                if not rows:
+                    results.append([])
+                    continue
+                matrix = np.stack([r[anns_field] for r in rows])
+                distances = ((matrix - np.asarray(query, dtype=np.float32)) ** 2).sum(axis=1)
+                order = np.argsort(distances)[:limit]
+                results.append([_Hit(rows[i], float(distances[i]), output_fields) for i in order])
+            return results
+
+        def query(self, expr, output_fields=None, limit=None, **kwargs):
+            server.rpc("query")
+            terms = _EXPR_TERM.findall(expr or "")
+            rows = [r for r in self._candidates(terms) if _matches(terms, r)]
+            for op, bound in _EXPR_ID_FLOOR.findall(expr or ""):
+                rows = [r for r in rows if (r["id"] >= int(bound) if op == ">=" else r["id"] > int(bound))]
+            rows = rows[:limit]
+            fields = output_fields or self._state["fields"]
+            return [{f: r.get(f) for f in set(fields) | {"id"}} for r in rows]
+
+        def delete(self, expr, **kwargs):
+            server.rpc("delete")
+            ids = {int(x) for x in re.findall(r"\d+", expr.split(" in ", 1)[-1])} if " in " in expr else None
+            terms = _EXPR_TERM.findall(expr)
+
+            def keep(r):
+                return not (r["id"] in ids if ids is not None else _matches(terms, r))
+
+            before = len(self._state["rows"])
+            self._state["rows"] = [r for r in self._state["rows"] if keep(r)]
+            for bucket, rows in self._state["partitions"].items():
+                self._state["partitions"][bucket] = [r for r in rows if keep(r)]
+            return types.SimpleNamespace(delete_count=before - len(self._state["rows"]))
+
+    def connect(*args, **kwargs):
+        server.rpc("connect")
+
+    def disconnect(*args, **kwargs):
+        pass
+
+    def has_collection(name, **kwargs):
+        server.rpc("has_collection")
+        return name in server.collections
+
+    module = types.ModuleType("pymilvus")
+    module.connections = types.SimpleNamespace(connect=connect, disconnect=disconnect)
+    module.utility = types.SimpleNamespace(has_collection=has_collection)
+    module.Collection = Collection
+    module.CollectionSchema = CollectionSchema
+    module.FieldSchema = FieldSchema
+    module.DataType = DataType
+    module.MilvusException = MilvusException
+    exceptions = types.ModuleType("pymilvus.exceptions")
+    exceptions.MilvusException = MilvusException
+    module.exceptions = exceptions
+    sys.modules["pymilvus"] = module
+    sys.modules["pymilvus.exceptions"] = exceptions
+    return server
+
+
+class HashingSentenceTransformer:
+    """Deterministic pseudo-embeddings: same text, same unit vector."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _one(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._one(sentences)
+        return np.stack([self._one(s) for s in sentences])
+
+
+def install_sentence_transformers_standin():
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = HashingSentenceTransformer
+    sys.modules["sentence_transformers"] = module
@@ -0,0 +1,112 @@
+# benchmarks/stress_booking.py
+"""
+Fires thousands of concurrent bookings at a small set of spots and verifies that
+no two accepted bookings for the same spot overlap.
+
+Each worker process has its own in-memory booking engine, so with --processes > 1
+only the database's conditional insert stands between requests and a double-booking.
+
+    python -m benchmarks.stress_booking --requests 5000 --spots 5 --processes 4 --threads 16
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def _book_batch(args):
+    tasks, threads = args
+    # Imported here so each spawned process picks up DATABASE_URL from the environment
+    from fastapi import HTTPException
+    from sqlalchemy.exc import OperationalError
+    import database, main, schemas
+
+    def _book(task):
+        spot_id, start, end = task
+        db = database.SessionLocal()
+        try:
+            main.book_parking(schemas.BookingRequest(
+                spot_id=spot_id, vehicle_type="car", location="", slot_type="",
+                start_time=start, end_time=end,
+            ), db)
+            return "booked"
+        except HTTPException:
+            return "conflict"
+        except OperationalError:
+            return "error"
+        finally:
+            db.close()
+
+    counts = {"booked": 0, "conflict": 0, "error": 0}
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for outcome in pool.map(_book, tasks):
+                counts[outcome] += 1
+    return counts
+
+
+def count_double_bookings(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT COUNT(*) FROM bookings a JOIN bookings b
+              ON a.spot_id = b.spot_id AND a.id < b.id
+             AND a.start_time < b.end_time AND a.end_time > b.start_time
+        """).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--spots", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="parking_stress_"), "parking_stress.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    # Seed the schema and initial spots once before the workers start
+    import database
+    database.add_initial_parking_spots()
+    spot_ids = [row[0] for row in database.SessionLocal().query(database.ParkingSpot.id).limit(args.spots).all()]
+
+    rng = random.Random(args.seed)
+    day = datetime(2030, 1, 1)
+    tasks = []
+    for _ in range(args.requests):
+        start = day + timedelta(hours=rng.randrange(0, 22))
+        tasks.append((rng.choice(spot_ids), start, start + timedelta(hours=rng.randint(1, 3))))
+    batches = [(tasks[i::args.processes], args.threads) for i in range(args.processes)]
+
+    began = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        results = pool.map(_book_batch, batches)
+    elapsed = time.perf_counter() - began
+
+    totals = {key: sum(r[key] for r in results) for key in ("booked", "conflict", "error")}
+    double_bookings = count_double_bookings(db_path)
+    print(f"Database:          {db_path}")
+    print(f"Requests:          {args.requests} over {len(spot_ids)} spots "
+          f"({args.processes} processes x {args.threads} threads)")
+    print(f"Booked:            {totals['booked']}")
+    print(f"Rejected overlaps: {totals['conflict']}")
+    print(f"Errors:            {totals['error']}")
+    print(f"Elapsed:           {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s)")
+    print(f"Double bookings:   {double_bookings}")
+    if double_bookings:
+        raise SystemExit("FAILED: overlapping bookings were accepted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# booking_engine.py
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+import database
+
+
+def to_naive_local(value: datetime) -> datetime:
+    # The API works in local wall-clock time, like the times users ask for ("2pm"): booking rows,
+    # rate tables and "now" are all naive local datetimes. Aware inputs are converted to local time.
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class SpotSchedule:
+    """
+    Sorted, non-overlapping booking intervals for a single spot.
+    `starts` and `ends` are parallel lists ordered by start time, so overlap checks are a bisect.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        if start == end:
+            # Point query: is the spot occupied at `start`?
+            idx = bisect_right(self.starts, start)
+            return idx > 0 and self.ends[idx - 1] > start
+        # Intervals are disjoint, so only the last one starting before `end` can overlap.
+        idx = bisect_left(self.starts, end)
+        return idx > 0 and self.ends[idx - 1] > start
+
+    def add(self, start: datetime, end: datetime) -> None:
+        idx = bisect_right(self.starts, start)
+        self.starts.insert(idx, start)
+        self.ends.insert(idx, end)
+
+    def remove(self, start: datetime, end: datetime) -> None:
+        idx = bisect_left(self.starts, start)
+        while idx < len(self.starts) and self.starts[idx] == start:
+            if self.ends[idx] == end:
+                del self.starts[idx]
+                del self.ends[idx]
+                return
+            idx += 1
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class BookingEngine:
+    """
+    Time-window availability built from the bookings table.
+    A spot is bookable for [start, end) if none of its existing bookings overlap that window.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.schedules: Dict[int, SpotSchedule] = {}
+        self._version = None  # bookings table version the schedules reflect, see database.table_version
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def fresh(self) -> bool:
+        """Loaded, and the table version was checked within INDEX_REFRESH_SECONDS."""
+        return self._loaded and time.monotonic() - self._checked_at < database.INDEX_REFRESH_SECONDS
+
+    def load(self, db) -> None:
+        # Read before the rows: a booking inserted in between is loaded and merely triggers one more reload
+        version = database.table_version(db, database.Booking)
+        rows = db.query(
+            database.Booking.spot_id,
+            database.Booking.start_time,
+            database.Booking.end_time,
+        ).order_by(database.Booking.spot_id, database.Booking.start_time).all()
+        with self._lock:
+            self.schedules.clear()
+            for spot_id, start, end in rows:
+                if start is None or end is None:
+                    continue
+                schedule = self.schedules.setdefault(spot_id, SpotSchedule())
+                schedule.starts.append(start)
+                schedule.ends.append(end)
+            self._version, self._checked_at = version, time.monotonic()
+            self._loaded = True
+        print(f"Booking engine loaded {len(rows)} bookings for {len(self.schedules)} spots.")
+
+    def ensure_loaded(self, db) -> None:
+        """Loads the schedules, or reloads them when the bookings table changed since (e.g. in another worker)."""
+        if self.fresh:
+            return
+        with self._lock:
+            if not self._loaded:
+                self.load(db)
+            elif not self.fresh:
+                self._checked_at = time.monotonic()
+                if database.table_version(db, database.Booking) != self._version:
+                    self.load(db)
+
+    def note_inserted(self, booking_id: int) -> None:
+        """Accounts for a booking this process inserted (already reserved), so it does not trigger a reload."""
+        with self._lock:
+            if self._version is not None:
+                count, max_id = self._version
+                self._version = (count + 1, max(max_id or 0, booking_id))
+
+    def is_free(self, spot_id: int, start: datetime, end: datetime) -> bool:
+        with self._lock:
+            schedule = self.schedules.get(spot_id)
+            return schedule is None or not schedule.overlaps(to_naive_local(start), to_naive_local(end))
+
+    def filter_free(self, spot_ids: Iterable[int], start: datetime, end: datetime) -> List[int]:
+        start, end = to_naive_local(start), to_naive_local(end)
+        with self._lock:
+            schedules = self.schedules
+            return [
+                spot_id for spot_id in spot_ids
+                if spot_id not in schedules or not schedules[spot_id].overlaps(start, end)
+            ]
+
+    def reserve(self, spot_id: int, start: datetime, end: datetime) -> bool:
+        """Atomically checks the window and records it. Returns False if it overlaps an existing booking."""
+        start, end = to_naive_local(start), to_naive_local(end)
+        with self._lock:
+            schedule = self.schedules.setdefault(spot_id, SpotSchedule())
+            if schedule.overlaps(start, end):
+                return False
+            schedule.add(start, end)
+            return True
+
+    def record(self, spot_id: int, start: datetime, end: datetime) -> None:
+        """Adds a booking that the database has already accepted."""
+        with self._lock:
+            self.schedules.setdefault(spot_id, SpotSchedule()).add(to_naive_local(start), to_naive_local(end))
+
+    def refresh_spot(self, db, spot_id: int) -> None:
+        """Reloads one spot's schedule, e.g. after another worker process booked it."""
+        rows = db.query(database.Booking.start_time, database.Booking.end_time).filter(
+            database.Booking.spot_id == spot_id
+        ).order_by(database.Booking.start_time).all()
+        schedule = SpotSchedule()
+        for start, end in rows:
+            schedule.starts.append(start)
+            schedule.ends.append(end)
+        with self._lock:
+            self.schedules[spot_id] = schedule
+
+    def release(self, spot_id: int, start: datetime, end: datetime) -> None:
+        """Undoes a reservation, e.g. when the database write that followed it failed."""
+        with self._lock:
+            schedule = self.schedules.get(spot_id)
+            if schedule is not None:
+                schedule.remove(to_naive_local(start), to_naive_local(end))
+
+    def bookings_for(self, spot_id: int) -> List[Tuple[datetime, datetime]]:
+        with self._lock:
+            schedule = self.schedules.get(spot_id)
+            return list(zip(schedule.starts, schedule.ends)) if schedule else []
+
+    def clear(self) -> None:
+        with self._lock:
+            self.schedules.clear()
+            self._version, self._checked_at = (0, None), time.monotonic()
+            self._loaded = True
+
+
+# Shared by all API workers in this process
+booking_engine = BookingEngine()
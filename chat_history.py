@@ -0,0 +1,135 @@
+# chat_history.py
+"""
+Per-session chat history for the agent prompt. UI messages are converted to LangChain
+messages once, as they arrive; the prompt gets the newest messages that fit in
+CHAT_HISTORY_TOKEN_BUDGET plus a short summary of everything older.
+"""
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from memory_compaction import extract_preferences, summarize_preferences
+from response_cache import parse_spot_list
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_HISTORY_MIN_RECENT = int(os.getenv("CHAT_HISTORY_MIN_RECENT", "4"))  # always kept verbatim
+CHAT_HISTORY_SUMMARY_TOKENS = int(os.getenv("CHAT_HISTORY_SUMMARY_TOKENS", "250"))
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers and separators per chat message
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English with Llama-style tokenizers)."""
+    return (len(text) + 3) // 4
+
+
+def _summary_line(role: str, content: str) -> Optional[str]:
+    """One condensed line for a message leaving the window."""
+    if role == "assistant":
+        spots = parse_spot_list(content)
+        if spots is not None:
+            try:
+                return "Assistant listed spots " + ", ".join(
+                    f"{s['id']} ({s['location']}, {s['spot_type']}, {s['price_per_hour']}/h)" for s in spots)
+            except (KeyError, TypeError):
+                pass
+        if content.startswith("Booking successful! Details:"):
+            try:
+                booking = json.loads(content.split(":", 1)[1])
+                return (f"Booked spot {booking['spot_id']} (booking {booking['booking_id']}) "
+                        f"from {booking['start_time']} to {booking['end_time']}")
+            except (ValueError, KeyError, TypeError):
+                pass
+        return None  # conversational replies carry little that the user turns don't
+    text = re.sub(r"\s+", " ", content).strip()
+    return f"User: {text[:160]}{'...' if len(text) > 160 else ''}"
+
+
+class ChatHistoryManager:
+    """
+    Incrementally converted history of one session. `sync` only converts messages it has not
+    seen; messages that no longer fit the token budget move (once) into the running summary.
+    """
+
+    def __init__(self, token_budget: int = CHAT_HISTORY_TOKEN_BUDGET, min_recent: int = CHAT_HISTORY_MIN_RECENT,
+                 summary_tokens: int = CHAT_HISTORY_SUMMARY_TOKENS):
+        self.token_budget = token_budget
+        self.min_recent = min_recent
+        self.summary_tokens = summary_tokens
+        self._source: List[tuple] = []  # (role, content) of every message seen, for change detection
+        self._messages: List[BaseMessage] = []  # converted messages, oldest first
+        self._tokens: List[int] = []
+        self._window_start = 0  # messages before this index are summarized
+        self._window_tokens = 0
+        self._summary_lines: List[str] = []
+        self._preferences: Dict[str, Counter] = {}
+        self.last_report: dict = {}
+
+    def reset(self) -> None:
+        self.__init__(self.token_budget, self.min_recent, self.summary_tokens)
+
+    def sync(self, ui_messages: List[Dict[str, str]]) -> None:
+        """Brings the history up to date with the UI's message list (appends are incremental)."""
+        incoming = [(m["role"], m["content"]) for m in ui_messages if m.get("role") in ("user", "assistant")]
+        known = len(self._source)
+        if len(incoming) < known or incoming[:known] != self._source:
+            # The UI's list was edited or cleared rather than appended to; start over
+            self.reset()
+            known = 0
+        for role, content in incoming[known:]:
+            self._source.append((role, content))
+            self._messages.append(HumanMessage(content=content) if role == "user" else AIMessage(content=content))
+            tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            self._tokens.append(tokens)
+            self._window_tokens += tokens
+        self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        while (self._window_tokens > self.token_budget
+               and len(self._messages) - self._window_start > self.min_recent):
+            role, content = self._source[self._window_start]
+            self._window_tokens -= self._tokens[self._window_start]
+            self._window_start += 1
+            line = _summary_line(role, content)
+            if line:
+                self._summary_lines.append(line)
+            if role == "user":
+                for slot, values in extract_preferences(content).items():
+                    self._preferences.setdefault(slot, Counter()).update(values)
+        # Oldest summary lines go first once the summary itself is over its budget
+        while len(self._summary_lines) > 1 and estimate_tokens("\n".join(self._summary_lines)) > self.summary_tokens:
+            self._summary_lines.pop(0)
+
+    def summary(self) -> str:
+        if self._window_start == 0:
+            return ""
+        lines = [f"Summary of {self._window_start} earlier messages in this conversation:"]
+        preferences = summarize_preferences(self._preferences)
+        if preferences:
+            lines.append(f"The user {preferences}.")
+        lines += [f"- {line}" for line in self._summary_lines]
+        return "\n".join(lines)
+
+    def messages(self) -> List[BaseMessage]:
+        """Messages for the prompt: the summary (if any) followed by the recent window."""
+        window = self._messages[self._window_start:]
+        summary = self.summary()
+        return ([SystemMessage(content=summary)] if summary else []) + window
+
+    def report(self, **prompt_parts: str) -> dict:
+        """Estimated prompt tokens for this turn; `prompt_parts` are the other prompt texts (system, input, ...)."""
+        summary_tokens = estimate_tokens(self.summary())
+        other = {name: estimate_tokens(text) for name, text in prompt_parts.items()}
+        self.last_report = {
+            "messages_total": len(self._messages),
+            "messages_in_window": len(self._messages) - self._window_start,
+            "messages_summarized": self._window_start,
+            "history_tokens": self._window_tokens,
+            "summary_tokens": summary_tokens,
+            **{f"{name}_tokens": tokens for name, tokens in other.items()},
+            "prompt_tokens": self._window_tokens + summary_tokens + sum(other.values()),
+        }
+        return self.last_report
@@ -1,10 +1,32 @@
 # database.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import create_engine, event, func, case, insert, inspect, select, exists, literal, and_, text, Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
 from datetime import datetime
+import asyncio
+import math
+import os
+import random
+import time
+import tracing
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./parking_data.db")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a booking is being written
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
 
-DATABASE_URL = "sqlite:///./parking_data.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -16,6 +38,8 @@ class ParkingSpot(Base):
     vehicle_type_allowed = Column(String) # e.g., "two-wheeler", "car", "suv", "truck"
     is_available = Column(Boolean, default=True)
     price_per_hour = Column(Float, default=10.0) # Example price
+    latitude = Column(Float, nullable=True) # WGS84; spots without coordinates are left out of nearby search
+    longitude = Column(Float, nullable=True)
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -28,10 +52,163 @@ class Booking(Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     total_price = Column(Float)
-    booked_at = Column(DateTime, default=datetime.utcnow)
+    booked_at = Column(DateTime, default=datetime.now)
 
 Base.metadata.create_all(bind=engine)
 
+# --- In-memory index refresh ---
+# Each API worker keeps its own indexes of these tables; they compare the table's version with the
+# one they were built from at most this often and rebuild when another worker changed it (0: every request)
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", "2"))
+
+def table_version(db, model, *extra) -> tuple:
+    """(row count, highest id, *extra aggregates): changes when any process inserts or deletes rows."""
+    return tuple(db.query(func.count(model.id), func.max(model.id), *extra).one())
+
+# --- Spot coordinates ---
+# Schema changes and coordinate seeding never happen at import; the API runs them at startup only
+# when asked to (or run `python database.py migrate [--seed-example-coordinates]`).
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() == "true"
+# Places spots without coordinates at the example seed locations below. For demo databases only.
+SEED_EXAMPLE_COORDINATES = os.getenv("SEED_EXAMPLE_COORDINATES", "false").lower() == "true"
+
+# Example coordinates for the seed locations. The seed spots get positions around them, and
+# backfill_spot_coordinates() can do the same for older demo databases.
+LOCATION_COORDINATES = {
+    "downtown": (12.9716, 77.5946),
+    "airport": (13.1986, 77.7066),
+    "mall": (12.9352, 77.6245),
+}
+
+def missing_coordinate_columns(bind=engine) -> list:
+    existing = {column["name"] for column in inspect(bind).get_columns(ParkingSpot.__tablename__)}
+    return [name for name in ("latitude", "longitude") if name not in existing]
+
+def add_coordinate_columns(bind=engine) -> bool:
+    """
+    Adds the latitude/longitude columns to a parking_spots table created before they existed
+    (create_all does not alter existing tables). Returns True if columns were added.
+    """
+    missing = missing_coordinate_columns(bind)
+    with bind.begin() as conn:
+        for name in missing:
+            conn.execute(text(f"ALTER TABLE {ParkingSpot.__tablename__} ADD COLUMN {name} FLOAT"))
+    if missing:
+        print(f"Added columns {missing} to {ParkingSpot.__tablename__}.")
+    return bool(missing)
+
+def _example_position(spot, coordinates=LOCATION_COORDINATES) -> None:
+    # A few hundred meters from the location's centre, spread by spot ID so spots don't share one point
+    lat, lon = coordinates[spot.location]
+    angle = spot.id * 2.399963  # golden angle
+    offset = 0.0005 + 0.0003 * (spot.id % 7)  # degrees, roughly 50-250 m
+    spot.latitude = lat + offset * math.sin(angle)
+    spot.longitude = lon + offset * math.cos(angle)
+
+def backfill_spot_coordinates(db, coordinates=LOCATION_COORDINATES) -> int:
+    """
+    Gives spots without coordinates at a known example location a made-up position near it.
+    Only for demo databases (SEED_EXAMPLE_COORDINATES); real spots need surveyed coordinates.
+    """
+    spots = db.query(ParkingSpot).filter(ParkingSpot.latitude.is_(None), ParkingSpot.location.in_(list(coordinates))).all()
+    for spot in spots:
+        _example_position(spot, coordinates)
+    db.commit()
+    return len(spots)
+
+def migrate(seed_example_coordinates: bool = SEED_EXAMPLE_COORDINATES) -> None:
+    """The explicit schema upgrade: coordinate columns, plus example coordinates if asked for."""
+    add_coordinate_columns()
+    if seed_example_coordinates:
+        db = SessionLocal()
+        try:
+            print(f"Added example coordinates to {backfill_spot_coordinates(db)} parking spots.")
+        finally:
+            db.close()
+
+def check_schema() -> None:
+    """Fails fast (instead of on the first query) when the database predates the current schema."""
+    missing = missing_coordinate_columns()
+    if missing:
+        raise RuntimeError(
+            f"Table {ParkingSpot.__tablename__} has no {missing} columns. Run `python database.py migrate` "
+            f"or start the API with DB_MIGRATE_ON_STARTUP=true."
+        )
+
+# --- Concurrency-safe booking ---
+BUSY_RETRY_ATTEMPTS = 5
+
+def is_busy_error(exc: Exception) -> bool:
+    message = str(exc).lower()
+    return "database is locked" in message or "database is busy" in message
+
+def run_with_retry(db, operation, attempts: int = BUSY_RETRY_ATTEMPTS):
+    """
+    Runs `operation(db)` and commits, retrying with jittered backoff when SQLite reports busy/locked.
+    """
+    for attempt in range(attempts):
+        try:
+            result = operation(db)
+            with tracing.span("db.commit"):
+                db.commit()
+            return result
+        except OperationalError as e:
+            db.rollback()
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+
+async def run_with_retry_async(db, operation, attempts: int = BUSY_RETRY_ATTEMPTS):
+    """Async counterpart of `run_with_retry` for an AsyncSession; backs off without blocking the event loop."""
+    for attempt in range(attempts):
+        try:
+            result = await operation(db)
+            with tracing.span("db.commit"):
+                await db.commit()
+            return result
+        except OperationalError as e:
+            await db.rollback()
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+
+def conditional_booking_insert(**booking_fields):
+    """
+    Builds an INSERT ... SELECT ... WHERE NOT EXISTS (overlapping booking) statement.
+    The check and the insert are a single statement, so two concurrent requests
+    (even from different processes) cannot both succeed.
+    """
+    booking_fields.setdefault("user_id", "default_user")
+    booking_fields.setdefault("booked_at", datetime.now())
+    columns = list(booking_fields)
+    overlapping = select(Booking.id).where(and_(
+        Booking.spot_id == booking_fields["spot_id"],
+        Booking.start_time < booking_fields["end_time"],
+        Booking.end_time > booking_fields["start_time"],
+    ))
+    source = select(*[literal(booking_fields[c], type_=Booking.__table__.c[c].type) for c in columns]).where(~exists(overlapping))
+    return insert(Booking).from_select(columns, source).returning(Booking.id)
+
+def insert_booking_if_free(db, **booking_fields):
+    """
+    Inserts a booking only if no existing booking for the same spot overlaps its window.
+    Returns the new booking id, or None if the window is already taken.
+    """
+    stmt = conditional_booking_insert(**booking_fields)
+
+    def _insert(session):
+        return session.execute(stmt).scalar()
+
+    return run_with_retry(db, _insert)
+
+async def insert_booking_if_free_async(db, **booking_fields):
+    stmt = conditional_booking_insert(**booking_fields)
+
+    async def _insert(session):
+        return (await session.execute(stmt)).scalar()
+
+    return await run_with_retry_async(db, _insert)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -39,6 +216,31 @@ def get_db():
     finally:
         db.close()
 
+# --- Async engine (used when the API runs with PARKING_API_MODE=async) ---
+def to_async_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+async_engine = None
+AsyncSessionLocal = None
+
+def get_async_sessionmaker():
+    # Created on first use so the sync API does not need aiosqlite installed
+    global async_engine, AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+        if async_engine.dialect.name == "sqlite":
+            event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return AsyncSessionLocal
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
 # --- Helper to add dummy data ---
 def add_initial_parking_spots():
     db = SessionLocal()
@@ -53,6 +255,15 @@ def add_initial_parking_spots():
         for spot_data in spots_data:
             db_spot = ParkingSpot(**spot_data)
             db.add(db_spot)
+        db.flush()  # assigns the IDs the example positions are spread by
+        for db_spot in db.query(ParkingSpot).all():
+            _example_position(db_spot)
         db.commit()
         print("Added initial parking spots.")
-    db.close()
\ No newline at end of file
+    db.close()
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:2] != ["migrate"]:
+        sys.exit("Usage: python database.py migrate [--seed-example-coordinates]")
+    migrate(seed_example_coordinates="--seed-example-coordinates" in sys.argv[2:])
\ No newline at end of file
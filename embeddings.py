@@ -0,0 +1,108 @@
+# embeddings.py
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import tracing
+from startup import startup_profile
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+# Loaded on first use (sentence-transformers pulls in torch), see get_embedding_model()
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                with startup_profile.timed("import sentence_transformers"):
+                    from sentence_transformers import SentenceTransformer
+                with startup_profile.timed(f"load {EMBEDDING_MODEL_NAME}"):
+                    _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _embedding_model
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings keyed on normalized text.
+    Cache misses from one call are encoded together in a single `encode` batch.
+    Returned vectors are shared with the cache and must not be mutated.
+    Without a `model`, the shared model is loaded on the first cache miss.
+    """
+
+    def __init__(self, model=None, max_size: int = EMBEDDING_CACHE_SIZE):
+        self._model = model
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        keys = [normalize_text(text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in vectors:
+                    continue
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    vectors[key] = vector
+                    self.hits += 1
+        pending = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if pending:
+            model = self.model
+            with tracing.span("embedding.encode"):
+                encoded = model.encode(pending)
+            with self._lock:
+                for key, vector in zip(pending, encoded):
+                    vectors[key] = vector.tolist()
+                    self._cache[key] = vectors[key]
+                    self.misses += 1
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return [vectors[key] for key in keys]
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else get_embedding_model()
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+embedding_cache = EmbeddingCache()
+
+
+def embed_text(text: str) -> List[float]:
+    return embedding_cache.embed(text)
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    return embedding_cache.embed_many(texts)
@@ -0,0 +1,368 @@
+# fast_path.py
+"""
+Deterministic intent and slot extraction for fully specified requests, such as
+"find covered parking for my car at the airport" or "book spot 3 today 2pm to 4pm".
+A confident match is answered by calling the search/booking tool directly, with no LLM
+call. Anything else (missing slots, negations, ambiguous times) goes to the agent.
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+# The vocabulary is re-read from the parking API at most this often
+FAST_PATH_GAZETTEER_TTL = float(os.getenv("FAST_PATH_GAZETTEER_TTL", "300"))
+# ...and retried this soon when it could not be loaded or came back empty
+FAST_PATH_GAZETTEER_RETRY = float(os.getenv("FAST_PATH_GAZETTEER_RETRY", "10"))
+
+# Extra surface forms, only used when their canonical value exists in the database
+SYNONYMS = {
+    "vehicle_type": {
+        "two-wheeler": ["bike", "motorbike", "motorcycle", "scooter", "scooty", "2 wheeler", "2-wheeler"],
+        "car": ["sedan", "hatchback"],
+    },
+    "slot_type": {
+        "covered": ["indoor", "sheltered", "underground"],
+        "open": ["outdoor", "open-air", "open air"],
+        "long-term": ["long stay"],
+    },
+    "location": {},
+}
+
+# Requests that change or constrain things the extractor does not model go to the agent, as do
+# distance constraints (find_nearby_parking) and questions, which want an answer rather than a listing
+_BLOCKERS = re.compile(
+    r"\b(not|don'?t|doesn'?t|without|except|cancel|change|instead|reschedule|extend|"
+    r"cheap\w*|nearest|closest|or|but|if|compare|price|cost|"
+    r"near|nearby|within|close to|distance|walk\w*|km|miles?|meters?|metres?|"
+    r"what|which|how|why|when|where|who|should|do you|think|suggest\w*|recommend\w*|advice|advise)\b|\?"
+)
+_BOOK = re.compile(r"\b(book|reserve)\b")
+_SEARCH = re.compile(r"\b(find|search|look(?:ing)? for|need|want|show|any|available|get|parking|spots?)\b")
+_SPOT_ID = re.compile(r"\b(?:spot|slot|id)\s*(?:id\s*)?(?:#|no\.?|number)?\s*(\d+)\b|#(\d+)\b")
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_TIME = r"(?:(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)|(\d{1,2}):(\d{2})|(noon|midnight))"
+_RANGE = re.compile(rf"{_TIME}\s*(?:to|-|–|until|till)\s*{_TIME}")
+_DURATION = re.compile(rf"{_TIME}\s*for\s*(\d+(?:\.\d+)?)\s*(?:hours?|hrs?|h)\b")
+_ANY_TIME = re.compile(_TIME)
+# Days the date parser does not understand; with any of these a parsed window may be on the wrong day
+_UNPARSED_DATE = re.compile(
+    r"\b(?:next|coming|last|this)\s+(?:week|weekend|month|year)\b|\b(?:next|coming|last)\s+\w+day\b|"
+    r"\bin\s+(?:an?|half an|a few|\d+(?:\.\d+)?)\s*(?:minutes?|mins?|hours?|hrs?|h|days?|weeks?|months?)\b|"
+    r"\b(?:later|soon|asap|yesterday|weekend|overnight|week|month|"
+    r"january|february|march|april|june|july|august|september|october|november|december|"
+    r"jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)\b|\bmay\s+\d|\d\s*may\b|"
+    r"\b\d{1,2}(?:st|nd|rd|th)\b|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b"
+)
+# Times the patterns above cannot turn into a window: "at 2", "from 2 to 4", "for 3 hours", "evening"
+_VAGUE_TIME = re.compile(
+    r"\b(?:at|from|by|after|before|around|until|till)\s+\d{1,2}\b|\b\d{1,2}\s*(?:to|-|–|until|till)\s*\d{1,2}\b|"
+    r"\bfor\s+\d+(?:\.\d+)?\s*(?:hours?|hrs?|h)\b|\b(?:morning|afternoon|evening|night)\b"
+)
+
+
+class Gazetteer:
+    """Surface form -> canonical value per slot, matched on word boundaries, longest form first."""
+
+    def __init__(self, values: Dict[str, Set[str]]):
+        self.values = values
+        self._patterns: Dict[str, List[Tuple[re.Pattern, str]]] = {}
+        for slot, canonical_values in values.items():
+            forms = {}
+            for value in canonical_values:
+                for form in [value] + SYNONYMS.get(slot, {}).get(value, []):
+                    for variant in {form, form.replace("-", " "), form.replace("-", "")}:
+                        forms[variant] = value
+                        forms[variant + "s"] = value
+            self._patterns[slot] = [
+                (re.compile(rf"(?<![\w-]){re.escape(form)}(?![\w-])"), value)
+                for form, value in sorted(forms.items(), key=lambda item: -len(item[0]))
+            ]
+
+    @classmethod
+    def from_vocabulary(cls, vocabulary: Dict[str, List[str]]) -> "Gazetteer":
+        """From the API's GET /vocabulary response."""
+        return cls({slot: {value.lower() for value in vocabulary.get(slot, [])}
+                    for slot in ("location", "slot_type", "vehicle_type")})
+
+    def is_empty(self) -> bool:
+        return not any(self.values.values())
+
+    def find(self, text: str) -> Dict[str, Set[str]]:
+        found = {}
+        for slot, patterns in self._patterns.items():
+            remaining = text
+            matches = set()
+            for pattern, value in patterns:
+                if pattern.search(remaining):
+                    matches.add(value)
+                    # Blank out the match so "two wheeler" does not also match a shorter form
+                    remaining = pattern.sub(" ", remaining)
+            if matches:
+                found[slot] = matches
+        return found
+
+
+def _to_time(groups: Tuple) -> Optional[Tuple[int, int, bool]]:
+    """(hour, minute, has_meridiem) from one _TIME match's groups."""
+    hour, minute, meridiem, hour24, minute24, word = groups
+    if word:
+        return (12 if word == "noon" else 0), 0, True
+    if hour24 is not None:
+        hour, minute = int(hour24), int(minute24)
+        return (hour, minute, False) if hour < 24 and minute < 60 else None
+    hour, minute = int(hour), int(minute or 0)
+    if not 1 <= hour <= 12 or minute >= 60:
+        return None
+    hour = hour % 12 + (12 if meridiem.startswith("p") else 0)
+    return hour, minute, True
+
+
+def _parse_date(text: str, now: datetime) -> Tuple[Optional[datetime], bool]:
+    """
+    (date, explicit): the mentioned day, or today when none is mentioned. The date is None when
+    the day is ambiguous: a weekday naming today could mean today or a week from now.
+    """
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    iso = re.search(r"\b(\d{4})-(\d{2})-(\d{2})\b", text)
+    if iso:
+        try:
+            return datetime(int(iso.group(1)), int(iso.group(2)), int(iso.group(3))), True
+        except ValueError:
+            pass
+    if re.search(r"\bday after tomorrow\b", text):
+        return today + timedelta(days=2), True
+    if re.search(r"\btomorrow\b", text):
+        return today + timedelta(days=1), True
+    if re.search(r"\b(today|tonight|this (morning|afternoon|evening))\b", text):
+        return today, True
+    for i, name in enumerate(_WEEKDAYS):
+        if re.search(rf"\b{name}\b", text):
+            if i == today.weekday():
+                return None, True
+            return today + timedelta(days=(i - today.weekday()) % 7), True
+    return today, False
+
+
+def parse_time_window(text: str, now: datetime) -> Tuple[Optional[Tuple[datetime, datetime]], float]:
+    """
+    ((start, end), confidence) for "2pm to 4pm", "14:00-16:00" or "3pm for 2 hours", with an
+    optional day ("today", "tomorrow", "friday", "2024-07-28"). ((None), 1.0) when no day or time
+    is mentioned, and confidence 0 when one is mentioned but cannot be turned into a window or
+    the day is unclear ("next week", "in 2 hours", "friday" said on a Friday).
+    """
+    if _UNPARSED_DATE.search(text):
+        return None, 0.0
+    date, explicit_date = _parse_date(text, now)
+    if date is None:
+        return None, 0.0
+    match = _RANGE.search(text)
+    if match:
+        start, end = _to_time(match.groups()[:6]), _to_time(match.groups()[6:])
+        if start is None or end is None:
+            return None, 0.0
+        # "2:00 to 4pm": the end's am/pm applies to a start without one
+        if not start[2] and end[2] and start[0] < 12 and end[0] >= 12:
+            start = (start[0] + 12, start[1], True)
+        start_dt = date.replace(hour=start[0], minute=start[1])
+        end_dt = date.replace(hour=end[0], minute=end[1])
+        if end_dt <= start_dt:
+            end_dt += timedelta(days=1)  # "10pm to 2am"
+    else:
+        match = _DURATION.search(text)
+        if match:
+            start = _to_time(match.groups()[:6])
+            if start is None:
+                return None, 0.0
+            start_dt = date.replace(hour=start[0], minute=start[1])
+            end_dt = start_dt + timedelta(hours=float(match.group(7)))
+        elif _ANY_TIME.search(text):
+            return None, 0.0  # a single time with no end or duration
+        elif explicit_date or _VAGUE_TIME.search(text):
+            return None, 0.0  # "tomorrow" or "from 2 to 4" alone: searching spots free now would be wrong
+        else:
+            return None, 1.0
+    if start_dt < now - timedelta(minutes=5):
+        return None, 0.0  # "2pm to 4pm" said at 5pm most likely means another day
+    return (start_dt, end_dt), 1.0 if explicit_date else 0.9
+
+
+class FastPathMatch:
+    __slots__ = ("intent", "args", "confidence")
+
+    def __init__(self, intent: str, args: dict, confidence: float):
+        self.intent = intent  # "search" or "book"
+        self.args = args  # tool arguments
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"FastPathMatch({self.intent!r}, {self.args!r}, confidence={self.confidence:.2f})"
+
+
+def _single(found: Dict[str, Set[str]], slot: str) -> Optional[str]:
+    values = found.get(slot)
+    return next(iter(values)) if values and len(values) == 1 else None
+
+
+def _fmt(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%d %H:%M')
+
+
+def extract(text: str, gazetteer: Gazetteer, history: Optional[List[Dict[str, str]]] = None,
+            now: Optional[datetime] = None) -> Tuple[Optional[FastPathMatch], str]:
+    """(match, reason): a match for a fully specified search or booking, else None and why not."""
+    now = now or datetime.now()
+    normalized = re.sub(r"\s+", " ", text.lower()).strip()
+    if _BLOCKERS.search(normalized):
+        return None, "blocker word"
+    found = gazetteer.find(normalized)
+    if any(len(values) > 1 for values in found.values()):
+        return None, "several values for one slot"
+    window, time_confidence = parse_time_window(normalized, now)
+    if time_confidence == 0:
+        return None, "unclear time"
+
+    if _BOOK.search(normalized):
+        spot_match = _SPOT_ID.search(normalized)
+        if not spot_match:
+            return None, "booking without spot id"
+        if window is None:
+            return None, "booking without time window"
+        confidence = time_confidence
+        vehicle_type = _single(found, "vehicle_type")
+        if vehicle_type is None:
+            # "book spot 3 ..." after "find parking for my car downtown"
+            for message in reversed(history or []):
+                if message.get("role") == "user":
+                    earlier = gazetteer.find(message["content"].lower()).get("vehicle_type")
+                    if earlier:
+                        if len(earlier) == 1:
+                            vehicle_type = next(iter(earlier))
+                            confidence *= 0.9
+                        break
+        if vehicle_type is None:
+            return None, "booking without vehicle type"
+        return FastPathMatch("book", {
+            "spot_id": int(spot_match.group(1) or spot_match.group(2)),
+            "vehicle_type": vehicle_type,
+            "start_datetime_str": _fmt(window[0]),
+            "end_datetime_str": _fmt(window[1]),
+        }, confidence), "ok"
+
+    if _SEARCH.search(normalized):
+        vehicle_type, location = _single(found, "vehicle_type"), _single(found, "location")
+        if vehicle_type is None or location is None:
+            return None, "search without vehicle type or location"
+        args = {"vehicle_type": vehicle_type, "location": location, "slot_type": _single(found, "slot_type")}
+        if window is not None:
+            args["start_datetime_str"], args["end_datetime_str"] = _fmt(window[0]), _fmt(window[1])
+        return FastPathMatch("search", args, time_confidence), "ok"
+
+    return None, "no intent"
+
+
+class FastPathStats:
+    """Hit rate, and latency saved estimated from the average agent turn on the same process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.fast_seconds = 0.0
+        self.agent_turns = 0
+        self.agent_seconds = 0.0
+
+    def record_hit(self, intent: str, seconds: float) -> None:
+        with self._lock:
+            self.hits[intent] += 1
+            self.fast_seconds += seconds
+
+    def record_miss(self, reason: str) -> None:
+        with self._lock:
+            self.misses[reason] += 1
+
+    def record_agent_turn(self, seconds: float) -> None:
+        with self._lock:
+            self.agent_turns += 1
+            self.agent_seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            avg_fast = self.fast_seconds / hits if hits else 0.0
+            avg_agent = self.agent_seconds / self.agent_turns if self.agent_turns else None
+            return {
+                "turns": hits + misses,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "avg_fast_path_ms": avg_fast * 1000,
+                "avg_agent_turn_ms": None if avg_agent is None else avg_agent * 1000,
+                # Needs at least one agent turn to compare against
+                "latency_saved_ms": None if avg_agent is None else max(avg_agent - avg_fast, 0) * hits * 1000,
+            }
+
+
+fast_path_stats = FastPathStats()
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_expires_at = 0.0
+_gazetteer_lock = threading.Lock()
+_vocabulary_loader: Optional[Callable[[], Dict[str, List[str]]]] = None
+
+
+def set_vocabulary_loader(loader: Optional[Callable[[], Dict[str, List[str]]]]) -> None:
+    """
+    Sets where the vocabulary comes from: a callable returning a GET /vocabulary response,
+    normally a call through the agent's tool transport. Without one the fast path is off.
+    """
+    global _vocabulary_loader, _gazetteer, _gazetteer_expires_at
+    with _gazetteer_lock:
+        _vocabulary_loader = loader
+        _gazetteer, _gazetteer_expires_at = None, 0.0
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """
+    Vocabulary from the parking API, reloaded after FAST_PATH_GAZETTEER_TTL seconds. An empty or
+    failed load is not cached: the previous vocabulary (if any) is kept and the load is retried
+    after FAST_PATH_GAZETTEER_RETRY seconds.
+    """
+    global _gazetteer, _gazetteer_expires_at
+    if time.monotonic() >= _gazetteer_expires_at and _vocabulary_loader is not None:
+        with _gazetteer_lock:
+            if time.monotonic() >= _gazetteer_expires_at and _vocabulary_loader is not None:
+                try:
+                    gazetteer = Gazetteer.from_vocabulary(_vocabulary_loader())
+                except Exception as e:
+                    print(f"Fast path: could not load the parking vocabulary ({e}); using the agent only.")
+                    gazetteer = None
+                if gazetteer is None or gazetteer.is_empty():
+                    _gazetteer_expires_at = time.monotonic() + FAST_PATH_GAZETTEER_RETRY
+                else:
+                    _gazetteer = gazetteer
+                    _gazetteer_expires_at = time.monotonic() + FAST_PATH_GAZETTEER_TTL
+    return _gazetteer
+
+
+def match(text: str, history: Optional[List[Dict[str, str]]] = None) -> Optional[FastPathMatch]:
+    """A confident FastPathMatch for `text`, or None (the miss is counted in `fast_path_stats`)."""
+    if not FAST_PATH_ENABLED:
+        return None
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        fast_path_stats.record_miss("no vocabulary")
+        return None
+    result, reason = extract(text, gazetteer, history)
+    if result is None:
+        fast_path_stats.record_miss(reason)
+        return None
+    if result.confidence < FAST_PATH_MIN_CONFIDENCE:
+        fast_path_stats.record_miss("low confidence")
+        return None
+    return result
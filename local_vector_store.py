@@ -0,0 +1,200 @@
+# local_vector_store.py
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import tracing
+
+EMBEDDING_DIM = 384
+INITIAL_CAPACITY = 256
+# Each open user holds a memory map (and its file descriptor); least-recently-used users are closed
+MAX_OPEN_USERS = int(os.getenv("LOCAL_MEMORY_MAX_OPEN_USERS", "1024"))
+
+
+def _user_file_stem(user_id: str) -> str:
+    # Readable prefix plus a hash so arbitrary user IDs map to safe, unique file names
+    readable = re.sub(r"[^A-Za-z0-9_-]", "_", user_id)[:32]
+    return f"{readable}-{hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:12]}"
+
+
+class _UserMemory:
+    """
+    One user's turns: a memory-mapped float32 matrix (`<stem>.npy`, grown by doubling)
+    and a JSON-lines file with the text and metadata of each row. The JSON-lines file is
+    appended after the vector is written, so its line count is the number of valid rows.
+    """
+
+    def __init__(self, directory: str, user_id: str, dim: int):
+        stem = _user_file_stem(user_id)
+        self.vectors_path = os.path.join(directory, f"{stem}.npy")
+        self.rows_path = os.path.join(directory, f"{stem}.jsonl")
+        self.dim = dim
+        self.rows: List[dict] = []
+        self._norms = np.empty(0, dtype=np.float32)  # squared norms of the stored rows
+        if os.path.exists(self.rows_path):
+            with open(self.rows_path, "r", encoding="utf-8") as f:
+                self.rows = [json.loads(line) for line in f if line.strip()]
+        # Files are only created by the first insert, so searches for new users stay read-only
+        self.vectors = open_memmap(self.vectors_path, mode="r+") if os.path.exists(self.vectors_path) else None
+
+    def _grow(self, needed: int) -> None:
+        if self.vectors is None:
+            capacity = INITIAL_CAPACITY
+            while capacity < needed:
+                capacity *= 2
+            self.vectors = open_memmap(self.vectors_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+            return
+        capacity = self.vectors.shape[0]
+        while capacity < needed:
+            capacity *= 2
+        tmp_path = self.vectors_path + ".tmp"
+        grown = open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        grown[:len(self.rows)] = self.vectors[:len(self.rows)]
+        grown.flush()
+        del grown
+        del self.vectors
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = open_memmap(self.vectors_path, mode="r+")
+
+    def add(self, texts: List[str], metadatas: List[dict], vectors: List[List[float]]) -> List[int]:
+        start = len(self.rows)
+        end = start + len(texts)
+        if self.vectors is None or end > self.vectors.shape[0]:
+            self._grow(end)
+        self.vectors[start:end] = np.asarray(vectors, dtype=np.float32)
+        self.vectors.flush()
+        new_rows = [{"text": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+        with open(self.rows_path, "a", encoding="utf-8") as f:
+            for row in new_rows:
+                f.write(json.dumps(row) + "\n")
+        self.rows.extend(new_rows)
+        return list(range(start, end))
+
+    def rewrite(self, keep: List[int]) -> None:
+        """Rewrites both files with only the rows at positions `keep` (used by compaction)."""
+        rows = [self.rows[i] for i in keep]
+        vectors = np.array(self.vectors[keep]) if keep else np.empty((0, self.dim), dtype=np.float32)
+        capacity = INITIAL_CAPACITY
+        while capacity < len(rows):
+            capacity *= 2
+        tmp_vectors, tmp_rows = self.vectors_path + ".tmp", self.rows_path + ".tmp"
+        compacted = open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        compacted[:len(rows)] = vectors
+        compacted.flush()
+        del compacted
+        with open(tmp_rows, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        self.vectors = None
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_rows, self.rows_path)
+        self.vectors = open_memmap(self.vectors_path, mode="r+")
+        self.rows = rows
+        self._norms = np.empty(0, dtype=np.float32)
+
+    def search(self, query_embedding: List[float], top_k: int) -> List[dict]:
+        count = len(self.rows)
+        if count == 0 or top_k <= 0:
+            return []
+        matrix = self.vectors[:count]
+        if len(self._norms) != count:
+            self._norms = np.einsum("ij,ij->i", matrix, matrix)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        # Squared L2 (same metric as the Milvus index) as |v|^2 - 2 v.q + |q|^2, one matrix-vector product
+        distances = np.maximum(self._norms - 2 * (matrix @ query) + query @ query, 0)
+        k = min(top_k, count)
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [
+            {"text": self.rows[i]["text"], "metadata": self.rows[i]["metadata"], "distance": float(distances[i])}
+            for i in nearest
+        ]
+
+
+class LocalVectorStore:
+    """
+    Embedded conversation-memory backend: per-user memory-mapped vectors searched by
+    vectorized brute force, persisted under `directory`. No server needed; selected with
+    MEMORY_BACKEND=local.
+    """
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM, max_open_users: int = MAX_OPEN_USERS):
+        self.directory = directory
+        self.dim = dim
+        self.max_open_users = max_open_users
+        self._users: "OrderedDict[str, _UserMemory]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _user(self, user_id: str) -> _UserMemory:
+        memory = self._users.get(user_id)
+        if memory is None:
+            self.open()
+            memory = self._users[user_id] = _UserMemory(self.directory, user_id, self.dim)
+            while len(self._users) > self.max_open_users:
+                self._users.popitem(last=False)  # dropping the last reference unmaps the file
+        else:
+            self._users.move_to_end(user_id)
+        return memory
+
+    def add_turns(self, texts: List[str], metadatas: List[dict], vectors: List[List[float]]) -> List[str]:
+        keys = []
+        with self._lock, tracing.span("local_memory.insert"):
+            # Rows are grouped per user, keeping their order
+            by_user: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(metadatas):
+                by_user.setdefault(str(metadata.get("user_id", "")), []).append(i)
+            for user_id, idx in by_user.items():
+                rows = self._user(user_id).add([texts[i] for i in idx], [metadatas[i] for i in idx],
+                                               [vectors[i] for i in idx])
+                keys.extend(f"{user_id}:{row}" for row in rows)
+        return keys
+
+    def search_turns(self, user_id: str, query_embedding: List[float], top_k: int) -> List[dict]:
+        with self._lock, tracing.span("local_memory.search"):
+            return self._user(user_id).search(query_embedding, top_k)
+
+    def list_turns(self, user_id: str) -> List[dict]:
+        with self._lock:
+            memory = self._user(user_id)
+            return [
+                {"id": f"{user_id}:{i}", "text": row["text"], "metadata": row["metadata"],
+                 "vector": memory.vectors[i].tolist()}
+                for i, row in enumerate(memory.rows)
+            ]
+
+    def delete_turns(self, user_id: str, ids: List[str]) -> int:
+        with self._lock:
+            memory = self._user(user_id)
+            drop = {int(str(key).rsplit(":", 1)[1]) for key in ids}
+            memory.rewrite([i for i in range(len(memory.rows)) if i not in drop])
+            return len(drop)
+
+    def list_users(self) -> List[str]:
+        users = set()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".jsonl"):
+                    with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                        first = f.readline()
+                    if first.strip():
+                        users.add(str(json.loads(first)["metadata"].get("user_id", "")))
+        return sorted(users)
+
+    def health(self, check: bool = False) -> dict:
+        with self._lock:
+            return {
+                "backend": "local",
+                "directory": self.directory,
+                "users_loaded": len(self._users),
+                "rows_loaded": sum(len(m.rows) for m in self._users.values()),
+            }
@@ -1,81 +1,593 @@
 # main_api.py
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import update, delete
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional
 from datetime import datetime, timedelta
+from itertools import islice
+import asyncio
+import base64
+import heapq
+import binascii
+import json
+import math
+import os
+import time
 
-import database, schemas
+import numpy as np
+
+import database, schemas, tracing
+from availability_index import availability_index, SORT_KEYS
+from spatial_index import spatial_index
+from booking_engine import booking_engine, to_naive_local
+from quote_engine import quote_engine
+from availability_events import availability_events, EventFilter, format_sse, EVENT_HEARTBEAT_SECONDS
+
+# "sync" (threadpool handlers on SessionLocal) or "async" (async handlers on an AsyncSession)
+API_MODE = os.getenv("PARKING_API_MODE", "sync").lower()
+# Nearby ranking: distance plus this many meters per unit of hourly price (0 = distance only)
+NEARBY_PRICE_WEIGHT_M = float(os.getenv("NEARBY_PRICE_WEIGHT_M", "50"))
+NEARBY_MAX_K = int(os.getenv("NEARBY_MAX_K", "100"))
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+STREAM_BATCH_SIZE = 256  # NDJSON rows per chunk written to the socket
+QUOTE_MAX_WINDOWS = int(os.getenv("QUOTE_MAX_WINDOWS", "24"))
+QUOTE_MAX_SPOT_IDS = int(os.getenv("QUOTE_MAX_SPOT_IDS", "5000"))
+def _total_price_key(total: Optional[float]) -> float:
+    # A spot that could not be quoted (total None/NaN) sorts after every priced spot, by ID
+    return math.inf if total is None or math.isnan(total) else total
+
+# The index's presorted orderings, plus the requested window's total price (computed per request)
+RESULT_SORT_KEYS = dict(SORT_KEYS, total_price=lambda spot: (_total_price_key(spot["total_price"]), spot["id"]))
 
 app = FastAPI(title="Parking API")
+if database.DB_MIGRATE_ON_STARTUP:
+    database.migrate()
+database.check_schema()
 database.add_initial_parking_spots()
 
-@app.post("/get-parking-spots", response_model=List[schemas.ParkingSpotResponse])
-def get_parking_spots(request: schemas.ParkingSearchRequest, db: Session = Depends(database.get_db)):
-    query = db.query(database.ParkingSpot).filter(database.ParkingSpot.is_available == True)
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Adopts the caller's trace ID (X-Trace-Id) so spans below are attributed to the agent turn
+    started = time.perf_counter()
+    with tracing.trace(request.headers.get(tracing.TRACE_HEADER)) as trace_id:
+        response = await call_next(request)
+    route = request.scope.get("route")
+    tracing.http_seconds.observe(time.perf_counter() - started, request.method,
+                                 getattr(route, "path", "unmatched"), str(response.status_code))
+    response.headers[tracing.TRACE_HEADER] = trace_id
+    return response
 
-    if request.vehicle_type:
-        query = query.filter(database.ParkingSpot.vehicle_type_allowed.ilike(f"%{request.vehicle_type}%"))
-    if request.location:
-        query = query.filter(database.ParkingSpot.location.ilike(f"%{request.location}%"))
-    if request.slot_type:
-        query = query.filter(database.ParkingSpot.spot_type.ilike(f"%{request.slot_type}%"))
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of the stage and request latency histograms."""
+    return PlainTextResponse(tracing.render_metrics(), media_type="text/plain; version=0.0.4")
 
+# --- Shared request logic (no I/O) ---
+def _validate_search_window(request: schemas.ParkingSearchRequest):
+    if (request.start_time is None) != (request.end_time is None):
+        raise HTTPException(status_code=400, detail="Provide both start_time and end_time, or neither.")
+    if request.start_time is not None and request.end_time <= request.start_time:
+        raise HTTPException(status_code=400, detail="End time must be after start time.")
 
-    available_spots = query.all()
-    if not available_spots:
-        return []
-    return available_spots
+def _validate_listing(request: schemas.ParkingSearchRequest):
+    _validate_search_window(request)
+    if request.sort_by not in RESULT_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {sorted(RESULT_SORT_KEYS)}.")
+    if request.sort_by == "total_price" and request.start_time is None:
+        raise HTTPException(status_code=400, detail="sort_by=total_price needs start_time and end_time.")
+    limit = getattr(request, "limit", None)
+    if limit is not None and not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}.")
 
-@app.post("/book-parking", response_model=schemas.BookingResponse)
-def book_parking(request: schemas.BookingRequest, db: Session = Depends(database.get_db)):
-    spot = db.query(database.ParkingSpot).filter(database.ParkingSpot.id == request.spot_id).first()
+def encode_cursor(sort_by: str, spot: dict) -> str:
+    # Keyset cursor: the sort key of the last row returned, opaque to clients. JSON has no
+    # infinity, so the "no price" position is written as null
+    key = [None if v == math.inf else v for v in RESULT_SORT_KEYS[sort_by](spot)]
+    return base64.urlsafe_b64encode(json.dumps([sort_by, key]).encode()).decode()
+
+def decode_cursor(cursor: Optional[str], sort_by: str) -> Optional[tuple]:
+    if cursor is None:
+        return None
+    try:
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if cursor_sort != sort_by:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort_by.")
+    # The key is compared against index keys, so it must have their shape: finite numbers ending in
+    # the spot ID, with null only for a total price (the "no price" position)
+    arity = len(RESULT_SORT_KEYS[sort_by]({"id": 0, "price_per_hour": 0.0, "total_price": 0.0}))
+    if (not isinstance(key, list) or len(key) != arity
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+                       or (v is None and sort_by == "total_price" and i == 0) for i, v in enumerate(key))
+            or not isinstance(key[-1], int)):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return tuple(math.inf if v is None else v for v in key)
+
+def _with_totals(spots: List[dict], request) -> List[dict]:
+    """Adds each spot's `total_price` for the request's window (None without one), quoted in one vectorized pass."""
+    if request.start_time is None or not spots:
+        for spot in spots:
+            spot["total_price"] = None  # same shape as the response models give the list endpoints
+        return spots
+    totals = quote_engine.quote([spot["id"] for spot in spots], [(request.start_time, request.end_time)])[:, 0]
+    for spot, total in zip(spots, totals.tolist()):
+        spot["total_price"] = None if np.isnan(total) else total
+    return spots
+
+def _iter_result_ids(request: schemas.ParkingSearchRequest, after: Optional[tuple] = None) -> Iterator[int]:
+    """Result IDs in `request.sort_by` order, lazily: memory does not grow with the number of matches."""
+    matching = availability_index.matching_ids(
+        vehicle_type=request.vehicle_type, location=request.location, slot_type=request.slot_type
+    )
+    start_time = request.start_time or datetime.now()
+    end_time = request.end_time or start_time
+    if request.sort_by == "total_price":
+        # Depends on the window, so there is no presorted ordering: quote every free match at once
+        free = np.array([spot_id for spot_id in matching if booking_engine.is_free(spot_id, start_time, end_time)],
+                        dtype=np.int64)
+        totals = quote_engine.quote(free, [(start_time, end_time)])[:, 0]
+        totals[np.isnan(totals)] = math.inf  # same position as _total_price_key
+        for position in np.lexsort((free, totals)):
+            spot_id = int(free[position])
+            if after is None or (float(totals[position]), spot_id) > after:
+                yield spot_id
+        return
+    for spot_id in availability_index.iter_sorted(matching, request.sort_by, after):
+        if booking_engine.is_free(spot_id, start_time, end_time):
+            yield spot_id
+
+def _search_page_loaded_indexes(request: schemas.ParkingSearchPageRequest) -> dict:
+    limit = request.limit or PAGE_DEFAULT_LIMIT
+    after = decode_cursor(request.cursor, request.sort_by)
+    # One row past the page tells whether there is a next page
+    spots = _with_totals([availability_index.get(spot_id) for spot_id in islice(_iter_result_ids(request, after), limit + 1)],
+                         request)
+    page = {"spots": spots[:limit], "next_cursor": encode_cursor(request.sort_by, spots[limit - 1]) if len(spots) > limit else None}
+    if request.include_total and request.cursor is None:
+        # One pass over the lazy result IDs; nothing per result is kept
+        total, low, high = 0, None, None
+        for spot_id in _iter_result_ids(request):
+            price = availability_index.spots[spot_id]["price_per_hour"]
+            total += 1
+            low = price if low is None or price < low else low
+            high = price if high is None or price > high else high
+        page.update(total=total, min_price_per_hour=low, max_price_per_hour=high)
+    return page
+
+def _stream_loaded_indexes(request: schemas.ParkingSearchPageRequest) -> Iterator[str]:
+    """
+    NDJSON: one spot per line, written in batches as they are produced. With a `limit`, a final
+    {"next_cursor": ...} line follows when more results remain.
+    """
+    after = decode_cursor(request.cursor, request.sort_by)
+    ids = _iter_result_ids(request, after)
+
+    def encode(batch: List[dict]) -> str:
+        return "".join(json.dumps(spot) + "\n" for spot in _with_totals(batch, request))
+
+    def lines():
+        batch, sent, last, more = [], 0, None, False
+        for spot_id in ids:
+            if request.limit is not None and sent == request.limit:
+                more = True
+                break
+            batch.append(availability_index.get(spot_id))
+            sent += 1
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield encode(batch)
+                last, batch = batch[-1], []
+        if batch:
+            yield encode(batch)
+            last = batch[-1]
+        if more:
+            yield json.dumps({"next_cursor": encode_cursor(request.sort_by, last)}) + "\n"
+
+    return lines()
+
+def _search_loaded_indexes(request: schemas.ParkingSearchRequest) -> List[dict]:
+    # Served from the in-memory availability index (set intersections) instead of ILIKE scans
+    spots = availability_index.search(
+        vehicle_type=request.vehicle_type,
+        location=request.location,
+        slot_type=request.slot_type,
+    )
+
+    # Without a window, only spots that are not occupied right now are returned
+    start_time = request.start_time or datetime.now()
+    end_time = request.end_time or start_time
+    free_ids = set(booking_engine.filter_free([spot["id"] for spot in spots], start_time, end_time))
+    results = _with_totals([spot for spot in spots if spot["id"] in free_ids], request)
+    if request.sort_by != "id":
+        results.sort(key=RESULT_SORT_KEYS[request.sort_by])
+    return results
+
+def _search_nearby_loaded_indexes(request: schemas.NearbySearchRequest) -> List[dict]:
+    if request.latitude is not None:
+        center = (request.latitude, request.longitude)
+    else:
+        location = request.near_location.strip().lower()
+        center = spatial_index.centroid(availability_index.location_ids(location), key=location)
+        if center is None:
+            raise HTTPException(status_code=404, detail=f"No spots with coordinates at '{request.near_location}'.")
+    start_time = request.start_time or datetime.now()
+    end_time = request.end_time or start_time
+    accepts = availability_index.accepts(vehicle_type=request.vehicle_type, slot_type=request.slot_type)
+    price_weight = NEARBY_PRICE_WEIGHT_M if request.price_weight_m is None else request.price_weight_m
+
+    def accept(spot_id):
+        return accepts(spot_id) and booking_engine.is_free(spot_id, start_time, end_time)
+
+    def cost(spot_id, distance):
+        return distance + price_weight * availability_index.spots[spot_id]["price_per_hour"]
+
+    nearest = spatial_index.nearest(center[0], center[1], k=request.k, radius_m=request.radius_m,
+                                    accept=accept, cost=cost if price_weight else None)
+    results = []
+    for spot_id, distance in nearest:
+        latitude, longitude = spatial_index.coordinates[spot_id]
+        results.append(dict(availability_index.get(spot_id), latitude=latitude, longitude=longitude,
+                            distance_m=round(distance, 1)))
+    return _with_totals(results, request)
+
+def _validate_nearby(request: schemas.NearbySearchRequest):
+    _validate_search_window(request)
+    if (request.latitude is None) != (request.longitude is None):
+        raise HTTPException(status_code=400, detail="Provide both latitude and longitude, or neither.")
+    if request.latitude is None and not request.near_location:
+        raise HTTPException(status_code=400, detail="Provide latitude and longitude, or near_location.")
+    if request.latitude is not None and not (-90 <= request.latitude <= 90 and -180 <= request.longitude <= 180):
+        raise HTTPException(status_code=400, detail="Latitude or longitude out of range.")
+    if request.radius_m is not None and request.radius_m <= 0:
+        raise HTTPException(status_code=400, detail="radius_m must be positive.")
+    # The grid search stops early assuming a spot's cost is never below its distance
+    if request.price_weight_m is not None and not request.price_weight_m >= 0:
+        raise HTTPException(status_code=400, detail="price_weight_m must not be negative.")
+    if not 1 <= request.k <= NEARBY_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {NEARBY_MAX_K}.")
+
+def _validate_quote(request: schemas.QuoteRequest):
+    if not 1 <= len(request.windows) <= QUOTE_MAX_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {QUOTE_MAX_WINDOWS} windows.")
+    if any(window.end_time <= window.start_time for window in request.windows):
+        raise HTTPException(status_code=400, detail="End time must be after start time.")
+    if request.spot_ids is not None and len(request.spot_ids) > QUOTE_MAX_SPOT_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {QUOTE_MAX_SPOT_IDS} spot_ids per quote.")
+    if request.limit is not None and not 1 <= request.limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}.")
+
+def _quote_loaded_indexes(request: schemas.QuoteRequest) -> dict:
+    windows = [(window.start_time, window.end_time) for window in request.windows]
+    if request.spot_ids is not None:
+        accepts = availability_index.accepts() if request.only_free else (lambda spot_id: True)
+        candidates = [spot_id for spot_id in dict.fromkeys(request.spot_ids)
+                      if spot_id in availability_index.spots and accepts(spot_id)]
+    else:
+        candidates = list(availability_index.matching_ids(
+            vehicle_type=request.vehicle_type, location=request.location, slot_type=request.slot_type,
+            candidates=None if request.only_free else availability_index.spots,
+        ))
+    if not candidates:
+        return {"quotes": []}
+    totals = quote_engine.quote(candidates, windows)
+    lowest = np.where(np.isnan(totals), np.inf, totals).min(axis=1)
+    # Cheapest first by each spot's lowest total. Bookings are only checked for spots that reach
+    # the top of the heap; a spot whose cheapest window is taken goes back in at its next-best total.
+    heap = list(zip(lowest.tolist(), candidates, range(len(candidates))))
+    heapq.heapify(heap)
+    quotes, limit = [], request.limit or PAGE_DEFAULT_LIMIT
+    while heap and len(quotes) < limit:
+        key, spot_id, row = heapq.heappop(heap)
+        if key == float("inf"):
+            break
+        row_totals = [None if np.isnan(total) else total for total in totals[row].tolist()]
+        if request.only_free:
+            row_totals = [total if total is not None and booking_engine.is_free(spot_id, start, end) else None
+                          for total, (start, end) in zip(row_totals, windows)]
+            best = min((total for total in row_totals if total is not None), default=float("inf"))
+            if best > key:
+                heapq.heappush(heap, (best, spot_id, row))
+                continue
+        spot = availability_index.get(spot_id)
+        quotes.append({
+            "spot_id": spot_id, "location": spot["location"], "spot_type": spot["spot_type"],
+            "vehicle_type_allowed": spot["vehicle_type_allowed"], "price_per_hour": spot["price_per_hour"],
+            "totals": row_totals, "lowest_total": key,
+        })
+    return {"quotes": quotes}
+
+def _load_indexes(db: Session):
+    availability_index.ensure_loaded(db)
+    booking_engine.ensure_loaded(db)
+    quote_engine.ensure_loaded(db)
+
+def _load_nearby_indexes(db: Session):
+    _load_indexes(db)
+    spatial_index.ensure_loaded(db)
 
+def _prepare_booking(request: schemas.BookingRequest, spot) -> dict:
+    """Validates the request against the spot and reserves the window in-process."""
     if not spot:
         raise HTTPException(status_code=404, detail="Parking spot not found")
     if not spot.is_available:
         raise HTTPException(status_code=400, detail="Parking spot is not available")
-    duration_hours = (request.end_time - request.start_time).total_seconds() / 3600
+    start_time = to_naive_local(request.start_time)
+    end_time = to_naive_local(request.end_time)
+    duration_hours = (end_time - start_time).total_seconds() / 3600
     if duration_hours <= 0:
         raise HTTPException(status_code=400, detail="End time must be after start time.")
 
-    total_price = duration_hours * spot.price_per_hour
+    # Same rate tables as /quote, so the booked total matches the quote
+    total_price = quote_engine.quote_one(spot.id, start_time, end_time)
+    if total_price is None:  # spot added after the quote engine was loaded
+        total_price = duration_hours * spot.price_per_hour
 
-    # Create booking
-    new_booking = database.Booking(
+    # The in-process reservation rejects conflicts without touching the database;
+    # the conditional insert is what keeps separate worker processes from double-booking.
+    if not booking_engine.reserve(spot.id, start_time, end_time):
+        raise HTTPException(status_code=400, detail="Parking spot is already booked for the requested time.")
+
+    booking_fields = dict(
         spot_id=request.spot_id,
         user_id="default_user",
         vehicle_type=request.vehicle_type,
         location=spot.location,
         slot_type=spot.spot_type,
-        start_time=request.start_time,
-        end_time=request.end_time,
+        start_time=start_time,
+        end_time=end_time,
         total_price=total_price
     )
-    print(f"Booking details: {new_booking}")
-    db.add(new_booking)
-    spot.is_available = False 
-    db.commit()
-    db.refresh(new_booking)
-    db.refresh(spot)
+    print(f"Booking details: {booking_fields}")
+    return booking_fields
 
+def _booking_response(booking_id: int, booking_fields: dict) -> schemas.BookingResponse:
     return schemas.BookingResponse(
-        booking_id=new_booking.id,
-        spot_id=new_booking.spot_id,
+        booking_id=booking_id,
         message="Parking spot booked successfully!",
-        vehicle_type=new_booking.vehicle_type,
-        location=new_booking.location,
-        slot_type=new_booking.slot_type,
-        start_time=new_booking.start_time,
-        end_time=new_booking.end_time,
-        total_price=new_booking.total_price
+        **{k: v for k, v in booking_fields.items() if k != "user_id"}
     )
 
-@app.post("/admin/reset-availability")
+def _after_booking(booking_id: int, booking_fields: dict, spot) -> schemas.BookingResponse:
+    booking_engine.note_inserted(booking_id)
+    availability_events.publish_booked(booking_id, spot, booking_fields["start_time"], booking_fields["end_time"])
+    return _booking_response(booking_id, booking_fields)
+
+def _after_reset():
+    availability_index.mark_all_available()
+    booking_engine.clear()
+    availability_events.publish_reset()
+
+RESET_MESSAGE = {"message": "All parking spot availability reset and bookings cleared."}
+ALREADY_BOOKED = "Parking spot is already booked for the requested time."
+
+# --- Sync handlers ---
+def get_parking_spots(request: schemas.ParkingSearchRequest, db: Session = Depends(database.get_db)):
+    _validate_listing(request)
+    with tracing.span("db.load_indexes"):
+        _load_indexes(db)
+    with tracing.span("api.search_index"):
+        return _search_loaded_indexes(request)
+
+def get_parking_spots_page(request: schemas.ParkingSearchPageRequest, db: Session = Depends(database.get_db)):
+    _validate_listing(request)
+    with tracing.span("db.load_indexes"):
+        _load_indexes(db)
+    with tracing.span("api.search_page"):
+        return _search_page_loaded_indexes(request)
+
+def stream_parking_spots(request: schemas.ParkingSearchPageRequest, db: Session = Depends(database.get_db)):
+    _validate_listing(request)
+    with tracing.span("db.load_indexes"):
+        _load_indexes(db)
+    return StreamingResponse(_stream_loaded_indexes(request), media_type="application/x-ndjson")
+
+def get_nearby_parking_spots(request: schemas.NearbySearchRequest, db: Session = Depends(database.get_db)):
+    _validate_nearby(request)
+    with tracing.span("db.load_indexes"):
+        _load_nearby_indexes(db)
+    with tracing.span("api.search_nearby"):
+        return _search_nearby_loaded_indexes(request)
+
+def quote_parking(request: schemas.QuoteRequest, db: Session = Depends(database.get_db)):
+    _validate_quote(request)
+    with tracing.span("db.load_indexes"):
+        _load_indexes(db)
+    with tracing.span("api.quote"):
+        return _quote_loaded_indexes(request)
+
+def get_vocabulary(db: Session = Depends(database.get_db)):
+    with tracing.span("db.load_indexes"):
+        availability_index.ensure_loaded(db)
+    return availability_index.vocabulary()
+
+def book_parking(request: schemas.BookingRequest, db: Session = Depends(database.get_db)):
+    with tracing.span("db.query"):
+        spot = db.query(database.ParkingSpot).filter(database.ParkingSpot.id == request.spot_id).first()
+    with tracing.span("db.load_indexes"):
+        booking_engine.ensure_loaded(db)
+        quote_engine.ensure_loaded(db)
+    booking_fields = _prepare_booking(request, spot)
+    try:
+        with tracing.span("db.insert_booking"):
+            booking_id = database.insert_booking_if_free(db, **booking_fields)
+    except Exception:
+        booking_engine.release(spot.id, booking_fields["start_time"], booking_fields["end_time"])
+        raise
+    if booking_id is None:
+        booking_engine.refresh_spot(db, spot.id)
+        raise HTTPException(status_code=400, detail=ALREADY_BOOKED)
+    return _after_booking(booking_id, booking_fields, spot)
+
 def reset_availability(db: Session = Depends(database.get_db)):
-    db.query(database.ParkingSpot).update({"is_available": True})
-    db.query(database.Booking).delete()
-    db.commit()
-    return {"message": "All parking spot availability reset and bookings cleared."}
+    with tracing.span("db.query"):
+        db.query(database.ParkingSpot).update({"is_available": True})
+        db.query(database.Booking).delete()
+    with tracing.span("db.commit"):
+        db.commit()
+    with tracing.span("db.load_indexes"):
+        availability_index.ensure_loaded(db)
+    _after_reset()
+    return RESET_MESSAGE
+
+# --- Async handlers ---
+async def get_parking_spots_async(request: schemas.ParkingSearchRequest, db=Depends(database.get_async_db)):
+    _validate_listing(request)
+    if not (availability_index.fresh and booking_engine.fresh and quote_engine.loaded):
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(_load_indexes)
+    with tracing.span("api.search_index"):
+        return _search_loaded_indexes(request)
+
+async def get_parking_spots_page_async(request: schemas.ParkingSearchPageRequest, db=Depends(database.get_async_db)):
+    _validate_listing(request)
+    if not (availability_index.fresh and booking_engine.fresh and quote_engine.loaded):
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(_load_indexes)
+    with tracing.span("api.search_page"):
+        return _search_page_loaded_indexes(request)
+
+async def stream_parking_spots_async(request: schemas.ParkingSearchPageRequest, db=Depends(database.get_async_db)):
+    _validate_listing(request)
+    if not (availability_index.fresh and booking_engine.fresh and quote_engine.loaded):
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(_load_indexes)
+    return StreamingResponse(_stream_loaded_indexes(request), media_type="application/x-ndjson")
+
+async def get_nearby_parking_spots_async(request: schemas.NearbySearchRequest, db=Depends(database.get_async_db)):
+    _validate_nearby(request)
+    if not (availability_index.fresh and booking_engine.fresh and spatial_index.loaded and quote_engine.loaded):
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(_load_nearby_indexes)
+    with tracing.span("api.search_nearby"):
+        return _search_nearby_loaded_indexes(request)
+
+async def quote_parking_async(request: schemas.QuoteRequest, db=Depends(database.get_async_db)):
+    _validate_quote(request)
+    if not (availability_index.fresh and booking_engine.fresh and quote_engine.loaded):
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(_load_indexes)
+    with tracing.span("api.quote"):
+        return _quote_loaded_indexes(request)
+
+async def get_vocabulary_async(db=Depends(database.get_async_db)):
+    if not availability_index.fresh:
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(availability_index.ensure_loaded)
+    return availability_index.vocabulary()
+
+async def book_parking_async(request: schemas.BookingRequest, db=Depends(database.get_async_db)):
+    with tracing.span("db.query"):
+        spot = await db.get(database.ParkingSpot, request.spot_id)
+    if not (booking_engine.fresh and quote_engine.loaded):
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(booking_engine.ensure_loaded)
+            await db.run_sync(quote_engine.ensure_loaded)
+    booking_fields = _prepare_booking(request, spot)
+    try:
+        with tracing.span("db.insert_booking"):
+            booking_id = await database.insert_booking_if_free_async(db, **booking_fields)
+    except Exception:
+        booking_engine.release(spot.id, booking_fields["start_time"], booking_fields["end_time"])
+        raise
+    if booking_id is None:
+        await db.run_sync(booking_engine.refresh_spot, spot.id)
+        raise HTTPException(status_code=400, detail=ALREADY_BOOKED)
+    return _after_booking(booking_id, booking_fields, spot)
+
+async def reset_availability_async(db=Depends(database.get_async_db)):
+    with tracing.span("db.query"):
+        await db.execute(update(database.ParkingSpot).values(is_available=True))
+        await db.execute(delete(database.Booking))
+    with tracing.span("db.commit"):
+        await db.commit()
+    if not availability_index.fresh:
+        with tracing.span("db.load_indexes"):
+            await db.run_sync(availability_index.ensure_loaded)
+    _after_reset()
+    return RESET_MESSAGE
+
+# --- Availability events (no database access; the same handlers serve both modes) ---
+def _last_event_id(request_or_socket, since: Optional[int]) -> Optional[int]:
+    header = request_or_socket.headers.get("last-event-id")
+    if since is None and header and header.isdigit():
+        return int(header)
+    return since
+
+@app.get("/availability/events")
+async def availability_event_stream(request: Request, location: Optional[str] = None, vehicle_type: Optional[str] = None,
+                                    slot_type: Optional[str] = None, since: Optional[int] = None):
+    """Server-Sent Events: booked/reset/resync events for spots matching the filters, as they happen."""
+    subscription = availability_events.subscribe(EventFilter(location, vehicle_type, slot_type),
+                                                 since=_last_event_id(request, since))
+
+    async def events():
+        try:
+            yield f"retry: 3000\n: subscribed at {availability_events.last_seq}\n\n"
+            while not subscription.closed and not await request.is_disconnected():
+                event = await subscription.get(EVENT_HEARTBEAT_SECONDS)
+                # A comment line on idle keeps proxies from closing the connection
+                yield format_sse(event) if event is not None else ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/availability/ws")
+async def availability_websocket(websocket: WebSocket, location: Optional[str] = None, vehicle_type: Optional[str] = None,
+                                 slot_type: Optional[str] = None, since: Optional[int] = None):
+    """
+    The same events as JSON messages. The client may send {"location": ..., "vehicle_type": ...,
+    "slot_type": ...} at any time to replace its filters.
+    """
+    await websocket.accept()
+    subscription = availability_events.subscribe(EventFilter(location, vehicle_type, slot_type),
+                                                 since=_last_event_id(websocket, since))
+
+    async def receive_filters():
+        try:
+            while True:
+                filters = await websocket.receive_json()
+                subscription.filter = EventFilter(filters.get("location"), filters.get("vehicle_type"),
+                                                  filters.get("slot_type"))
+        except (WebSocketDisconnect, ValueError, AttributeError):
+            pass
+        finally:
+            subscription.close()
+
+    receiver = asyncio.create_task(receive_filters())
+    try:
+        while not subscription.closed:
+            event = await subscription.get(EVENT_HEARTBEAT_SECONDS)
+            if event is not None:
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        subscription.close()
+
+# --- Routes ---
+if API_MODE == "async":
+    app.post("/get-parking-spots", response_model=List[schemas.ParkingSpotResponse])(get_parking_spots_async)
+    app.post("/get-parking-spots/page", response_model=schemas.ParkingSpotPage)(get_parking_spots_page_async)
+    app.post("/get-parking-spots/stream")(stream_parking_spots_async)
+    app.post("/get-parking-spots/nearby", response_model=List[schemas.NearbyParkingSpotResponse])(get_nearby_parking_spots_async)
+    app.post("/quote", response_model=schemas.QuoteResponse)(quote_parking_async)
+    app.get("/vocabulary", response_model=schemas.VocabularyResponse)(get_vocabulary_async)
+    app.post("/book-parking", response_model=schemas.BookingResponse)(book_parking_async)
+    app.post("/admin/reset-availability")(reset_availability_async)
+else:
+    app.post("/get-parking-spots", response_model=List[schemas.ParkingSpotResponse])(get_parking_spots)
+    app.post("/get-parking-spots/page", response_model=schemas.ParkingSpotPage)(get_parking_spots_page)
+    app.post("/get-parking-spots/stream")(stream_parking_spots)
+    app.post("/get-parking-spots/nearby", response_model=List[schemas.NearbyParkingSpotResponse])(get_nearby_parking_spots)
+    app.post("/quote", response_model=schemas.QuoteResponse)(quote_parking)
+    app.get("/vocabulary", response_model=schemas.VocabularyResponse)(get_vocabulary)
+    app.post("/book-parking", response_model=schemas.BookingResponse)(book_parking)
+    app.post("/admin/reset-availability")(reset_availability)
 
 # if __name__ == "__main__":
 #     import uvicorn
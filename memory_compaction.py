@@ -0,0 +1,184 @@
+# memory_compaction.py
+"""
+Compaction job for conversation memory. Per user it:
+  1. expires turns older than MEMORY_TTL_DAYS,
+  2. drops greetings and other low-information turns,
+  3. merges near-duplicate turns (keeping the newest),
+  4. folds turns older than MEMORY_SUMMARIZE_AFTER_DAYS into a single preference summary
+     row, e.g. "usually parks a car downtown, prefers covered".
+
+    python memory_compaction.py            # all users
+    python memory_compaction.py test_user_123
+
+With MEMORY_BACKEND=local, run it while the app is stopped (or call `compact_all()` from
+inside the app process), since it rewrites the per-user files.
+
+Preferences are recognized with the fast path's vocabulary (the parking API's values plus
+fast_path.SYNONYMS), loaded through the agent's tool transport. Without it, old turns are kept
+rather than summarized.
+"""
+import os
+import re
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import embeddings
+import fast_path
+import milvus_utils
+
+MEMORY_TTL_DAYS = float(os.getenv("MEMORY_TTL_DAYS", "90"))
+MEMORY_SUMMARIZE_AFTER_DAYS = float(os.getenv("MEMORY_SUMMARIZE_AFTER_DAYS", "7"))
+# Squared L2 between normalized embeddings (0 = identical, 2 = orthogonal)
+MEMORY_DEDUP_DISTANCE = float(os.getenv("MEMORY_DEDUP_DISTANCE", "0.1"))
+
+SUMMARY_ROLE = "summary"
+
+PREFERENCE_SLOTS = ("vehicle_type", "location", "slot_type")
+
+LOW_INFORMATION_TURNS = {
+    "hi", "hello", "hey", "hi there", "hello there", "good morning", "good afternoon", "good evening",
+    "thanks", "thank you", "thanks a lot", "thank you so much", "ok", "okay", "ok thanks", "okay thanks",
+    "cool", "great", "yes", "no", "yep", "nope", "sure", "bye", "goodbye", "see you",
+}
+
+
+def _parse_timestamp(metadata: dict) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(str(metadata.get("timestamp")))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_low_information(text: str) -> bool:
+    return re.sub(r"[^a-z0-9 ]", "", embeddings.normalize_text(text)).strip() in LOW_INFORMATION_TURNS
+
+
+def extract_preferences(text: str, gazetteer: Optional[fast_path.Gazetteer] = None) -> Dict[str, List[str]]:
+    """Canonical vehicle type, location and slot type values mentioned in `text` ({} without a vocabulary)."""
+    gazetteer = gazetteer or fast_path.get_gazetteer()
+    if gazetteer is None:
+        return {}
+    found = gazetteer.find(embeddings.normalize_text(text))
+    return {slot: sorted(values) for slot, values in found.items() if slot in PREFERENCE_SLOTS and values}
+
+
+def summarize_preferences(preferences: Dict[str, Dict[str, int]]) -> str:
+    """Most frequent value of each slot as one short sentence."""
+    top = {slot: Counter(counts).most_common(1)[0][0] for slot, counts in preferences.items() if counts}
+    parts = []
+    if "vehicle_type" in top and "location" in top:
+        parts.append(f"usually parks a {top['vehicle_type']} {top['location']}")
+    elif "vehicle_type" in top:
+        parts.append(f"usually parks a {top['vehicle_type']}")
+    elif "location" in top:
+        parts.append(f"usually parks {top['location']}")
+    if "slot_type" in top:
+        parts.append(f"prefers {top['slot_type']}")
+    return ", ".join(parts)
+
+
+def _dedupe(turns: List[dict], threshold: float) -> List[dict]:
+    """Near-duplicate turns (same role, within `threshold`); the newest of each group survives."""
+    kept_vectors: Dict[str, List[np.ndarray]] = {}
+    duplicates = []
+    for turn in sorted(turns, key=lambda t: t["metadata"].get("timestamp", ""), reverse=True):
+        role = turn["metadata"].get("role", "")
+        vector = np.asarray(turn["vector"], dtype=np.float32)
+        previous = kept_vectors.setdefault(role, [])
+        if previous and float(((np.stack(previous) - vector) ** 2).sum(axis=1).min()) <= threshold:
+            duplicates.append(turn)
+        else:
+            previous.append(vector)
+    return duplicates
+
+
+def compact_user(user_id: str, now: Optional[datetime] = None, backend=None) -> dict:
+    """Compacts one user's memory; returns how many turns each step removed."""
+    backend = backend or milvus_utils.get_memory_backend()
+    now = now or datetime.utcnow()
+    expire_before = now - timedelta(days=MEMORY_TTL_DAYS)
+    summarize_before = now - timedelta(days=MEMORY_SUMMARIZE_AFTER_DAYS)
+    stats = {"expired": 0, "low_information": 0, "duplicates": 0, "summarized": 0}
+
+    turns = backend.list_turns(user_id)
+    summaries = [t for t in turns if t["metadata"].get("role") == SUMMARY_ROLE]
+    delete, live = [], []
+    for turn in turns:
+        if turn["metadata"].get("role") == SUMMARY_ROLE:
+            continue
+        timestamp = _parse_timestamp(turn["metadata"])
+        if timestamp is not None and timestamp < expire_before:
+            stats["expired"] += 1
+            delete.append(turn)
+        elif is_low_information(turn["text"]):
+            stats["low_information"] += 1
+            delete.append(turn)
+        else:
+            live.append(turn)
+
+    duplicates = _dedupe(live, MEMORY_DEDUP_DISTANCE)
+    stats["duplicates"] = len(duplicates)
+    duplicate_ids = {id(t) for t in duplicates}
+    delete.extend(duplicates)
+    live = [t for t in live if id(t) not in duplicate_ids]
+
+    old = [t for t in live if (_parse_timestamp(t["metadata"]) or now) < summarize_before]
+    gazetteer = fast_path.get_gazetteer()
+    if old and gazetteer is None:
+        # Summarizing deletes the turns, so without a vocabulary their preferences would be lost
+        print(f"Memory compaction: no parking vocabulary; keeping {len(old)} old turns of {user_id} unsummarized.")
+        old = []
+    summary_row = None
+    if old:
+        # Counts are kept in the summary's metadata so later runs merge into it exactly
+        preferences: Dict[str, Counter] = {slot: Counter() for slot in PREFERENCE_SLOTS}
+        summarized = 0
+        for summary in summaries:
+            for slot, counts in summary["metadata"].get("preferences", {}).items():
+                preferences.setdefault(slot, Counter()).update(counts)
+            summarized += summary["metadata"].get("turns_summarized", 0)
+        for turn in old:
+            if turn["metadata"].get("role") == "user":
+                for slot, values in extract_preferences(turn["text"], gazetteer).items():
+                    preferences[slot].update(values)
+        stats["summarized"] = len(old)
+        delete.extend(old + summaries)
+        text = summarize_preferences(preferences)
+        if text:
+            summary_row = (text, {
+                "user_id": user_id,
+                "role": SUMMARY_ROLE,
+                "timestamp": now.isoformat(),
+                "preferences": {slot: dict(counts) for slot, counts in preferences.items() if counts},
+                "turns_summarized": summarized + len(old),
+            })
+
+    if delete:
+        backend.delete_turns(user_id, [t["id"] for t in delete])
+    if summary_row is not None:
+        backend.add_turns([summary_row[0]], [summary_row[1]], [embeddings.embed_text(summary_row[0])])
+    stats["kept"] = len(turns) - len(delete) + (summary_row is not None)
+    return stats
+
+
+def compact_all(now: Optional[datetime] = None, backend=None) -> dict:
+    backend = backend or milvus_utils.get_memory_backend()
+    totals = Counter()
+    for user_id in backend.list_users():
+        totals.update(compact_user(user_id, now=now, backend=backend))
+        totals["users"] += 1
+    return dict(totals)
+
+
+if __name__ == "__main__":
+    import agent_logic  # registers the vocabulary loader (the agent's tool transport)
+    users = sys.argv[1:]
+    if users:
+        for user in users:
+            print(f"{user}: {compact_user(user)}")
+    else:
+        print(compact_all())
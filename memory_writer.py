@@ -0,0 +1,182 @@
+# memory_writer.py
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+import embeddings
+import milvus_utils
+
+# "background" (write-behind queue) or "sync" (insert on the caller's thread, as before)
+MEMORY_WRITE_MODE = os.getenv("MEMORY_WRITE_MODE", "background")
+MEMORY_QUEUE_SIZE = int(os.getenv("MEMORY_QUEUE_SIZE", "1000"))
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "64"))
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "0.2"))
+# How long enqueue waits for space when the queue is full before dropping the turn
+MEMORY_ENQUEUE_TIMEOUT = float(os.getenv("MEMORY_ENQUEUE_TIMEOUT", "0.05"))
+READ_YOUR_WRITES = os.getenv("MEMORY_READ_YOUR_WRITES", "true").lower() == "true"
+
+
+class _PendingTurn:
+    __slots__ = ("text", "metadata", "vector")
+
+    def __init__(self, text: str, metadata: dict, vector: Optional[List[float]]):
+        self.text = text
+        self.metadata = metadata
+        self.vector = vector
+
+
+class MemoryWriteBehind:
+    """
+    Bounded queue plus one worker thread that writes conversation turns to Milvus in
+    multi-row batches, off the request path. Turns stay visible to `search_pending`
+    until their batch has been inserted, so the current turn can still be retrieved.
+    """
+
+    def __init__(self, max_size: int = MEMORY_QUEUE_SIZE, batch_size: int = MEMORY_BATCH_SIZE,
+                 flush_interval: float = MEMORY_FLUSH_INTERVAL, enqueue_timeout: float = MEMORY_ENQUEUE_TIMEOUT,
+                 writer=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._writer = writer or milvus_utils.store_conversation_turns
+        self._queue: "queue.Queue[_PendingTurn]" = queue.Queue(maxsize=max_size)
+        self._pending: List[_PendingTurn] = []  # enqueued but not yet written
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.metrics = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "max_depth": 0}
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, text: str, metadata: dict, embedding: Optional[List[float]] = None) -> bool:
+        """Queues one turn. Returns False (and counts a drop) if the queue stays full past the timeout."""
+        self.start()
+        turn = _PendingTurn(text, metadata, embedding)
+        with self._pending_lock:
+            self._pending.append(turn)
+        try:
+            self._queue.put(turn, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._pending_lock:
+                self._pending.remove(turn)
+            self._count("dropped")
+            print(f"Memory write queue full; dropped a '{metadata.get('role')}' turn.")
+            return False
+        self._count("enqueued")
+        with self._pending_lock:
+            self.metrics["max_depth"] = max(self.metrics["max_depth"], self._queue.qsize())
+        return True
+
+    def _count(self, metric: str, amount: int = 1) -> None:
+        with self._pending_lock:
+            self.metrics[metric] += amount
+
+    def _next_batch(self) -> List[_PendingTurn]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[_PendingTurn]) -> None:
+        try:
+            # Turns queued without a vector (e.g. assistant replies) are encoded together in one call
+            missing = [turn for turn in batch if turn.vector is None]
+            if missing:
+                for turn, vector in zip(missing, embeddings.embed_texts([t.text for t in missing])):
+                    turn.vector = vector
+            keys = self._writer([t.text for t in batch], [t.metadata for t in batch], [t.vector for t in batch])
+            self._count("failed" if keys is None else "written", len(batch))
+            self._count("batches")
+        except Exception as e:
+            self._count("failed", len(batch))
+            print(f"Memory write-behind batch failed: {e}")
+        finally:
+            with self._pending_lock:
+                written = set(map(id, batch))
+                self._pending = [turn for turn in self._pending if id(turn) not in written]
+            for _ in batch:
+                self._queue.task_done()
+
+    def search_pending(self, user_id: str, query_embedding: List[float], top_k: int) -> List[dict]:
+        """Nearest not-yet-written turns for `user_id`, in the shape of `retrieve_relevant_history`."""
+        with self._pending_lock:
+            candidates = [t for t in self._pending if t.vector is not None and t.metadata.get("user_id") == user_id]
+        results = []
+        for turn in candidates:
+            distance = sum((a - b) ** 2 for a, b in zip(turn.vector, query_embedding))
+            results.append({"text": turn.text, "metadata": turn.metadata, "distance": distance})
+        return sorted(results, key=lambda x: x["distance"])[:top_k]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until everything queued so far is written. Returns False on timeout."""
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        self.flush(timeout)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            return dict(self.metrics, depth=self._queue.qsize(), pending=len(self._pending))
+
+
+memory_writer = MemoryWriteBehind()
+atexit.register(memory_writer.shutdown)
+
+
+def store_turn(text: str, metadata: dict, embedding: Optional[List[float]] = None) -> None:
+    if MEMORY_WRITE_MODE == "sync":
+        milvus_utils.store_conversation_turn(text, metadata, embedding=embedding)
+    else:
+        memory_writer.enqueue(text, metadata, embedding)
+
+
+def retrieve_relevant_history(query_text: str, user_id: str, top_k: int = 5,
+                              query_embedding: Optional[List[float]] = None) -> List[dict]:
+    """`milvus_utils.retrieve_relevant_history`, plus matching turns still waiting in the write queue."""
+    if query_embedding is None:
+        query_embedding = embeddings.embed_text(query_text)
+    history = milvus_utils.retrieve_relevant_history(query_text, user_id, top_k=top_k, query_embedding=query_embedding)
+    if MEMORY_WRITE_MODE == "sync" or not READ_YOUR_WRITES:
+        return history
+    pending = memory_writer.search_pending(user_id, query_embedding, top_k)
+    if not pending:
+        return history
+    # The same turn may be in both if its batch landed between the two reads
+    seen = {(item["text"], item["metadata"].get("timestamp")) for item in history}
+    merged = history + [p for p in pending if (p["text"], p["metadata"].get("timestamp")) not in seen]
+    return sorted(merged, key=lambda x: x["distance"])[:top_k]
@@ -1,21 +1,39 @@
 # milvus_utils.py
-from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
-from sentence_transformers import SentenceTransformer
+# pymilvus is imported on first use, so MEMORY_BACKEND=local (and importing this module) never loads it
+from typing import List, Optional
 import os
+import threading
+import time
+import embeddings
+import tracing
+from startup import startup_profile
 
 MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
 MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
-COLLECTION_NAME = "parking_conversations"
+# Turns are partitioned by user_id; the pre-partitioning collection can be copied over
+# with migrate_legacy_collection().
+COLLECTION_NAME = "parking_conversations_by_user"
+LEGACY_COLLECTION_NAME = "parking_conversations"
 EMBEDDING_DIM = 384 
 INDEX_FIELD_NAME = "embedding"
 ID_FIELD_NAME = "id"
+USER_ID_FIELD_NAME = "user_id"
 TEXT_FIELD_NAME = "text"
 METADATA_FIELD_NAME = "metadata" 
+NUM_PARTITIONS = int(os.getenv("MILVUS_NUM_PARTITIONS", "64"))
+# "milvus" (server, see docker-compose.yml) or "local" (embedded memory-mapped store, no server)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "milvus")
+LOCAL_MEMORY_DIR = os.getenv("LOCAL_MEMORY_DIR", "./memory_store")
 
-# Initialize embedding model
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+def __getattr__(name):
+    # `embedding_model` used to be loaded at import; it is now the lazily loaded shared model
+    if name == "embedding_model":
+        return embeddings.get_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_milvus_connection():
+    with startup_profile.timed("import pymilvus"):
+        from pymilvus import connections
     try:
         connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
         print(f"Connected to Milvus at {MILVUS_HOST}:{MILVUS_PORT}")
@@ -24,16 +42,20 @@ def get_milvus_connection():
         raise
 
 def create_milvus_collection_if_not_exists():
+    from pymilvus import utility, Collection, CollectionSchema, FieldSchema, DataType
     get_milvus_connection()
     if not utility.has_collection(COLLECTION_NAME):
         fields = [
             FieldSchema(name=ID_FIELD_NAME, dtype=DataType.INT64, is_primary=True, auto_id=True),
+            # Partition key: Milvus hashes user_id into NUM_PARTITIONS partitions and a search
+            # filtered on user_id only visits that user's partition
+            FieldSchema(name=USER_ID_FIELD_NAME, dtype=DataType.VARCHAR, max_length=256, is_partition_key=True),
             FieldSchema(name=TEXT_FIELD_NAME, dtype=DataType.VARCHAR, max_length=65535), # Increased max_length
             FieldSchema(name=METADATA_FIELD_NAME, dtype=DataType.JSON), # For user_id, role, entities
             FieldSchema(name=INDEX_FIELD_NAME, dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM)
         ]
         schema = CollectionSchema(fields, description="Parking conversation history")
-        collection = Collection(COLLECTION_NAME, schema=schema)
+        collection = Collection(COLLECTION_NAME, schema=schema, num_partitions=NUM_PARTITIONS)
         print(f"Collection '{COLLECTION_NAME}' created.")
 
         # Create an index
@@ -52,47 +74,220 @@ def create_milvus_collection_if_not_exists():
         print(f"Collection '{COLLECTION_NAME}' already exists and is loaded.")
     return collection
 
-def store_conversation_turn(text: str, metadata: dict):
-    collection = create_milvus_collection_if_not_exists()
-    embedding = embedding_model.encode(text).tolist()
-    data = [
-        [text],
-        [metadata], 
-        [embedding]
-    ]
-    try:
-        mr = collection.insert(data)
+def user_filter_expr(user_id: str) -> str:
+    # Filtering on the partition-key field (not the JSON metadata) lets Milvus prune partitions
+    escaped = user_id.replace("\\", "\\\\").replace("'", "\\'")
+    return f"{USER_ID_FIELD_NAME} == '{escaped}'"
+
+def migrate_legacy_collection(batch_size: int = 1000) -> int:
+    """
+    Copies turns from the old collection (user_id only inside the JSON metadata) into the
+    partitioned one. Run once after upgrading; returns the number of rows copied.
+    """
+    from pymilvus import utility, Collection
+    get_milvus_connection()
+    if not utility.has_collection(LEGACY_COLLECTION_NAME):
+        return 0
+    legacy = Collection(LEGACY_COLLECTION_NAME)
+    legacy.load()
+    target = memory_store.get_collection()
+    copied, last_id = 0, -1
+    while True:
+        rows = legacy.query(
+            expr=f"{ID_FIELD_NAME} > {last_id}",
+            output_fields=[ID_FIELD_NAME, TEXT_FIELD_NAME, METADATA_FIELD_NAME, INDEX_FIELD_NAME],
+            limit=batch_size,
+        )
+        if not rows:
+            break
+        rows.sort(key=lambda r: r[ID_FIELD_NAME])
+        last_id = rows[-1][ID_FIELD_NAME]
+        target.insert([
+            [str((r[METADATA_FIELD_NAME] or {}).get("user_id", "")) for r in rows],
+            [r[TEXT_FIELD_NAME] for r in rows],
+            [r[METADATA_FIELD_NAME] for r in rows],
+            [r[INDEX_FIELD_NAME] for r in rows],
+        ])
+        copied += len(rows)
+    print(f"Migrated {copied} turns from '{LEGACY_COLLECTION_NAME}' to '{COLLECTION_NAME}'.")
+    return copied
+
+class MilvusMemoryStore:
+    """
+    Connects and loads the collection once, then reuses the cached `Collection` handle for
+    every insert and search. If a call fails with a Milvus error, the handle is dropped and
+    the call is retried once on a fresh connection.
+    """
+
+    def __init__(self, collection_name: str = COLLECTION_NAME):
+        self.collection_name = collection_name
+        self._collection = None
+        self._lock = threading.Lock()
+        self.connected_at = None
+        self.reconnects = 0
+        self.last_error = None
+
+    def get_collection(self) -> "Collection":
+        collection = self._collection
+        if collection is None:
+            with self._lock:
+                if self._collection is None:
+                    with startup_profile.timed(f"open Milvus collection {self.collection_name}"):
+                        self._collection = create_milvus_collection_if_not_exists()
+                    self.connected_at = time.time()
+                collection = self._collection
+        return collection
+
+    def reset(self) -> None:
+        with self._lock:
+            self._collection = None
+            try:
+                from pymilvus import connections
+                connections.disconnect("default")
+            except Exception:
+                pass
+
+    def _call(self, operation):
+        from pymilvus.exceptions import MilvusException
+        try:
+            return operation(self.get_collection())
+        except MilvusException as e:
+            self.last_error = str(e)
+            print(f"Milvus call failed ({e}); reconnecting.")
+            self.reset()
+            self.reconnects += 1
+            return operation(self.get_collection())
+
+    def insert(self, data):
+        with tracing.span("milvus.insert"):
+            return self._call(lambda collection: collection.insert(data))
+
+    def search(self, **search_kwargs):
+        with tracing.span("milvus.search"):
+            return self._call(lambda collection: collection.search(**search_kwargs))
+
+    # --- Memory backend interface (shared with local_vector_store.LocalVectorStore) ---
+    def open(self) -> None:
+        self.get_collection()
+
+    def add_turns(self, texts: List[str], metadatas: List[dict], vectors: List[List[float]]):
+        user_ids = [str(metadata.get("user_id", "")) for metadata in metadatas]
+        mr = self.insert([user_ids, list(texts), list(metadatas), list(vectors)])
         return mr.primary_keys
+
+    def search_turns(self, user_id: str, query_embedding: List[float], top_k: int) -> List[dict]:
+        search_params = {
+            "metric_type": "L2",
+            "params": {"nprobe": 10}, 
+        }
+        expr_filter = user_filter_expr(user_id)
+
+        results = self.search(
+            data=[query_embedding],
+            anns_field=INDEX_FIELD_NAME,
+            param=search_params,
+            limit=top_k,
+            expr=expr_filter,
+            output_fields=[TEXT_FIELD_NAME, METADATA_FIELD_NAME] 
+        )
+
+        history = []
+        for hits in results:
+            for hit in hits:
+                history.append({
+                    "text": hit.entity.get(TEXT_FIELD_NAME),
+                    "metadata": hit.entity.get(METADATA_FIELD_NAME),
+                    "distance": hit.distance
+                })
+        return history
+
+    def _query_all(self, expr: str, output_fields: List[str], page_size: int = 1000) -> List[dict]:
+        # Pages by primary key; a single Milvus query is capped at 16384 rows
+        rows, last_id = [], -1
+        while True:
+            page = self._call(lambda collection: collection.query(
+                expr=f"({expr}) and {ID_FIELD_NAME} > {last_id}",
+                output_fields=output_fields,
+                limit=page_size,
+            ))
+            if not page:
+                return rows
+            page.sort(key=lambda r: r[ID_FIELD_NAME])
+            last_id = page[-1][ID_FIELD_NAME]
+            rows.extend(page)
+
+    def list_turns(self, user_id: str) -> List[dict]:
+        rows = self._query_all(user_filter_expr(user_id),
+                               [ID_FIELD_NAME, TEXT_FIELD_NAME, METADATA_FIELD_NAME, INDEX_FIELD_NAME])
+        return [{"id": r[ID_FIELD_NAME], "text": r[TEXT_FIELD_NAME], "metadata": r[METADATA_FIELD_NAME],
+                 "vector": r[INDEX_FIELD_NAME]} for r in rows]
+
+    def delete_turns(self, user_id: str, ids: List) -> int:
+        if not ids:
+            return 0
+        expr = f"{ID_FIELD_NAME} in [{', '.join(str(int(i)) for i in ids)}]"
+        return self._call(lambda collection: collection.delete(expr)).delete_count
+
+    def list_users(self) -> List[str]:
+        rows = self._query_all(f"{ID_FIELD_NAME} >= 0", [ID_FIELD_NAME, USER_ID_FIELD_NAME])
+        return sorted({r[USER_ID_FIELD_NAME] for r in rows})
+
+    def health(self, check: bool = False) -> dict:
+        """Connection status; with `check=True` also does a round trip to the server."""
+        status = {
+            "backend": "milvus",
+            "connected": self._collection is not None,
+            "collection": self.collection_name,
+            "connected_at": self.connected_at,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+        if check:
+            try:
+                from pymilvus import utility
+                status["reachable"] = utility.has_collection(self.collection_name)
+            except Exception as e:
+                status["reachable"] = False
+                status["last_error"] = self.last_error = str(e)
+        return status
+
+
+memory_store = MilvusMemoryStore()
+_memory_backend = None
+_memory_backend_lock = threading.Lock()
+
+def get_memory_backend():
+    """The configured conversation-memory backend (MEMORY_BACKEND), created on first use."""
+    global _memory_backend
+    if _memory_backend is None:
+        with _memory_backend_lock:
+            if _memory_backend is None:
+                if MEMORY_BACKEND == "local":
+                    from local_vector_store import LocalVectorStore
+                    _memory_backend = LocalVectorStore(LOCAL_MEMORY_DIR, dim=EMBEDDING_DIM)
+                elif MEMORY_BACKEND == "milvus":
+                    _memory_backend = memory_store
+                else:
+                    raise ValueError(f"Unknown MEMORY_BACKEND '{MEMORY_BACKEND}'. Use 'milvus' or 'local'.")
+    return _memory_backend
+
+def store_conversation_turn(text: str, metadata: dict, embedding: Optional[List[float]] = None):
+    """`embedding` can be passed in when the caller already encoded `text` (e.g. to search with it too)."""
+    return store_conversation_turns([text], [metadata], None if embedding is None else [embedding])
+
+def store_conversation_turns(texts: List[str], metadatas: List[dict], vectors: Optional[List[List[float]]] = None):
+    """Inserts several turns in one multi-row insert; missing vectors are batch-encoded in one call."""
+    if vectors is None:
+        vectors = embeddings.embed_texts(texts)
+    try:
+        return get_memory_backend().add_turns(texts, metadatas, vectors)
     except Exception as e:
-        print(f"Error inserting into Milvus: {e}")
+        print(f"Error inserting into conversation memory: {e}")
         return None
 
 
-def retrieve_relevant_history(query_text: str, user_id: str, top_k: int = 5):
-    collection = create_milvus_collection_if_not_exists()
-    query_embedding = embedding_model.encode(query_text).tolist()
-
-    search_params = {
-        "metric_type": "L2",
-        "params": {"nprobe": 10}, 
-    }
-    expr_filter = f"metadata['user_id'] == '{user_id}'"
-
-    results = collection.search(
-        data=[query_embedding],
-        anns_field=INDEX_FIELD_NAME,
-        param=search_params,
-        limit=top_k,
-        expr=expr_filter,
-        output_fields=[TEXT_FIELD_NAME, METADATA_FIELD_NAME] 
-    )
-
-    history = []
-    for hits in results:
-        for hit in hits:
-            history.append({
-                "text": hit.entity.get(TEXT_FIELD_NAME),
-                "metadata": hit.entity.get(METADATA_FIELD_NAME),
-                "distance": hit.distance
-            })
-    return sorted(history, key=lambda x: x['metadata'].get('timestamp', 0)) 
\ No newline at end of file
+def retrieve_relevant_history(query_text: str, user_id: str, top_k: int = 5, query_embedding: Optional[List[float]] = None):
+    if query_embedding is None:
+        query_embedding = embeddings.embed_text(query_text)
+    # Most relevant first (ascending distance), as returned by the backend
+    return get_memory_backend().search_turns(user_id, query_embedding, top_k)
@@ -0,0 +1,203 @@
+# quote_engine.py
+"""
+Price quotes for many spots and time windows in one NumPy pass.
+
+A spot's total for a window is its price_per_hour times the window's hours, each hour weighted
+by the rate of its (location, spot type) group at that hour of the week:
+
+    rate = time-of-day multiplier (RATE_TABLES_PATH) * (1 + DEMAND_PRICING_WEIGHT * utilization)
+
+where utilization is the share of the group's spot-hours booked at that hour of the week over
+the last DEMAND_LOOKBACK_DAYS. With no rate file and DEMAND_PRICING_WEIGHT=0 (the defaults)
+every rate is 1 and totals are hours * price_per_hour.
+
+Rate file format (multipliers by hour range, end exclusive, may wrap midnight; most specific key wins):
+    {"default": {"weekday": {"8-10": 1.25, "17-19": 1.25}, "weekend": {"22-6": 0.7}},
+     "downtown": {"weekday": {"7-20": 1.5}},
+     "airport/long-term": {"all": {"0-24": 0.8}}}
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import database
+from availability_index import normalize_key
+from booking_engine import booking_engine, to_naive_local
+
+RATE_TABLES_PATH = os.getenv("RATE_TABLES_PATH")
+DEMAND_PRICING_WEIGHT = float(os.getenv("DEMAND_PRICING_WEIGHT", "0"))  # 0.5 = up to +50% at full utilization
+DEMAND_LOOKBACK_DAYS = int(os.getenv("DEMAND_LOOKBACK_DAYS", "28"))
+DEMAND_REFRESH_SECONDS = float(os.getenv("DEMAND_REFRESH_SECONDS", "300"))
+
+HOURS_PER_WEEK = 168
+_EPOCH = datetime(2024, 1, 1)  # a Monday 00:00; hour-of-week 0
+_BUCKETS = np.arange(HOURS_PER_WEEK, dtype=np.float64)
+
+
+def hours_since_epoch(values: Sequence[datetime]) -> np.ndarray:
+    return np.array([(to_naive_local(v) - _EPOCH) / timedelta(hours=1) for v in values], dtype=np.float64)
+
+
+def week_coverage(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """(N, 168) hours each [start, end) window spends in each hour-of-week bucket."""
+    return _cumulative_coverage(ends) - _cumulative_coverage(starts)
+
+
+def _cumulative_coverage(hours: np.ndarray) -> np.ndarray:
+    # Hours spent in each bucket between the epoch and `hours`: one per full week, plus the partial week
+    weeks, remainder = np.divmod(hours, HOURS_PER_WEEK)
+    return weeks[:, None] + np.clip(remainder[:, None] - _BUCKETS[None, :], 0.0, 1.0)
+
+
+def _parse_hour_ranges(ranges: Dict[str, float]) -> np.ndarray:
+    day = np.ones(24)
+    for hours, multiplier in ranges.items():
+        start, end = (int(h) for h in hours.split("-"))
+        span = range(start, end) if start < end else list(range(start, 24)) + list(range(0, end))
+        for hour in span:
+            day[hour % 24] = multiplier
+    return day
+
+
+def _week_multipliers(table: dict) -> np.ndarray:
+    """168 multipliers from {"all"|"weekday"|"weekend": {"h-h": multiplier}}."""
+    week = np.ones(HOURS_PER_WEEK)
+    if "all" in table:
+        week[:] = np.tile(_parse_hour_ranges(table["all"]), 7)
+    if "weekday" in table:
+        week[:120] = np.tile(_parse_hour_ranges(table["weekday"]), 5)
+    if "weekend" in table:
+        week[120:] = np.tile(_parse_hour_ranges(table["weekend"]), 2)
+    return week
+
+
+def load_rate_tables(path: Optional[str] = RATE_TABLES_PATH) -> Dict[str, np.ndarray]:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {normalize_key(key): _week_multipliers(table) for key, table in raw.items()}
+
+
+class QuoteEngine:
+    """
+    Spot prices and (location, spot type) group rates as arrays. Totals for S spots and W
+    windows are price[S] * (rates[group[S]] @ coverage[W].T): one matrix product, no per-spot loop.
+    """
+
+    def __init__(self, rate_tables: Optional[Dict[str, np.ndarray]] = None,
+                 demand_weight: float = DEMAND_PRICING_WEIGHT):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.rate_tables = load_rate_tables() if rate_tables is None else rate_tables
+        self.demand_weight = demand_weight
+        self.spot_ids = np.zeros(0, dtype=np.int64)  # sorted
+        self.prices = np.zeros(0)
+        self.groups = np.zeros(0, dtype=np.int64)
+        self.group_names: List[Tuple[str, str]] = []
+        self.time_of_day = np.ones((0, HOURS_PER_WEEK))
+        self.demand = np.ones((0, HOURS_PER_WEEK))
+        self._demand_computed_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db) -> None:
+        rows = db.query(database.ParkingSpot.id, database.ParkingSpot.location,
+                        database.ParkingSpot.spot_type, database.ParkingSpot.price_per_hour).order_by(database.ParkingSpot.id).all()
+        self.build([(row.id, row.location, row.spot_type, row.price_per_hour) for row in rows])
+        print(f"Quote engine loaded {len(rows)} spots in {len(self.group_names)} rate groups.")
+
+    def build(self, spots: List[Tuple[int, str, str, float]]) -> None:
+        """(Re)builds from (id, location, spot_type, price_per_hour) rows sorted by id."""
+        group_index: Dict[Tuple[str, str], int] = {}
+        groups = []
+        for _, location, spot_type, _ in spots:
+            key = (normalize_key(location), normalize_key(spot_type))
+            groups.append(group_index.setdefault(key, len(group_index)))
+        with self._lock:
+            self.spot_ids = np.array([s[0] for s in spots], dtype=np.int64)
+            self.prices = np.array([s[3] for s in spots], dtype=np.float64)
+            self.groups = np.array(groups, dtype=np.int64)
+            self.group_names = list(group_index)
+            self.time_of_day = np.stack([self._rate_table(*name) for name in self.group_names]) if self.group_names \
+                else np.ones((0, HOURS_PER_WEEK))
+            self.demand = np.ones_like(self.time_of_day)
+            self._demand_computed_at = 0.0
+            self._loaded = True
+
+    def ensure_loaded(self, db) -> None:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load(db)
+
+    def _rate_table(self, location: str, spot_type: str) -> np.ndarray:
+        for key in (f"{location}/{spot_type}", location, "default"):
+            if key in self.rate_tables:
+                return self.rate_tables[key]
+        return np.ones(HOURS_PER_WEEK)
+
+    def refresh_demand(self, now: Optional[datetime] = None) -> None:
+        """Recomputes per-group utilization by hour of week from the booking engine's schedules."""
+        now = now or datetime.now()
+        since = now - timedelta(days=DEMAND_LOOKBACK_DAYS)
+        with self._lock:
+            row_of = {int(spot_id): row for row, spot_id in enumerate(self.spot_ids)}
+            booked = np.zeros_like(self.time_of_day)
+            starts, ends, groups = [], [], []
+            for spot_id, (start, end) in _recent_bookings(since, now):
+                row = row_of.get(spot_id)
+                if row is not None:
+                    starts.append(max(start, since))
+                    ends.append(min(end, now))
+                    groups.append(self.groups[row])
+            if starts:
+                np.add.at(booked, np.array(groups), week_coverage(hours_since_epoch(starts), hours_since_epoch(ends)))
+            spots_per_group = np.bincount(self.groups, minlength=len(self.group_names)).astype(np.float64)
+            capacity = spots_per_group[:, None] * (DEMAND_LOOKBACK_DAYS / 7)  # spot-hours per bucket
+            utilization = np.divide(booked, capacity, out=np.zeros_like(booked), where=capacity > 0)
+            self.demand = 1.0 + self.demand_weight * np.clip(utilization, 0.0, 1.0)
+            self._demand_computed_at = time.monotonic()
+
+    def rates(self) -> np.ndarray:
+        """(groups, 168) hourly multipliers; demand is refreshed every DEMAND_REFRESH_SECONDS."""
+        if self.demand_weight and time.monotonic() - self._demand_computed_at > DEMAND_REFRESH_SECONDS:
+            self.refresh_demand()
+        return self.time_of_day * self.demand
+
+    def quote(self, spot_ids: Sequence[int], windows: Sequence[Tuple[datetime, datetime]]) -> np.ndarray:
+        """(len(spot_ids), len(windows)) totals, rounded to cents; NaN for unknown spot IDs."""
+        ids = np.asarray(spot_ids, dtype=np.int64)
+        with self._lock:
+            rows = np.clip(np.searchsorted(self.spot_ids, ids), 0, max(len(self.spot_ids) - 1, 0))
+            known = (self.spot_ids[rows] == ids) if len(self.spot_ids) else np.zeros(len(ids), dtype=bool)
+            coverage = week_coverage(hours_since_epoch([w[0] for w in windows]),
+                                     hours_since_epoch([w[1] for w in windows]))
+            weighted_hours = self.rates() @ coverage.T  # (groups, windows)
+            totals = self.prices[rows, None] * weighted_hours[self.groups[rows]] if len(self.spot_ids) \
+                else np.zeros((len(ids), len(windows)))
+        totals = np.round(totals, 2)
+        totals[~known] = np.nan
+        return totals
+
+    def quote_one(self, spot_id: int, start: datetime, end: datetime) -> Optional[float]:
+        total = self.quote([spot_id], [(start, end)])[0, 0]
+        return None if np.isnan(total) else float(total)
+
+
+def _recent_bookings(since: datetime, until: datetime):
+    for spot_id in list(booking_engine.schedules):
+        for start, end in booking_engine.bookings_for(spot_id):
+            if end > since and start < until:
+                yield spot_id, (start, end)
+
+
+# Shared by all API workers in this process
+quote_engine = QuoteEngine()
@@ -0,0 +1,243 @@
+# response_cache.py
+"""
+Two cache tiers in front of the agent:
+  - ToolResultCache: /get-parking-spots results keyed by the normalized search input, with a
+    short TTL. Entries listing a spot are dropped when that spot is booked from this process.
+  - SemanticResponseCache: whole answers to search-only turns, looked up by embedding cosine
+    similarity, LRU-evicted. Bookings drop the answers that showed the booked spot.
+Bookings made by other processes are only picked up when the TTL runs out.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "30"))
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "120"))
+
+
+class _CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def as_dict(self, size: int) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "avg_hit_ms": self.hit_seconds / self.hits * 1000 if self.hits else None,
+            "avg_miss_ms": self.miss_seconds / self.misses * 1000 if self.misses else None,
+        }
+
+
+def _norm(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = re.sub(r"\s+", " ", str(value)).strip().lower()
+    return value or None
+
+
+def spot_ids_in(spots: Iterable[dict]) -> frozenset:
+    return frozenset(spot["id"] for spot in spots if isinstance(spot, dict) and "id" in spot)
+
+
+class ToolResultCache:
+    """
+    Search results keyed by normalized (vehicle, location, slot, start, end); TTL plus LRU bound.
+    A cached value is a list of spots, or any result with its `spot_ids` given explicitly.
+    """
+
+    def __init__(self, ttl_seconds: float = TOOL_CACHE_TTL, max_size: int = TOOL_CACHE_SIZE):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any, frozenset]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = _CacheStats()
+
+    @staticmethod
+    def key(vehicle_type=None, location=None, slot_type=None, start_datetime_str=None, end_datetime_str=None) -> Tuple:
+        return (_norm(vehicle_type), _norm(location), _norm(slot_type), _norm(start_datetime_str), _norm(end_datetime_str))
+
+    def get(self, key: Tuple) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Tuple, spots: Any, spot_ids: Optional[frozenset] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), spots, spot_ids_in(spots) if spot_ids is None else spot_ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def record(self, hit: bool, seconds: float) -> None:
+        with self._lock:
+            if hit:
+                self._stats.hits += 1
+                self._stats.hit_seconds += seconds
+            else:
+                self._stats.misses += 1
+                self._stats.miss_seconds += seconds
+
+    def invalidate_spot(self, spot_id: int) -> int:
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if spot_id in entry[2]]
+            for key in stale:
+                del self._entries[key]
+            self._stats.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats.as_dict(len(self._entries)), ttl_seconds=self.ttl)
+
+
+class _Answer:
+    __slots__ = ("vector", "text", "slots", "spot_ids", "created")
+
+    def __init__(self, vector: np.ndarray, text: str, slots: Dict, spot_ids: frozenset):
+        self.vector = vector
+        self.text = text
+        self.slots = slots
+        self.spot_ids = spot_ids
+        self.created = time.monotonic()
+
+
+class SemanticResponseCache:
+    """
+    Answers to search-only turns, keyed by the query embedding. A lookup hits when the most
+    similar cached query is at least `threshold` cosine-similar and has the same slots: vehicle,
+    location, slot type, time window and user (near-identical embeddings of "covered" and "open",
+    or of "2pm to 4pm" and "6pm to 9pm", must not match).
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_size: int = SEMANTIC_CACHE_SIZE,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[int, _Answer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = _CacheStats()
+
+    def lookup(self, query_embedding: List[float], slots: Dict) -> Optional[str]:
+        started = time.perf_counter()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            now = time.monotonic()
+            for entry_id in [i for i, e in self._entries.items() if now - e.created > self.ttl]:
+                del self._entries[entry_id]
+            candidates = [(i, e) for i, e in self._entries.items() if e.slots == slots]
+            text = None
+            if candidates:
+                similarities = np.stack([e.vector for _, e in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    text = entry.text
+            elapsed = time.perf_counter() - started
+            if text is None:
+                self._stats.misses += 1
+                self._stats.miss_seconds += elapsed
+            else:
+                self._stats.hits += 1
+                self._stats.hit_seconds += elapsed
+            return text
+
+    def store(self, query_embedding: List[float], slots: Dict, text: str, spot_ids: frozenset) -> None:
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self._entries[self._next_id] = _Answer(vector, text, slots, spot_ids)
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate_spot(self, spot_id: int) -> int:
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if spot_id in e.spot_ids]
+            for entry_id in stale:
+                del self._entries[entry_id]
+            self._stats.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats.as_dict(len(self._entries)), threshold=self.threshold, ttl_seconds=self.ttl)
+
+
+def parse_spot_list(observation: str) -> Optional[list]:
+    """The spots of a search tool result ("Found parking spots: [...]", maybe followed by a note); else None."""
+    prefix = "Found parking spots:"
+    if not observation.startswith(prefix):
+        return None
+    try:
+        spots, _ = json.JSONDecoder().raw_decode(observation[len(prefix):].lstrip())
+    except ValueError:
+        return None
+    return spots if isinstance(spots, list) else None
+
+
+def spot_ids_from_search_output(observation: str) -> Optional[frozenset]:
+    """Spot IDs listed in a search tool result; None if not a result list."""
+    spots = parse_spot_list(observation)
+    if spots is not None:
+        return spot_ids_in(spots)
+    return frozenset() if observation.startswith("No parking spots found") else None
+
+
+tool_result_cache = ToolResultCache()
+semantic_cache = SemanticResponseCache()
+
+
+def invalidate_spot(spot_id: int) -> None:
+    """Called when `spot_id` is booked: drops every cached result and answer that listed it."""
+    tool_result_cache.invalidate_spot(spot_id)
+    semantic_cache.invalidate_spot(spot_id)
+
+
+def clear() -> None:
+    tool_result_cache.clear()
+    semantic_cache.clear()
+
+
+def stats() -> dict:
+    return {"tool_results": tool_result_cache.stats(), "answers": semantic_cache.stats()}
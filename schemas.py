@@ -7,6 +7,14 @@ class ParkingSearchRequest(BaseModel):
     vehicle_type: Optional[str] = None
     location: Optional[str] = None
     slot_type: Optional[str] = None # e.g., covered, open
+    start_time: Optional[datetime] = None # Only spots free for the whole window are returned
+    end_time: Optional[datetime] = None
+    sort_by: str = "id" # "id", "price" or "total_price" (the window's quoted total; needs start/end time)
+
+class ParkingSearchPageRequest(ParkingSearchRequest):
+    limit: Optional[int] = None # Page size; the stream endpoint returns everything when unset
+    cursor: Optional[str] = None # `next_cursor` of the previous page
+    include_total: bool = False # Count all results (first page only)
 
 class ParkingSpotResponse(BaseModel):
     id: int
@@ -15,15 +23,72 @@ class ParkingSpotResponse(BaseModel):
     vehicle_type_allowed: str
     is_available: bool
     price_per_hour: float
+    total_price: Optional[float] = None # Quote for the requested window, when one was given
 
     class Config:
         from_attributes = True 
 
+class ParkingSpotPage(BaseModel):
+    spots: List[ParkingSpotResponse]
+    next_cursor: Optional[str] = None # None on the last page
+    total: Optional[int] = None
+    min_price_per_hour: Optional[float] = None # Over all results, with `total`
+    max_price_per_hour: Optional[float] = None
+
+class NearbySearchRequest(BaseModel):
+    # Centre of the search: explicit coordinates, or the spots of a named location (e.g. "stadium")
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    near_location: Optional[str] = None
+    radius_m: Optional[float] = None # Only spots within this distance; otherwise the k nearest
+    k: int = 5
+    vehicle_type: Optional[str] = None
+    slot_type: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    price_weight_m: Optional[float] = None # Meters of walking one unit of hourly price is worth in the ranking
+
+class NearbyParkingSpotResponse(ParkingSpotResponse):
+    latitude: float
+    longitude: float
+    distance_m: float
+
+class QuoteWindow(BaseModel):
+    start_time: datetime
+    end_time: datetime
+
+class QuoteRequest(BaseModel):
+    windows: List[QuoteWindow]
+    spot_ids: Optional[List[int]] = None # Otherwise all spots matching the filters below
+    vehicle_type: Optional[str] = None
+    location: Optional[str] = None
+    slot_type: Optional[str] = None
+    only_free: bool = True # Leave out spots that are unavailable, and windows in which a spot is booked
+    limit: Optional[int] = None # Cheapest first
+
+class SpotQuote(BaseModel):
+    spot_id: int
+    location: str
+    spot_type: str
+    vehicle_type_allowed: str
+    price_per_hour: float
+    totals: List[Optional[float]] # One per requested window; None if booked then (with only_free)
+    lowest_total: float
+
+class QuoteResponse(BaseModel):
+    quotes: List[SpotQuote]
+
+class VocabularyResponse(BaseModel):
+    # Distinct lower-cased values the search filters can match, e.g. for the agent's fast path
+    location: List[str]
+    slot_type: List[str]
+    vehicle_type: List[str]
+
 class BookingRequest(BaseModel):
     spot_id: int
     vehicle_type: str
-    location: str 
-    slot_type: str 
+    location: Optional[str] = None # Derived from the spot; kept for older clients
+    slot_type: Optional[str] = None
     start_time: datetime
     end_time: datetime
 
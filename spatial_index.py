@@ -0,0 +1,158 @@
+# spatial_index.py
+import heapq
+import math
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import database
+
+SPATIAL_CELL_METERS = float(os.getenv("SPATIAL_CELL_METERS", "250"))
+EARTH_RADIUS_M = 6371008.8
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the spots' coordinates, projected to meters (equirectangular around the
+    mean latitude; well under 1% error across a city). Nearest-neighbour queries visit cells in
+    rings around the query point and stop once no unvisited cell can hold a better result,
+    so the cost depends on local density, not on the total number of spots.
+    """
+
+    def __init__(self, cell_meters: float = SPATIAL_CELL_METERS):
+        self.cell_meters = cell_meters
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.coordinates: Dict[int, Tuple[float, float]] = {}  # spot id -> (lat, lon)
+        self._points: Dict[int, Tuple[float, float]] = {}  # spot id -> (x, y) in meters
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._cos_ref = 1.0
+        self._bounds = (0, 0, 0, 0)  # min/max cell x, min/max cell y
+        self._centroids: Dict[str, Optional[Tuple[float, float]]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db) -> None:
+        """Builds the grid from the coordinates in the parking_spots table (spots without any are skipped)."""
+        rows = db.query(database.ParkingSpot.id, database.ParkingSpot.latitude, database.ParkingSpot.longitude).filter(
+            database.ParkingSpot.latitude.isnot(None), database.ParkingSpot.longitude.isnot(None)
+        ).all()
+        self.build({row.id: (row.latitude, row.longitude) for row in rows})
+
+    def build(self, coordinates: Dict[int, Tuple[float, float]]) -> None:
+        """(Re)builds the grid from spot id -> (lat, lon)."""
+        with self._lock:
+            self.coordinates = dict(coordinates)
+            mean_lat = sum(lat for lat, _ in self.coordinates.values()) / len(self.coordinates) if self.coordinates else 0.0
+            self._cos_ref = math.cos(math.radians(mean_lat))
+            self._points.clear()
+            self._cells.clear()
+            self._centroids.clear()
+            for spot_id, (lat, lon) in self.coordinates.items():
+                point = self._project(lat, lon)
+                self._points[spot_id] = point
+                self._cells.setdefault(self._cell(point), []).append(spot_id)
+            if self._cells:
+                xs = [cx for cx, _ in self._cells]
+                ys = [cy for _, cy in self._cells]
+                self._bounds = (min(xs), max(xs), min(ys), max(ys))
+            self._loaded = True
+        print(f"Spatial index built with {len(self._points)} spots in {len(self._cells)} cells.")
+
+    def ensure_loaded(self, db) -> None:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load(db)
+
+    def _project(self, lat: float, lon: float) -> Tuple[float, float]:
+        return (math.radians(lon) * EARTH_RADIUS_M * self._cos_ref, math.radians(lat) * EARTH_RADIUS_M)
+
+    def _cell(self, point: Tuple[float, float]) -> Tuple[int, int]:
+        return (math.floor(point[0] / self.cell_meters), math.floor(point[1] / self.cell_meters))
+
+    def centroid(self, spot_ids, key: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        """
+        Mean (lat, lon) of the given spots that have coordinates, e.g. to centre a search on a
+        named location. With a `key`, the result is cached until the next load.
+        """
+        with self._lock:
+            if key is not None and key in self._centroids:
+                return self._centroids[key]
+            coords = [self.coordinates[i] for i in spot_ids if i in self.coordinates]
+            center = None
+            if coords:
+                center = (sum(c[0] for c in coords) / len(coords), sum(c[1] for c in coords) / len(coords))
+            if key is not None:
+                self._centroids[key] = center
+            return center
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 5,
+        radius_m: Optional[float] = None,
+        accept: Optional[Callable[[int], bool]] = None,
+        cost: Optional[Callable[[int, float], float]] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Up to `k` (spot id, distance in meters) pairs, best first. Only spots within `radius_m`
+        (if given) and for which `accept(spot_id)` is true are considered. Results are ranked by
+        `cost(spot_id, distance)` (default: the distance); the cost must never be below the
+        distance, which is what lets the ring search stop early.
+        """
+        with self._lock:
+            if not self._cells:
+                return []
+            qx, qy = self._project(latitude, longitude)
+            cx, cy = self._cell((qx, qy))
+            # Distance from the query point to the nearest edge of its own cell
+            edge = min(qx - cx * self.cell_meters, (cx + 1) * self.cell_meters - qx,
+                       qy - cy * self.cell_meters, (cy + 1) * self.cell_meters - qy)
+            min_x, max_x, min_y, max_y = self._bounds
+            max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+            # Rings that don't reach the grid's bounding box are empty (query point outside the grid)
+            first_ring = max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0)
+            best: List[Tuple[float, float, int]] = []  # max-heap of (-cost, distance, id), size <= k
+            for ring in range(first_ring, max_ring + 1):
+                # No spot in this ring or beyond is closer than this
+                ring_floor = 0.0 if ring == 0 else edge + (ring - 1) * self.cell_meters
+                if radius_m is not None and ring_floor > radius_m:
+                    break
+                if len(best) >= k and ring_floor > -best[0][0]:
+                    break
+                for cell in _ring_cells(cx, cy, ring):
+                    for spot_id in self._cells.get(cell, ()):
+                        px, py = self._points[spot_id]
+                        distance = math.hypot(px - qx, py - qy)
+                        if radius_m is not None and distance > radius_m:
+                            continue
+                        if len(best) >= k and distance >= -best[0][0]:
+                            continue
+                        if accept is not None and not accept(spot_id):
+                            continue
+                        rank = cost(spot_id, distance) if cost else distance
+                        if len(best) < k:
+                            heapq.heappush(best, (-rank, distance, spot_id))
+                        elif rank < -best[0][0]:
+                            heapq.heapreplace(best, (-rank, distance, spot_id))
+            return [(spot_id, distance) for _, distance, spot_id in sorted(best, key=lambda b: (-b[0], b[2]))]
+
+
+def _ring_cells(cx: int, cy: int, ring: int):
+    if ring == 0:
+        yield (cx, cy)
+        return
+    for dx in range(-ring, ring + 1):
+        yield (cx + dx, cy - ring)
+        yield (cx + dx, cy + ring)
+    for dy in range(-ring + 1, ring):
+        yield (cx - ring, cy + dy)
+        yield (cx + ring, cy + dy)
+
+
+# Shared by all API workers in this process
+spatial_index = SpatialIndex()
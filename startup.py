@@ -0,0 +1,67 @@
+# startup.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# "background" (warm up on a daemon thread), "blocking" (before serving) or "off" (first use pays)
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")
+
+
+class StartupProfile:
+    """Wall-clock time of each import and lazy initialization step, in the order they ran."""
+
+    def __init__(self):
+        self._steps: List[Tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+        self.created_at = time.perf_counter()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._steps.append((name, seconds, threading.current_thread().name))
+
+    @contextmanager
+    def timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def steps(self) -> List[dict]:
+        with self._lock:
+            return [{"step": name, "ms": round(seconds * 1000, 1), "thread": thread}
+                    for name, seconds, thread in self._steps]
+
+    def report(self) -> str:
+        lines = [f"{'step':40} {'ms':>10}  thread"]
+        lines += [f"{s['step']:40} {s['ms']:10.1f}  {s['thread']}" for s in self.steps()]
+        return "\n".join(lines)
+
+
+startup_profile = StartupProfile()
+
+
+def warm_up(steps: Dict[str, Callable[[], object]], mode: str = WARMUP_MODE) -> Optional[threading.Thread]:
+    """
+    Runs the lazy initializers in `steps` ahead of the first request. A failing step is
+    logged and skipped; the first real use retries it.
+    """
+    if mode == "off":
+        return None
+
+    def run():
+        for name, step in steps.items():
+            try:
+                with startup_profile.timed(f"warm-up: {name}"):
+                    step()
+            except Exception as e:
+                print(f"Warm-up step '{name}' failed: {e}")
+
+    if mode == "blocking":
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
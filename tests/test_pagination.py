@@ -0,0 +1,67 @@
+# tests/test_pagination.py
+import base64
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# A throwaway database, set before the API module creates its engine
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "parking_test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import database
+import main
+from availability_index import availability_index
+
+client = TestClient(main.app)
+
+
+def _window():
+    start = (datetime.now() + timedelta(days=1)).replace(hour=14, minute=0, second=0, microsecond=0)
+    return start.isoformat(), (start + timedelta(hours=2)).isoformat()
+
+
+def test_total_price_pages_cover_unquoted_spots():
+    start, end = _window()
+    search = {"vehicle_type": "car", "location": "downtown", "start_time": start, "end_time": end,
+              "sort_by": "total_price"}
+    assert client.post("/get-parking-spots", json=search).status_code == 200  # loads the quote engine
+
+    # Spots added after the quote engine loaded have no quote, so their total_price is None
+    with database.engine.begin() as connection:
+        connection.execute(database.ParkingSpot.__table__.insert(), [
+            dict(location="downtown", spot_type="open", vehicle_type_allowed="car", is_available=True,
+                 price_per_hour=price) for price in (1.0, 4.0, 9.0)
+        ])
+    db = database.SessionLocal()
+    try:
+        availability_index.load(db)
+    finally:
+        db.close()
+
+    full = client.post("/get-parking-spots", json=search).json()
+    assert [spot["total_price"] is None for spot in full].count(True) == 3
+    assert all(spot["total_price"] is None for spot in full[-3:])  # unquoted spots sort last, by ID
+    assert [spot["id"] for spot in full[-3:]] == sorted(spot["id"] for spot in full[-3:])
+
+    spots, cursor = [], None
+    while True:
+        response = client.post("/get-parking-spots/page", json=dict(search, limit=1, cursor=cursor))
+        assert response.status_code == 200, response.json()
+        page = response.json()
+        spots += page["spots"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert spots == full
+
+
+def test_cursor_rejects_null_outside_total_price():
+    cursor = main.encode_cursor("total_price", {"id": 7, "total_price": None})
+    assert main.decode_cursor(cursor, "total_price") == (float("inf"), 7)
+    forged = base64.urlsafe_b64encode(json.dumps(["price", [None, 7]]).encode()).decode()
+    response = client.post("/get-parking-spots/page", json={"sort_by": "price", "cursor": forged})
+    assert response.status_code == 400
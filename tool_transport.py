@@ -0,0 +1,209 @@
+# tool_transport.py
+import json
+import os
+import threading
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+
+HTTP_POOL_SIZE = int(os.getenv("PARKING_HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("PARKING_HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_READ_TIMEOUT = float(os.getenv("PARKING_HTTP_READ_TIMEOUT", "10"))
+HTTP_CONNECT_RETRIES = int(os.getenv("PARKING_HTTP_CONNECT_RETRIES", "2"))
+EVENT_RECONNECT_SECONDS = float(os.getenv("PARKING_EVENT_RECONNECT_SECONDS", "3"))
+EVENT_READ_TIMEOUT = float(os.getenv("PARKING_EVENT_READ_TIMEOUT", "45"))  # > the API's heartbeat interval
+
+
+class TransportError(Exception):
+    """
+    Raised for any failed call to the parking API.
+    `status_code` is None when the service could not be reached at all.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, detail: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ResponseParseError(TransportError):
+    pass
+
+
+class HttpTransport:
+    """
+    Calls the parking API over HTTP with one pooled keep-alive session shared by all tool calls.
+    Only connection failures are retried: POST /book-parking is not idempotent, so a request that
+    reached the server is never sent twice.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = HTTP_POOL_SIZE,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), connect_retries: int = HTTP_CONNECT_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=connect_retries, connect=connect_retries, read=0, status=0, backoff_factor=0.2)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._events_stop = threading.Event()
+
+    def post(self, path: str, payload: Optional[dict] = None) -> Any:
+        return self._call("POST", path, payload)
+
+    def get(self, path: str) -> Any:
+        return self._call("GET", path)
+
+    def _call(self, method: str, path: str, payload: Optional[dict] = None) -> Any:
+        trace_id = tracing.current_trace_id()
+        headers = {tracing.TRACE_HEADER: trace_id} if trace_id else None
+        try:
+            with tracing.span(f"tool_call {path}"):
+                response = self.session.request(method, f"{self.base_url}{path}", json=payload,
+                                                timeout=self.timeout, headers=headers)
+        except requests.exceptions.RequestException as e:
+            raise TransportError(str(e)) from e
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            raise TransportError(f"{response.status_code} Error for url: {response.url}",
+                                 status_code=response.status_code, detail=detail)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ResponseParseError("Could not parse response from parking service.",
+                                     status_code=response.status_code) from e
+
+    def subscribe_availability(self, callback) -> None:
+        """Follows the API's /availability/events stream on a daemon thread, calling `callback(event)` per event."""
+        threading.Thread(target=self._follow_events, args=(callback, self._events_stop),
+                         name="availability-events", daemon=True).start()
+
+    def _follow_events(self, callback, stop: threading.Event) -> None:
+        last_id = None
+        while not stop.is_set():
+            # A dedicated connection: the stream would otherwise hold one of the pooled tool-call connections
+            headers = {"Accept": "text/event-stream"}
+            if last_id is not None:
+                headers["Last-Event-ID"] = str(last_id)  # the API replays what was missed, or sends resync
+            try:
+                with requests.get(f"{self.base_url}/availability/events", headers=headers, stream=True,
+                                  timeout=(self.timeout[0], EVENT_READ_TIMEOUT)) as response:
+                    response.raise_for_status()
+                    data = []
+                    for line in response.iter_lines(decode_unicode=True):
+                        if stop.is_set():
+                            return
+                        if line.startswith("data:"):
+                            data.append(line[5:].lstrip())
+                        elif not line and data:
+                            event = json.loads("\n".join(data))
+                            data = []
+                            last_id = event["seq"]
+                            callback(event)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Availability event stream interrupted: {e}")
+            stop.wait(EVENT_RECONNECT_SECONDS)
+
+    def close(self):
+        self._events_stop.set()
+        self.session.close()
+
+
+class InProcessTransport:
+    """
+    Calls the API's handler functions directly, for when the agent and the API share a process.
+    Skips HTTP, the socket round trip and JSON parsing; request validation still goes through the schemas.
+    """
+
+    def __init__(self):
+        # Imported lazily so the HTTP-only agent does not pull in the database layer
+        import database, main, schemas
+        self._session_factory = database.SessionLocal
+        self._routes = {
+            "/get-parking-spots": (main.get_parking_spots, schemas.ParkingSearchRequest),
+            "/get-parking-spots/page": (main.get_parking_spots_page, schemas.ParkingSearchPageRequest),
+            "/get-parking-spots/nearby": (main.get_nearby_parking_spots, schemas.NearbySearchRequest),
+            "/quote": (main.quote_parking, schemas.QuoteRequest),
+            "/book-parking": (main.book_parking, schemas.BookingRequest),
+            "/admin/reset-availability": (main.reset_availability, None),
+            "/vocabulary": (main.get_vocabulary, None),
+        }
+        self._listeners = []
+
+    def post(self, path: str, payload: Optional[dict] = None) -> Any:
+        from fastapi import HTTPException
+        from fastapi.encoders import jsonable_encoder
+        from pydantic import ValidationError
+
+        if path not in self._routes:
+            raise TransportError(f"404 Error for path: {path}", status_code=404, detail="Not Found")
+        handler, request_model = self._routes[path]
+        db = self._session_factory()
+        # Same process and thread, so the handler's spans land in the caller's trace directly
+        try:
+            with tracing.span(f"tool_call {path}"):
+                if request_model is None:
+                    result = handler(db=db)
+                else:
+                    result = handler(request_model(**(payload or {})), db=db)
+                return jsonable_encoder(result)
+        except ValidationError as e:
+            raise TransportError(f"422 Error for path: {path}", status_code=422, detail=e.errors()) from e
+        except HTTPException as e:
+            raise TransportError(f"{e.status_code} Error for path: {path}",
+                                 status_code=e.status_code, detail=e.detail) from e
+        finally:
+            db.close()
+
+    def get(self, path: str) -> Any:
+        return self.post(path)
+
+    def subscribe_availability(self, callback) -> None:
+        """Calls `callback(event)` synchronously from the handler that publishes each event."""
+        from availability_events import availability_events
+        availability_events.add_listener(callback)
+        self._listeners.append(callback)
+
+    def close(self):
+        from availability_events import availability_events
+        for callback in self._listeners:
+            availability_events.remove_listener(callback)
+        self._listeners.clear()
+
+
+def create_transport(mode: str, base_url: str):
+    if mode == "http":
+        return HttpTransport(base_url)
+    if mode == "inprocess":
+        return InProcessTransport()
+    raise ValueError(f"Unknown tool transport '{mode}'. Use 'http' or 'inprocess'.")
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport(mode: str, base_url: str):
+    """Returns the process-wide transport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = create_transport(mode, base_url)
+    return _transport
+
+
+def set_transport(transport) -> None:
+    """Replaces the process-wide transport (e.g. with an in-process one in benchmarks)."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None and _transport is not transport:
+            _transport.close()
+        _transport = transport
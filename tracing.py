@@ -0,0 +1,144 @@
+# tracing.py
+"""
+Per-stage timing for the request path. `span(stage)` times a block into a Prometheus-style
+histogram (rendered by `render_metrics()`, served at the API's /metrics) and, inside a
+`trace(...)`, appends it to that trace's span list so one turn can be broken down by stage.
+
+Trace IDs travel in a context variable; the HTTP tool transport sends the current one as
+the X-Trace-Id header and the API adopts it, so API-side spans log under the same ID.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+TRACE_HEADER = "X-Trace-Id"
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() == "true"  # print every span with its trace ID
+TRACE_HISTORY_SIZE = int(os.getenv("TRACE_HISTORY_SIZE", "200"))
+# Seconds; from sub-millisecond cache and SQLite work up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus text exposition format."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for labels, (counts, total, count) in series:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+                sep = "," if label_text else ""
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label_text}{sep}le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label_text}{sep}le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+                lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+    def summary(self) -> Dict[str, dict]:
+        """Count and mean per label set (for the UI; Prometheus computes quantiles from the buckets)."""
+        with self._lock:
+            return {"/".join(labels): {"count": count, "mean_ms": round(total / count * 1000, 3)}
+                    for labels, (_, total, count) in sorted(self._series.items())}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram("parking_stage_duration_seconds",
+                          "Time spent per stage of the request path.", ("stage",))
+http_seconds = Histogram("parking_http_request_duration_seconds",
+                         "API request latency by route and status code.", ("method", "route", "status"))
+
+
+class TraceLog:
+    """Spans of the most recent traces, oldest evicted first."""
+
+    def __init__(self, max_traces: int = TRACE_HISTORY_SIZE):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace_id: str, stage: str, seconds: float) -> None:
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            if spans is None:
+                spans = self._traces[trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append({"stage": stage, "ms": round(seconds * 1000, 3)})
+
+    def get(self, trace_id: str) -> List[dict]:
+        with self._lock:
+            return list(self._traces.get(trace_id, ()))
+
+
+trace_log = TraceLog()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id() -> Optional[str]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None):
+    """Makes `trace_id` (a new one if None) current for the block; yields the ID."""
+    trace_id = trace_id or new_trace_id()
+    token = _current_trace.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _current_trace.reset(token)
+
+
+def record(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage)
+    trace_id = _current_trace.get()
+    if trace_id is not None:
+        trace_log.add(trace_id, stage, seconds)
+        if TRACE_LOG:
+            print(f"[trace {trace_id}] {stage}: {seconds * 1000:.1f} ms")
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def render_metrics() -> str:
+    return "\n".join(stage_seconds.render() + http_seconds.render()) + "\n"